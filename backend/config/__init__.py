@@ -0,0 +1,4 @@
+# โหลด Celery app ตอน start Django -> @shared_task ผูกกับ app นี้
+from .celery import app as celery_app
+
+__all__ = ("celery_app",)
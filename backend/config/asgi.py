@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# import หลัง setup Django (โหลด model)
+from finance import services_realtime  # noqa: E402
+
+
+async def application(scope, receive, send):
+    # SSE (connection ค้างยาว) ไม่ผ่าน Django: ไม่กิน thread ของ sync view
+    if scope["type"] == "http" and scope["path"] == services_realtime.PATH:
+        return await services_realtime.events_app(scope, receive, send)
+    return await django_application(scope, receive, send)
@@ -0,0 +1,15 @@
+"""
+Celery app ของโปรเจกต์
+- worker: `celery -A config worker`
+- งานตั้งเวลา: `celery -A config beat` (ตารางอยู่ใน settings.CELERY_BEAT_SCHEDULE รันแค่ 1 process)
+ค่าอื่นอ่านจาก settings ที่ขึ้นต้นด้วย CELERY_ (เช่น CELERY_BROKER_URL)
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+app = Celery("config")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
@@ -0,0 +1,156 @@
+import functools
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+from . import sharding
+
+# อ่านจาก replica เฉพาะโค้ดที่อยู่ใน use_replica() เท่านั้น (ค่าเริ่มต้น = primary)
+_use_replica = ContextVar("db_use_replica", default=False)
+# เขียนไปแล้วใน request/task นี้ (หรือเพิ่งเขียนไม่นาน) -> อ่านจาก primary ต่อจนจบ
+_pinned = ContextVar("db_pinned_to_primary", default=False)
+_wrote = ContextVar("db_wrote", default=False)
+
+
+def replica_alias(alias=DEFAULT_DB_ALIAS):
+    """
+    alias ของ replica ของ primary นี้ (DATABASE_REPLICAS) ไม่มี -> None = ใช้ primary
+    """
+    replica = getattr(settings, "DATABASE_REPLICAS", {}).get(alias)
+    return replica if replica in settings.DATABASES else None
+
+
+@contextmanager
+def use_replica():
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def read_from_replica(func):
+    """
+    decorator: query อ่านใน func ไปที่ replica (ยกเว้นถูก pin ไว้ที่ primary)
+    """
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with use_replica():
+            return func(*args, **kwargs)
+
+    return wrapper
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+def has_written():
+    return _wrote.get()
+
+
+@contextmanager
+def pinning(pinned=False):
+    """
+    ขอบเขตของ 1 request / task: reset สถานะ pin ตอนเริ่ม และคืนค่าเดิมตอนจบ
+    (thread ของ WSGI ถูกใช้ซ้ำหลาย request)
+    """
+    token = _pinned.set(pinned)
+    wrote_token = _wrote.set(False)
+    try:
+        yield
+    finally:
+        _wrote.reset(wrote_token)
+        _pinned.reset(token)
+
+
+class ReplicaRouter:
+    """
+    - เขียน -> primary เสมอ และ pin request นี้ไว้ที่ primary (อ่านหลังเขียนต้องเห็นข้อมูลใหม่)
+    - อ่าน -> replica เฉพาะใน use_replica() และยังไม่ถูก pin
+    - migrate เฉพาะ primary (replica ได้ schema ผ่าน replication)
+    """
+
+    def primary_for(self, model, hints):
+        return DEFAULT_DB_ALIAS
+
+    def db_for_read(self, model, **hints):
+        alias = self.primary_for(model, hints)
+        if _use_replica.get() and not _pinned.get():
+            return replica_alias(alias) or alias
+        return alias
+
+    def db_for_write(self, model, **hints):
+        # ต้องคืน primary เอง ไม่งั้น Django ใช้ instance._state.db (object ที่อ่านมาจาก replica)
+        _pinned.set(True)
+        _wrote.set(True)
+        return self.primary_for(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # primary กับ replica คือข้อมูลชุดเดียวกัน
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in getattr(settings, "DATABASE_REPLICAS", {}).values()
+
+
+class ShardRouter(ReplicaRouter):
+    """
+    แยกข้อมูลตาม owner (config.sharding)
+    - model ใน SHARDED_MODELS -> shard ของ owner
+      (จาก instance ใน hints ถ้ามี ไม่งั้นใช้ shard ของ request/task ปัจจุบัน)
+    - ที่เหลือ (user, currency, fx, token ...) อ่าน/เขียนที่ default
+    ทุก shard migrate ครบทุกตาราง (FK ไป user/currency ต้องมีตารางอยู่)
+    """
+
+    def primary_for(self, model, hints):
+        if model._meta.label_lower not in sharding.SHARDED_MODELS:
+            return DEFAULT_DB_ALIAS
+
+        instance = hints.get("instance")
+        if instance is not None:
+            owner_id = self._owner_id(instance)
+            if owner_id is not None:
+                return sharding.shard_for_owner(owner_id)
+            if instance._state.db:
+                # เช่น TransferLink -> Transaction ที่อ่านมาแล้ว
+                return self._primary_of(instance._state.db)
+        return sharding.current_shard()
+
+    @staticmethod
+    def _owner_id(instance):
+        if instance._meta.label_lower == "auth.user":
+            return instance.pk
+        return getattr(instance, "owner_id", None)
+
+    @staticmethod
+    def _primary_of(alias):
+        for primary, replica in getattr(settings, "DATABASE_REPLICAS", {}).items():
+            if replica == alias:
+                return primary
+        return alias
+
+
+class ReplicaReadMixin:
+    """
+    mixin ของ APIView / ViewSet: GET ไปอ่านที่ replica
+    replica_actions = None -> ทุก GET, ViewSet ระบุ action เช่น ("list",)
+    """
+
+    replica_actions = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method in ("GET", "HEAD") and self._reads_from_replica(request):
+            with use_replica():
+                return super().dispatch(request, *args, **kwargs)
+        return super().dispatch(request, *args, **kwargs)
+
+    def _reads_from_replica(self, request):
+        if self.replica_actions is None:
+            return True
+        # ViewSet: action_map ถูกตั้งก่อน dispatch (self.action ยังไม่ถูกตั้ง)
+        action = getattr(self, "action_map", {}).get(request.method.lower())
+        return action in self.replica_actions
@@ -0,0 +1,173 @@
+import hmac
+import os
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils import timezone
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Histogram, generate_latest, multiprocess
+from prometheus_client.core import GaugeMetricFamily
+
+# หลาย worker (gunicorn/uvicorn/celery) -> ต้องตั้ง PROMETHEUS_MULTIPROC_DIR ก่อน process เริ่ม
+# (prometheus_client อ่านค่าตอน import) ดู gunicorn.conf.py
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+# ---------- HTTP ----------
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Request latency per route",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries",
+    "SQL queries per request",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_duration_seconds",
+    "Time spent in the database per request",
+    ["route"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+# ---------- in-process caches (finance.cache_utils.TTLCache) ----------
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "In-process cache lookups (hit ratio = hit / (hit + miss))",
+    ["cache", "result"],
+)
+
+# ---------- Celery ----------
+
+TASK_DURATION = Histogram(
+    "celery_task_duration_seconds",
+    "Celery task run time",
+    ["task", "state"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900),
+)
+TASK_FAILURES = Counter("celery_task_failures_total", "Celery task failures", ["task", "exception"])
+
+# ---------- AI provider ----------
+
+AI_LATENCY = Histogram(
+    "ai_request_duration_seconds",
+    "AI provider call latency",
+    ["provider", "model", "outcome"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+AI_TOKENS = Counter("ai_tokens_total", "AI tokens used", ["provider", "model", "kind"])
+
+
+def observe_ai_usage(provider, model, usage):
+    if usage is None:
+        return
+    AI_TOKENS.labels(provider, model, "prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    AI_TOKENS.labels(provider, model, "completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+# ---------- Celery signals ----------
+
+_task_started = {}
+
+
+def _task_prerun(task_id=None, **kwargs):
+    _task_started[task_id] = time.perf_counter()
+
+
+def _task_postrun(task_id=None, task=None, state=None, **kwargs):
+    started = _task_started.pop(task_id, None)
+    if started is not None and task is not None:
+        TASK_DURATION.labels(task.name, state or "UNKNOWN").observe(time.perf_counter() - started)
+
+
+def _task_failure(sender=None, exception=None, **kwargs):
+    TASK_FAILURES.labels(getattr(sender, "name", "unknown"), type(exception).__name__).inc()
+
+
+def connect_celery_signals():
+    from celery import signals
+
+    signals.task_prerun.connect(_task_prerun, weak=False, dispatch_uid="metrics.task_prerun")
+    signals.task_postrun.connect(_task_postrun, weak=False, dispatch_uid="metrics.task_postrun")
+    signals.task_failure.connect(_task_failure, weak=False, dispatch_uid="metrics.task_failure")
+
+
+# ---------- ค่าที่คำนวณตอน scrape ----------
+
+class BacklogCollector:
+    """
+    recurring ที่ถึงเวลาแล้วแต่ยังไม่ถูกรัน (query ตอน scrape ไม่เก็บใน worker)
+    ผล query ใช้ซ้ำ METRICS_BACKLOG_CACHE_SECONDS ต่อ process ส่วน lag คำนวณใหม่ทุก scrape
+    """
+
+    _cache = None
+
+    @classmethod
+    def _due(cls):
+        if cls._cache is None:
+            from finance.cache_utils import TTLCache
+
+            cls._cache = TTLCache(maxsize=1, ttl=settings.METRICS_BACKLOG_CACHE_SECONDS, name="metrics_backlog")
+        return cls._cache.get_or_load("due", cls._query)
+
+    @staticmethod
+    def _query():
+        from django.db.models import Count, Min
+
+        from finance.models import RecurringTransaction
+
+        from .sharding import fan_out
+
+        now = timezone.now()
+        rows = fan_out(
+            lambda: RecurringTransaction.objects.filter(is_active=True, next_run_at__lte=now).aggregate(
+                oldest=Min("next_run_at"), n=Count("id")
+            )
+        ).values()
+        oldest = min((r["oldest"] for r in rows if r["oldest"]), default=None)
+        return oldest, sum(r["n"] for r in rows)
+
+    def collect(self):
+        oldest, due = self._due()
+        lag = (timezone.now() - oldest).total_seconds() if oldest else 0.0
+
+        yield GaugeMetricFamily(
+            "recurring_backlog_lag_seconds", "Age of the oldest due recurring (now - next_run_at)", value=lag
+        )
+        yield GaugeMetricFamily("recurring_backlog_due", "Recurrings due but not yet run", value=due)
+
+
+def _registry():
+    registry = CollectorRegistry()
+    if MULTIPROCESS:
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        from prometheus_client import REGISTRY
+
+        registry = REGISTRY
+    return registry
+
+
+def metrics_view(request):
+    """
+    GET /metrics (Prometheus text format)
+    ต้องส่ง Authorization: Bearer <METRICS_TOKEN> (ไม่ตั้ง token -> เปิดเฉพาะตอน DEBUG)
+    """
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+        return HttpResponseForbidden()
+
+    output = generate_latest(_registry())
+
+    backlog = CollectorRegistry(auto_describe=False)
+    backlog.register(BacklogCollector())
+    output += generate_latest(backlog)
+
+    return HttpResponse(output, content_type=CONTENT_TYPE_LATEST)
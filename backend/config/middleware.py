@@ -0,0 +1,205 @@
+import json
+import logging
+import random
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from . import db_routers, sharding
+
+logger = logging.getLogger("request.timing")
+
+
+class _QueryStats:
+    """
+    execute_wrapper: นับจำนวน query, เวลารวม และ query ที่ช้าที่สุด
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.slowest = 0.0
+        self.slowest_sql = ""
+        self.recording = False
+        # query จาก sharding.gather มาจากหลาย thread พร้อมกัน
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.count += 1
+                self.total += elapsed
+                if elapsed > self.slowest:
+                    self.slowest = elapsed
+                    self.slowest_sql = sql
+
+
+def _query_stats(request):
+    """
+    _QueryStats ของ request ที่ถูกสุ่ม (QUERY_TIMING_SAMPLE_RATE) / None
+    สุ่มครั้งเดียวต่อ request ใช้ร่วมกันทุก middleware
+    """
+    if not hasattr(request, "_query_stats"):
+        rate = getattr(settings, "QUERY_TIMING_SAMPLE_RATE", 1.0)
+        request._query_stats = _QueryStats() if rate > 0 and random.random() < rate else None
+    return request._query_stats
+
+
+@contextmanager
+def _recording(stats):
+    """
+    ติด stats กับทุก connection (รวม thread ของ sharding.gather) ระหว่าง block
+    middleware ชั้นนอกติดไว้แล้ว -> ไม่ติดซ้ำ (กันนับ query สองครั้ง)
+    """
+    if stats is None or stats.recording:
+        yield
+        return
+    stats.recording = True
+    token = sharding.query_wrappers.set(sharding.query_wrappers.get() + (stats,))
+    try:
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(stats))
+            yield
+    finally:
+        sharding.query_wrappers.reset(token)
+        stats.recording = False
+
+
+class QueryTimingMiddleware:
+    """
+    วัดจำนวน query / เวลา DB ต่อ request (สุ่มตาม QUERY_TIMING_SAMPLE_RATE)
+    - ใส่ header Server-Timing (ดูได้ใน devtools)
+    - log 1 บรรทัด (JSON) ต่อ request ที่ถูกสุ่ม
+    - เกิน QUERY_BUDGETS ของ route -> log warning
+    request ที่ไม่ถูกสุ่ม ไม่มี overhead เลย
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.budgets = getattr(settings, "QUERY_BUDGETS", {})
+        self.slow_db_ms = getattr(settings, "QUERY_TIMING_SLOW_DB_MS", 200)
+
+    def __call__(self, request):
+        stats = _query_stats(request)
+        if stats is None:
+            return self.get_response(request)
+
+        start = time.perf_counter()
+        with _recording(stats):
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+        db_ms = stats.total * 1000
+
+        response["Server-Timing"] = (
+            f'db;dur={db_ms:.1f};desc="{stats.count} queries", '
+            f"app;dur={total_ms - db_ms:.1f}, total;dur={total_ms:.1f}"
+        )
+
+        match = getattr(request, "resolver_match", None)
+        route = match.view_name if match else request.path
+        record = {
+            "route": route,
+            "method": request.method,
+            "status": response.status_code,
+            "queries": stats.count,
+            "db_ms": round(db_ms, 1),
+            "total_ms": round(total_ms, 1),
+            "slowest_ms": round(stats.slowest * 1000, 1),
+        }
+
+        budget = self.budgets.get(route)
+        over = (budget is not None and stats.count > budget) or db_ms > self.slow_db_ms
+        if over:
+            record["budget"] = budget
+            record["slowest_sql"] = stats.slowest_sql[:500]
+            logger.warning(json.dumps(record))
+        else:
+            logger.info(json.dumps(record))
+
+        return response
+
+
+class PrometheusMiddleware:
+    """
+    เก็บ metric ต่อ route (label = view_name ไม่ใช่ path) ดูผลที่ /metrics (config.metrics)
+    - latency: ทุก request (จับเวลาครั้งเดียว ไม่แตะ DB)
+    - จำนวน query / เวลา DB: เฉพาะ request ที่ถูกสุ่มตาม QUERY_TIMING_SAMPLE_RATE (ชุดเดียวกับ QueryTimingMiddleware)
+      ต้องครอบทุก query ด้วย execute_wrapper -> ไม่ทำทุก request histogram เป็นตัวอย่างของ traffic
+    """
+
+    def __init__(self, get_response):
+        from . import metrics
+
+        self.metrics = metrics
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = _query_stats(request)
+        start = time.perf_counter()
+        with _recording(stats):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - start
+
+        match = getattr(request, "resolver_match", None)
+        route = match.view_name if match else "unmatched"
+        if route != "metrics":
+            m = self.metrics
+            m.REQUEST_LATENCY.labels(request.method, route, f"{response.status_code // 100}xx").observe(elapsed)
+            if stats is not None:
+                m.REQUEST_QUERIES.labels(route).observe(stats.count)
+                m.REQUEST_DB_TIME.labels(route).observe(stats.total)
+
+        return response
+
+
+class ShardMiddleware:
+    """
+    scope ของ shard ต่อ request (config.sharding)
+    authentication ตั้ง shard ตาม user แล้ว reset ตอนจบ request (thread ถูกใช้ซ้ำ)
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with sharding.use_shard(None):
+            return self.get_response(request)
+
+
+class ReplicaPinningMiddleware:
+    """
+    read-your-writes กับ read replica (config.db_routers)
+    - request ที่เขียน DB -> ตั้ง cookie ไว้ DATABASE_REPLICA_PIN_SECONDS
+    - request ถัดไปที่มี cookie นี้ (หรือ method ที่ไม่ใช่ GET/HEAD) อ่านจาก primary ทั้งหมด
+    ช่วงเวลานี้ควรยาวกว่า replication lag ปกติ
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cookie_name = getattr(settings, "DATABASE_REPLICA_PIN_COOKIE", "db_pin")
+        self.pin_seconds = getattr(settings, "DATABASE_REPLICA_PIN_SECONDS", 5)
+
+    def __call__(self, request):
+        pinned = request.method not in ("GET", "HEAD", "OPTIONS") or self.cookie_name in request.COOKIES
+        with db_routers.pinning(pinned):
+            response = self.get_response(request)
+            wrote = db_routers.has_written()
+
+        if wrote and self.pin_seconds > 0:
+            response.set_cookie(
+                self.cookie_name,
+                "1",
+                max_age=self.pin_seconds,
+                secure=getattr(settings, "COOKIE_SECURE", False),
+                httponly=True,
+                samesite=getattr(settings, "COOKIE_SAMESITE", "Lax"),
+            )
+        return response
@@ -0,0 +1,189 @@
+import cProfile
+import logging
+import marshal
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.base import ContentFile
+
+logger = logging.getLogger("request.profile")
+
+PROFILE_SALT = "config.request-profile"
+PROFILE_HEADER = "HTTP_X_PROFILE"  # X-Profile: <token>
+PROFILE_QUERY_PARAM = "__profile"
+MODES = ("cprofile", "sample")
+
+# cProfile ใช้ profiler ได้ทีละตัวต่อ process (3.12+ ใช้ sys.monitoring -> ValueError ถ้าซ้อนกัน)
+_cprofile_lock = threading.Lock()
+
+
+def make_profile_token(user, path, mode="cprofile") -> str:
+    """
+    token สำหรับ staff แนบกับ request (header X-Profile หรือ ?__profile=)
+    ผูกกับ path เดียวและใช้ได้ครั้งเดียว (id ถูกเก็บใน RequestProfile.token_id)
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}")
+    payload = {"u": user.pk, "m": mode, "p": path, "n": secrets.token_hex(16)}
+    return signing.TimestampSigner(salt=PROFILE_SALT).sign_object(payload)
+
+
+def read_profile_token(token: str, path: str):
+    """
+    คืน (staff user, mode, token id) หรือ None ถ้า token ใช้ไม่ได้ / หมดอายุ / ไม่ใช่ staff
+    / ไม่ใช่ path ที่ออก token ไว้ / ถูกใช้ไปแล้ว
+    """
+    from django.contrib.auth import get_user_model
+
+    from finance.models import RequestProfile
+
+    try:
+        data = signing.TimestampSigner(salt=PROFILE_SALT).unsign_object(
+            token, max_age=settings.REQUEST_PROFILE_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return None
+
+    nonce = data.get("n")
+    if data.get("m") not in MODES or data.get("p") != path or not nonce:
+        return None
+    if RequestProfile.objects.filter(token_id=nonce).exists():
+        return None
+    user = get_user_model().objects.filter(pk=data.get("u"), is_staff=True, is_active=True).first()
+    if user is None:
+        return None
+    return user, data["m"], nonce
+
+
+class SamplingProfiler:
+    """
+    sampling profiler แบบง่าย: thread แยกอ่าน stack ของ thread ที่รัน request ทุก interval
+    ผลเป็น folded stacks ("a;b;c 12") เปิดได้ใน speedscope / flamegraph.pl
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.samples = Counter()
+        self._target = threading.get_ident()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self) -> bytes:
+        return "\n".join(f"{stack} {n}" for stack, n in self.samples.most_common()).encode()
+
+
+class ProfilingMiddleware:
+    """
+    profile request ตามคำสั่งของ staff (token ที่เซ็นไว้ใน header X-Profile หรือ ?__profile=)
+    - cprofile -> .prof (เปิดด้วย snakeviz / pstats)
+    - sample -> .folded (flamegraph)
+    เก็บไฟล์ + route + user id ใน RequestProfile ดู/ดาวน์โหลดได้ใน admin
+    cprofile ทำได้ทีละ request ต่อ process; ถ้ามีตัวอื่นรันอยู่ request นั้นทำงานปกติไม่ profile
+    request ปกติ (ไม่มี token) เช็คแค่ header/query string ไม่มี overhead อื่น
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = request.META.get(PROFILE_HEADER)
+        if token is None and PROFILE_QUERY_PARAM in request.META.get("QUERY_STRING", ""):
+            token = request.GET.get(PROFILE_QUERY_PARAM)
+        if not token:
+            return self.get_response(request)
+
+        found = read_profile_token(token, request.path)
+        if found is None:
+            # token ใช้ไม่ได้ -> ทำงานปกติ ไม่ profile
+            return self.get_response(request)
+        if found[1] == "sample":
+            return self._profile(request, *found)
+
+        if not _cprofile_lock.acquire(blocking=False):
+            logger.warning("cprofile already running in this process, serving %s unprofiled", request.path)
+            return self.get_response(request)
+        try:
+            return self._profile(request, *found)
+        finally:
+            _cprofile_lock.release()
+
+    def _profile(self, request, staff, mode, token_id):
+        start = time.perf_counter()
+        if mode == "sample":
+            with SamplingProfiler(settings.REQUEST_PROFILE_SAMPLE_INTERVAL_MS / 1000) as sampler:
+                response = self.get_response(request)
+            data, ext = sampler.dump(), "folded"
+        else:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # มี profiler อื่นนอก middleware นี้จับ sys.monitoring อยู่ (เช่น coverage / debugger)
+                logger.warning("another profiler is active, serving %s unprofiled", request.path)
+                return self.get_response(request)
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+            profiler.create_stats()
+            data, ext = marshal.dumps(profiler.stats), "prof"
+        duration_ms = (time.perf_counter() - start) * 1000
+
+        try:
+            profile = self._save(request, response, staff, mode, token_id, duration_ms, data, ext)
+            response["X-Profile-Id"] = str(profile.pk)
+        except Exception:
+            # บันทึกไม่ได้ไม่ควรทำให้ request พัง
+            logger.exception("failed to store request profile")
+        return response
+
+    def _save(self, request, response, staff, mode, token_id, duration_ms, data, ext):
+        from finance.models import RequestProfile
+
+        match = getattr(request, "resolver_match", None)
+        route = match.view_name if match else ""
+        # DRF ตั้ง user (จาก JWT) กลับมาที่ HttpRequest หลัง authenticate
+        user = getattr(request, "user", None)
+        user_id = user.pk if user is not None and user.is_authenticated else None
+
+        profile = RequestProfile(
+            user_id=user_id,
+            requested_by=staff,
+            token_id=token_id,
+            mode=mode,
+            method=request.method,
+            path=request.get_full_path()[:500],
+            route=route[:200],
+            status_code=response.status_code,
+            duration_ms=round(duration_ms, 2),
+        )
+        name = f"{(route or 'unmatched').replace(':', '-')}-{user_id or 'anon'}-{int(time.time())}.{ext}"
+        profile.file.save(name, ContentFile(data), save=False)
+        profile.save()
+
+        logger.info("profiled %s %s (%s) in %.1fms -> %s", request.method, route or request.path, mode, duration_ms, profile.file.name)
+        return profile
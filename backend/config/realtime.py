@@ -0,0 +1,140 @@
+"""
+broker ของ event real-time ต่อ user (ใช้กับ GET /api/events/ ดู finance/services_realtime.py)
+- publish(user_id, message): เรียกจากโค้ด sync (หลัง commit) ไม่ทำให้การเขียนข้อมูลพังถ้า broker มีปัญหา
+- subscribe(user_id): async context manager คืน asyncio.Queue ของ message ของ user นั้น
+- REALTIME_BROKER_URL ว่าง -> MemoryBroker ใน process (dev / server process เดียว)
+  event ที่เกิดใน process อื่น (celery worker, server worker ตัวอื่น) ไม่มาถึง
+- redis://... -> RedisBroker (pub/sub, ต้องติดตั้ง redis) ใช้กับหลาย process / หลายเครื่อง
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+from contextlib import asynccontextmanager
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS
+from django.db import transaction as db_transaction
+
+logger = logging.getLogger(__name__)
+
+# message ค้างต่อ connection: เต็มแล้วทิ้ง (ฝั่งรับรวม event อยู่แล้ว ขอแค่มีสักอัน)
+QUEUE_SIZE = 100
+
+
+def _put(queue, message):
+    try:
+        queue.put_nowait(message)
+    except asyncio.QueueFull:
+        pass
+
+
+class MemoryBroker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # user_id -> {(event loop, queue)}
+        self._subscribers = defaultdict(set)
+
+    def publish(self, user_id, message):
+        with self._lock:
+            targets = list(self._subscribers.get(user_id, ()))
+        for loop, queue in targets:
+            try:
+                loop.call_soon_threadsafe(_put, queue, message)
+            except RuntimeError:
+                # loop ปิดไปแล้ว (connection กำลังจบ)
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, user_id):
+        entry = (asyncio.get_running_loop(), asyncio.Queue(maxsize=QUEUE_SIZE))
+        with self._lock:
+            self._subscribers[user_id].add(entry)
+        try:
+            yield entry[1]
+        finally:
+            with self._lock:
+                subscribers = self._subscribers[user_id]
+                subscribers.discard(entry)
+                if not subscribers:
+                    del self._subscribers[user_id]
+
+
+class RedisBroker:
+    """
+    channel ละ user: "<prefix>:<user_id>" (1 connection ของ client = 1 subscription)
+    """
+
+    def __init__(self, url, prefix="realtime"):
+        try:
+            import redis
+        except ImportError as e:
+            raise ImproperlyConfigured("REALTIME_BROKER_URL=redis://... requires the `redis` package") from e
+        self._url = url
+        self._prefix = prefix
+        timeout = settings.REALTIME_BROKER_TIMEOUT_SECONDS
+        # publish อยู่บนทางของ request (หลัง commit): redis ค้างต้องไม่ทำให้ request ค้างตาม
+        self._client = redis.Redis.from_url(url, socket_timeout=timeout, socket_connect_timeout=timeout)
+
+    def _channel(self, user_id):
+        return f"{self._prefix}:{user_id}"
+
+    def publish(self, user_id, message):
+        self._client.publish(self._channel(user_id), json.dumps(message))
+
+    @asynccontextmanager
+    async def subscribe(self, user_id):
+        import redis.asyncio as aioredis
+
+        # subscriber รอ message นานได้ (ไม่ตั้ง socket_timeout) แต่ต่อไม่ได้ต้องจบเร็ว
+        client = aioredis.from_url(self._url, socket_connect_timeout=settings.REALTIME_BROKER_TIMEOUT_SECONDS)
+        pubsub = client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self._channel(user_id))
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+        async def pump():
+            async for item in pubsub.listen():
+                if item["type"] == "message":
+                    _put(queue, json.loads(item["data"]))
+
+        task = asyncio.ensure_future(pump())
+        try:
+            yield queue
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await pubsub.aclose()
+            await client.aclose()
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                url = settings.REALTIME_BROKER_URL
+                _broker = RedisBroker(url) if url else MemoryBroker()
+    return _broker
+
+
+def publish(user_id, message):
+    try:
+        get_broker().publish(user_id, message)
+    except Exception:
+        # push เป็นของเสริม: client ยัง poll / sync เองได้
+        logger.warning("failed to publish realtime event for user %s", user_id, exc_info=True)
+
+
+def publish_on_commit(user_ids, message, using=DEFAULT_DB_ALIAS):
+    """
+    publish หลัง transaction ของ alias นี้ commit (rollback -> ไม่ส่ง)
+    """
+    user_ids = sorted(set(user_ids))
+    if user_ids:
+        db_transaction.on_commit(lambda: [publish(user_id, message) for user_id in user_ids], using=using)
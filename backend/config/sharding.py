@@ -0,0 +1,280 @@
+import bisect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar, copy_context
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, close_old_connections, connections
+
+# ข้อมูลของ user (ทุกตารางที่มี owner) -> อยู่ใน shard ของ owner
+SHARDED_MODELS = {
+    "finance.wallet",
+    "finance.category",
+    "finance.merchant",
+    "finance.merchantalias",
+    "finance.transaction",
+    "finance.transferlink",
+    "finance.budget",
+    "finance.categoryrule",
+    "finance.receipt",
+    "finance.recurringtransaction",
+    "finance.aiinsight",
+    "finance.idempotencykey",
+    "finance.synccounter",
+    "finance.synctombstone",
+}
+# reference data: เขียนที่ default แล้ว copy ไปทุก shard (ใช้ join / FK ใน shard ได้)
+REPLICATED_MODELS = ("finance.currency", "finance.fxrate", "finance.referenceversion")
+# user + profile: เขียนที่ default แล้ว copy ไป shard ของ user นั้น (FK owner)
+OWNER_COPY_MODELS = ("auth.user", "users.userprofile")
+# ที่เหลือ (token, session, admin, RequestProfile ...) อยู่ที่ default อย่างเดียว
+
+_current = ContextVar("db_shard", default=None)
+
+
+def shard_aliases():
+    """
+    alias ของทุก shard (ไม่รวม replica) ตามลำดับใน DATABASE_SHARD_MAP
+    """
+    aliases = []
+    for _, alias in _shard_map():
+        if alias not in aliases:
+            aliases.append(alias)
+    return aliases
+
+
+def _shard_map():
+    return sorted(getattr(settings, "DATABASE_SHARD_MAP", None) or [(0, DEFAULT_DB_ALIAS)])
+
+
+def owner_ranges(alias):
+    """
+    ช่วง owner_id [start, end) ที่อยู่ใน shard นี้ (end=None = ไม่มีขอบบน)
+    """
+    shard_map = _shard_map()
+    ranges = []
+    for i, (start, shard) in enumerate(shard_map):
+        if shard == alias:
+            end = shard_map[i + 1][0] if i + 1 < len(shard_map) else None
+            ranges.append((start, end))
+    return ranges
+
+
+def shard_for_owner(owner_id):
+    """
+    DATABASE_SHARD_MAP = [(owner_id เริ่มต้น, alias), ...] (ช่วง id ต่อเนื่อง)
+    user ใหม่ที่ id เกินช่วงสุดท้ายจะไปอยู่ shard สุดท้าย -> เพิ่ม shard = เพิ่มช่วงใหม่
+    """
+    shard_map = _shard_map()
+    starts = [start for start, _ in shard_map]
+    i = bisect.bisect_right(starts, owner_id) - 1
+    return shard_map[max(i, 0)][1]
+
+
+def current_shard():
+    return _current.get() or DEFAULT_DB_ALIAS
+
+
+def is_sharded():
+    return shard_aliases() != [DEFAULT_DB_ALIAS]
+
+
+def activate_owner(owner_id):
+    """
+    ตั้ง shard ของ request/task ปัจจุบัน (ใช้จนจบ scope ของ ShardMiddleware / use_shard)
+    """
+    _current.set(shard_for_owner(owner_id))
+
+
+@contextmanager
+def use_shard(alias):
+    token = _current.set(alias)
+    try:
+        yield alias
+    finally:
+        _current.reset(token)
+
+
+def for_owner(owner_id):
+    return use_shard(shard_for_owner(owner_id))
+
+
+def fan_out(func, *args, **kwargs):
+    """
+    รัน func ในทุก shard พร้อมกัน (thread ละ shard) คืน {alias: ผลลัพธ์}
+    มี shard เดียว -> รันใน thread เดิม
+    """
+    aliases = shard_aliases()
+
+    def run(alias):
+        with use_shard(alias):
+            return func(*args, **kwargs)
+
+    if len(aliases) == 1:
+        return {aliases[0]: run(aliases[0])}
+
+    def run_in_thread(alias):
+        try:
+            return run(alias)
+        finally:
+            # connection ผูกกับ thread ปิดทิ้งก่อน thread จบ
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=len(aliases)) as pool:
+        futures = {alias: pool.submit(run_in_thread, alias) for alias in aliases}
+        return {alias: future.result() for alias, future in futures.items()}
+
+
+_gather_pool = None
+_gather_pool_lock = threading.Lock()
+_in_gather = ContextVar("db_in_gather", default=False)
+# execute_wrapper ที่ request ติดไว้กับ connection ของตัวเอง (config.middleware) -> ติดให้ connection ใน gather ด้วย
+query_wrappers = ContextVar("db_query_wrappers", default=())
+
+
+def _pool():
+    global _gather_pool
+    if _gather_pool is None:
+        with _gather_pool_lock:
+            if _gather_pool is None:
+                _gather_pool = ThreadPoolExecutor(
+                    max_workers=settings.PARALLEL_QUERY_WORKERS, thread_name_prefix="db-gather"
+                )
+    return _gather_pool
+
+
+def _run_gathered(func):
+    _in_gather.set(True)
+    # thread ใน pool ใช้ connection ต่อกันได้ (ปิดเมื่อเกิน CONN_MAX_AGE / ใช้ไม่ได้ เหมือนตอนเริ่ม request)
+    close_old_connections()
+    try:
+        with ExitStack() as stack:
+            for wrapper in query_wrappers.get():
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(wrapper))
+            return func()
+    finally:
+        # เหมือนจบ request: CONN_MAX_AGE = 0 -> ปิดทันที ไม่ค้าง connection idle ไว้กับ thread ใน pool
+        close_old_connections()
+
+
+def gather(*funcs):
+    """
+    รัน query ที่ไม่ขึ้นต่อกันพร้อมกัน (thread ละ connection) ใน shard / replica เดียวกับที่เรียก คืนผลตามลำดับ
+    รันทีละอันใน thread เดิมเมื่อ:
+    - อยู่ใน atomic (ต้องเห็นข้อมูลของ transaction นี้ เช่นใน test) หรือเรียกซ้อนจากใน gather
+    - PARALLEL_QUERY_WORKERS <= 1
+    แต่ละ query เห็น snapshot ของตัวเอง (ไม่ใช่ transaction เดียวกัน)
+    """
+    serial = (
+        len(funcs) <= 1
+        or settings.PARALLEL_QUERY_WORKERS <= 1
+        or _in_gather.get()
+        or any(conn.in_atomic_block for conn in connections.all(initialized_only=True))
+    )
+    if serial:
+        return [func() for func in funcs]
+    # copy_context ต่อ task: shard / replica ของ request นี้ตามไปด้วย
+    futures = [_pool().submit(copy_context().run, _run_gathered, func) for func in funcs]
+    return [future.result() for future in futures]
+
+
+# ---------- copy reference data / user ไป shard ----------
+
+def _label(model):
+    return model._meta.label_lower
+
+
+def replica_targets(instance):
+    """
+    shard (นอกจาก default) ที่ต้องมี copy ของ instance นี้
+    """
+    label = _label(type(instance))
+    if label in REPLICATED_MODELS:
+        targets = shard_aliases()
+    elif label in OWNER_COPY_MODELS:
+        owner_id = instance.pk if label == "auth.user" else instance.user_id
+        targets = [shard_for_owner(owner_id)]
+    else:
+        return []
+    return [alias for alias in targets if alias != DEFAULT_DB_ALIAS]
+
+
+def copy_to_shards(instance):
+    """
+    update / bulk_create ไม่ยิง post_save ใน shard (เช่น signal สร้าง profile ของ users)
+    """
+    model = type(instance)
+    values = {
+        f.attname: getattr(instance, f.attname)
+        for f in model._meta.concrete_fields
+        if not f.primary_key
+    }
+    for alias in replica_targets(instance):
+        manager = model._base_manager.using(alias)
+        if not manager.filter(pk=instance.pk).update(**values):
+            manager.bulk_create([model(pk=instance.pk, **values)])
+
+
+def _on_save(sender, instance, raw=False, using=None, **kwargs):
+    if raw or using != DEFAULT_DB_ALIAS:
+        return
+    copy_to_shards(instance)
+
+
+def _on_delete(sender, instance, using=None, **kwargs):
+    if using != DEFAULT_DB_ALIAS:
+        return
+    for alias in replica_targets(instance):
+        # ลบ user ใน shard -> cascade ข้อมูลการเงินของ user ใน shard นั้น
+        sender._base_manager.using(alias).filter(pk=instance.pk).delete()
+
+
+def connect_replication_signals():
+    from django.apps import apps
+    from django.db.models.signals import post_delete, post_save
+
+    if not is_sharded():
+        return
+    for label in REPLICATED_MODELS + OWNER_COPY_MODELS:
+        model = apps.get_model(label)
+        post_save.connect(_on_save, sender=model, weak=False, dispatch_uid=f"sharding.save.{label}")
+        post_delete.connect(_on_delete, sender=model, weak=False, dispatch_uid=f"sharding.delete.{label}")
+
+
+def sync_shards(batch_size=1000, log=None):
+    """
+    copy reference data + user/profile จาก default ไปทุก shard แบบ bulk (upsert)
+    ใช้หลังเพิ่ม shard ใหม่ หรือหลังเขียนแบบ bulk_create / update() ที่ไม่ยิง signal
+    """
+    from django.apps import apps
+    from django.db.models import Q
+
+    for alias in shard_aliases():
+        if alias == DEFAULT_DB_ALIAS:
+            continue
+        for label in REPLICATED_MODELS + OWNER_COPY_MODELS:
+            model = apps.get_model(label)
+            qs = model._base_manager.using(DEFAULT_DB_ALIAS).order_by("pk")
+            if label in OWNER_COPY_MODELS:
+                field = "pk" if label == "auth.user" else "user_id"
+                in_shard = Q(pk__in=[])
+                for start, end in owner_ranges(alias):
+                    cond = Q(**{f"{field}__gte": start})
+                    if end is not None:
+                        cond &= Q(**{f"{field}__lt": end})
+                    in_shard |= cond
+                qs = qs.filter(in_shard)
+
+            fields = [f.name for f in model._meta.concrete_fields if not f.primary_key]
+            rows = list(qs[:batch_size])
+            total = 0
+            while rows:
+                model._base_manager.using(alias).bulk_create(
+                    rows, update_conflicts=True, unique_fields=[model._meta.pk.name], update_fields=fields
+                )
+                total += len(rows)
+                rows = list(qs.filter(pk__gt=rows[-1].pk)[:batch_size])
+            if log:
+                log(f"{alias}: {label} {total}")
@@ -21,8 +21,11 @@ from django.urls import path, include
 
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView
 
+from .metrics import metrics_view
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics_view, name="metrics"),
 
     path("api/schema/", SpectacularAPIView.as_view(), name="schema"),
     path("api/docs/", SpectacularSwaggerView.as_view(url_name="schema"), name="swagger-ui"),
@@ -32,6 +35,7 @@ urlpatterns = [
     path("api/", include("finance.reports_urls")),
     path("api/", include("finance.receipts_urls")),
     path("api/", include("finance.ai_urls")),
+    path("api/", include("finance.sync_urls")),
 ]
 
 if settings.DEBUG:
@@ -1,3 +1,73 @@
 from django.contrib import admin
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils.html import format_html
 
-# Register your models here.
+from .models import BaseCurrencyRebase, RequestProfile
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """
+    รายการ profile ต่อ request (ดาวน์โหลดไฟล์ .prof / .folded ได้)
+    """
+    list_display = ("created_at", "method", "route", "status_code", "duration_ms", "user", "requested_by", "mode", "download")
+    list_filter = ("mode", "route", "status_code")
+    search_fields = ("path", "route", "user__username", "requested_by__username")
+    readonly_fields = [f.name for f in RequestProfile._meta.fields] + ["download"]
+    list_select_related = ("user", "requested_by")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="file")
+    def download(self, obj):
+        if not obj.file:
+            return "-"
+        url = reverse("admin:finance_requestprofile_download", args=[obj.pk])
+        return format_html('<a href="{}">{}</a>', url, obj.file.name.rsplit("/", 1)[-1])
+
+    def get_urls(self):
+        return [
+            path(
+                "<int:pk>/download/",
+                self.admin_site.admin_view(self.download_view),
+                name="finance_requestprofile_download",
+            ),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        if not self.has_view_permission(request):
+            raise Http404
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        try:
+            f = profile.file.open("rb")
+        except FileNotFoundError:
+            raise Http404("Profile file is missing")
+        return FileResponse(f, as_attachment=True, filename=profile.file.name.rsplit("/", 1)[-1])
+
+
+@admin.register(BaseCurrencyRebase)
+class BaseCurrencyRebaseAdmin(admin.ModelAdmin):
+    """
+    งานคำนวณยอดใหม่หลังเปลี่ยน base currency (ดู rate ที่ขาดใน progress)
+    """
+    list_display = ("owner", "from_currency", "to_currency", "status", "percent_done", "requested_at", "finished_at")
+    list_filter = ("status",)
+    search_fields = ("owner__username",)
+    readonly_fields = [f.name for f in BaseCurrencyRebase._meta.fields]
+    list_select_related = ("owner",)
+
+    @admin.display(description="done")
+    def percent_done(self, obj):
+        tx = obj.progress.get("transactions")
+        if not tx or not tx["total"]:
+            return "-"
+        return f"{tx['done'] * 100 // tx['total']}%"
+
+    def has_add_permission(self, request):
+        return False
@@ -3,3 +3,13 @@ from django.apps import AppConfig
 
 class FinanceConfig(AppConfig):
     name = 'finance'
+
+    def ready(self):
+        from config.metrics import connect_celery_signals
+        from config.sharding import connect_replication_signals
+        from finance.services_etag import connect_etag_signals
+        from finance.services_fx import connect_fx_signals
+        connect_celery_signals()
+        connect_replication_signals()
+        connect_fx_signals()
+        connect_etag_signals()
@@ -0,0 +1,59 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    LRU + TTL แบบง่าย ใช้ใน process เดียว (thread-safe)
+    เหมาะกับข้อมูลต่อ user ที่โหลดแพงแต่เปลี่ยนไม่บ่อย
+    name: ใช้เป็น label ของ hit/miss ใน /metrics
+    """
+
+    def __init__(self, maxsize: int, ttl: float, name: str = "default"):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+        from config.metrics import CACHE_REQUESTS
+
+        self._hits = CACHE_REQUESTS.labels(name, "hit")
+        self._misses = CACHE_REQUESTS.labels(name, "miss")
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self._misses.inc()
+                return None
+            value, expires_at = item
+            if time.monotonic() >= expires_at:
+                del self._data[key]
+                self._misses.inc()
+                return None
+            self._data.move_to_end(key)
+            self._hits.inc()
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_or_load(self, key, loader):
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.set(key, value)
+        return value
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+
+from config import sharding
+from finance.models import Transaction
+from finance.services_merchants import resolve_merchant
+from finance.services_sync import touch
+
+
+class Command(BaseCommand):
+    help = "Normalize Transaction.merchant into Merchant rows (merchant_ref) in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        updated = 0
+        for alias in sharding.shard_aliases():
+            with sharding.use_shard(alias):
+                updated += self._backfill(alias, options["chunk_size"])
+
+        self.stdout.write(self.style.SUCCESS(f"Backfilled {updated} transactions ✅"))
+
+    def _backfill(self, alias, chunk_size):
+        qs = Transaction.objects.filter(merchant_ref__isnull=True).exclude(merchant="")
+
+        last_id = 0
+        updated = 0
+        while True:
+            ids = list(qs.filter(id__gt=last_id).order_by("id").values_list("id", flat=True)[:chunk_size])
+            if not ids:
+                break
+
+            # 1 UPDATE ต่อ (owner, ชื่อดิบ) ในช่วง id นี้
+            chunk = qs.filter(id__gte=ids[0], id__lte=ids[-1])
+            pairs = chunk.values_list("owner_id", "merchant").order_by("owner_id", "merchant").distinct()
+
+            with db_transaction.atomic(using=alias):
+                for owner_id, raw in pairs:
+                    merchant = resolve_merchant(owner_id, raw)
+                    if merchant:
+                        updated += touch(chunk.filter(owner_id=owner_id, merchant=raw), [owner_id], merchant_ref=merchant)
+
+            last_id = ids[-1]
+            self.stdout.write(f"... {alias} up to id {last_id}: {updated} updated")
+
+        return updated
@@ -0,0 +1,360 @@
+import json
+import os
+import re
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import timedelta
+from importlib import import_module
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import Client, RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.request import Request
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config import sharding
+
+User = get_user_model()
+
+# (module, prefix ที่ mount ไว้ใน config/urls.py)
+ENDPOINT_MODULES = (
+    ("finance.urls", "/api/"),
+    ("finance.reports_urls", "/api/"),
+    ("finance.ai_urls", "/api/"),
+)
+
+
+def percentile(sorted_values, pct):
+    """
+    nearest-rank percentile (sorted_values ต้องเรียงแล้ว)
+    """
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, round(pct / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every GET endpoint in finance/urls.py, reports_urls.py and ai_urls.py "
+        "(p50/p95/p99 latency + throughput) as one user and write the results as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", help="username to benchmark as (default: first bench-* user)")
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=3)
+        parser.add_argument("--base-url", help="benchmark a running server (e.g. http://127.0.0.1:8000) instead of the test client")
+        parser.add_argument("--concurrency", type=int, default=1, help="parallel requests (--base-url only)")
+        parser.add_argument("--only", help="run endpoints whose path contains this text")
+        parser.add_argument("--days", type=int, default=30, help="date range of report endpoints (default: last 30 days)")
+        parser.add_argument("--output", help="JSON output path (default: benchmarks/<timestamp>-<commit>.json)")
+        parser.add_argument("--compare", help="previous JSON result to diff against")
+        parser.add_argument(
+            "--explain",
+            action="store_true",
+            help="also EXPLAIN (ANALYZE, BUFFERS) every query each endpoint runs (PostgreSQL, test client only)",
+        )
+
+    def handle(self, *args, **options):
+        user = self._get_user(options["user"])
+        if options["concurrency"] > 1 and not options["base_url"]:
+            raise CommandError("--concurrency needs --base-url (the test client runs in-process)")
+        if options["explain"] and options["base_url"]:
+            raise CommandError("--explain needs the test client (no --base-url)")
+
+        with sharding.for_owner(user.pk):
+            endpoints, skipped = self._discover(user, options["days"])
+        if options["only"]:
+            endpoints = [e for e in endpoints if options["only"] in e["path"]]
+
+        token = str(AccessToken.for_user(user))
+        shard = sharding.shard_for_owner(user.pk)
+        if options["base_url"]:
+            call = self._live_caller(options["base_url"].rstrip("/"), token)
+        else:
+            call = self._client_caller(token, shard)
+
+        results = []
+        for endpoint in endpoints:
+            result = self._bench(endpoint, call, options)
+            results.append(result)
+            self.stdout.write(
+                f"{endpoint['name']:<32} p50 {result['p50_ms']:>8.1f}  p95 {result['p95_ms']:>8.1f}  "
+                f"p99 {result['p99_ms']:>8.1f} ms  {result['rps']:>7.1f} req/s"
+                + (f"  {result['avg_queries']:.1f} q" if result["avg_queries"] is not None else "")
+                + (f"  errors {result['errors']}" if result["errors"] else "")
+            )
+            if options["explain"]:
+                result["explain"] = self._explain(endpoint, token, shard)
+                for plan in result["explain"]:
+                    self.stdout.write(
+                        f"    {plan['execution_ms']:>8.2f} ms  buffers {plan['buffers']:>6}  "
+                        f"heap fetches {plan['heap_fetches']:>5}  {', '.join(plan['scans'])}"
+                    )
+        for path, reason in skipped:
+            self.stdout.write(f"skipped {path}: {reason}")
+
+        commit = _git_commit()
+        with sharding.for_owner(user.pk):
+            transactions = user.transactions.count()
+        report = {
+            "meta": {
+                "commit": commit,
+                "created_at": timezone.now().isoformat(),
+                "mode": "live" if options["base_url"] else "client",
+                "base_url": options["base_url"],
+                "concurrency": options["concurrency"],
+                "iterations": options["iterations"],
+                "user": user.username,
+                "db_vendor": connection.vendor,
+                "transactions": transactions,
+            },
+            "results": results,
+        }
+
+        output = options["output"] or os.path.join(
+            "benchmarks", f"{timezone.now():%Y%m%d-%H%M%S}-{commit or 'nogit'}.json"
+        )
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w") as f:
+            json.dump(report, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {output} ✅"))
+
+        if options["compare"]:
+            self._compare(options["compare"], results)
+
+    # ---------- setup ----------
+
+    def _get_user(self, username):
+        qs = User.objects.select_related("profile")
+        user = qs.filter(username=username).first() if username else qs.filter(username__startswith="bench-").order_by("id").first()
+        if not user:
+            raise CommandError("User not found. Run seed_benchmark_data first or pass --user.")
+        return user
+
+    def _default_params(self, path, days):
+        today = timezone.localdate()
+        month = today.strftime("%Y-%m")
+        rules = (
+            ("/reports/wallet-balances/", {}),
+            ("/reports/", {"from": str(today - timedelta(days=days)), "to": str(today)}),
+            ("/budgets/status/", {"month": month}),
+            ("/transactions/search/", {"q": "coffee"}),
+            ("/merchants/autocomplete/", {"q": "st"}),
+            ("/ai/monthly-summary/", {"month": month, "language": "th"}),
+        )
+        for fragment, params in rules:
+            if fragment in path:
+                return params
+        return {}
+
+    def _discover(self, user, days):
+        """
+        ไล่ urlpatterns แล้วเลือกเฉพาะ route ที่รับ GET
+        - router: list + action(detail=False) และ detail (ใช้ pk แรกของ queryset ของ user)
+        - skip route ที่ต้องใช้ parameter อื่น (เช่น signed token)
+        """
+        endpoints, skipped = [], []
+        for module, prefix in ENDPOINT_MODULES:
+            for pattern in import_module(module).urlpatterns:
+                regex = pattern.pattern.regex
+                if "format" in regex.groupindex:
+                    continue
+
+                callback = pattern.callback
+                actions = getattr(callback, "actions", None)
+                view_class = getattr(callback, "cls", None) or getattr(callback, "view_class", None)
+                if actions is not None:
+                    if "get" not in actions:
+                        continue
+                elif not hasattr(view_class, "get"):
+                    continue
+
+                route = str(pattern.pattern).lstrip("^").rstrip("$")
+                path = prefix + route
+
+                groups = set(regex.groupindex)
+                if groups:
+                    if groups != {"pk"} or actions is None:
+                        skipped.append((path, "needs URL parameters"))
+                        continue
+                    pk = self._sample_pk(view_class, actions, user)
+                    if pk is None:
+                        skipped.append((path, "no rows for this user"))
+                        continue
+                    path = prefix + re.sub(r"\(\?P<pk>[^)]*\)", str(pk), route)
+                    if "<" in path:
+                        skipped.append((path, "needs URL parameters"))
+                        continue
+                    path = path.replace("\\", "")
+                elif "<" in route:
+                    skipped.append((path, "needs URL parameters"))
+                    continue
+
+                endpoints.append({
+                    "name": pattern.name or path,
+                    "path": path,
+                    "params": self._default_params(path, days),
+                })
+        return endpoints, skipped
+
+    def _sample_pk(self, view_class, actions, user):
+        request = Request(RequestFactory().get("/"))
+        request.user = user
+        view = view_class(action=actions["get"], request=request, args=(), kwargs={}, format_kwarg=None)
+        return view.get_queryset().values_list("pk", flat=True).first()
+
+    # ---------- callers ----------
+
+    def _client(self, token):
+        host = next((h for h in settings.ALLOWED_HOSTS if h and "*" not in h), "localhost").lstrip(".")
+        return Client(HTTP_AUTHORIZATION=f"Bearer {token}", HTTP_HOST=host)
+
+    def _client_caller(self, token, shard):
+        client = self._client(token)
+        # user/token อยู่ที่ default ข้อมูลการเงินอยู่ใน shard ของ user -> นับทั้งสอง
+        aliases = {DEFAULT_DB_ALIAS, shard}
+
+        def call(path, params):
+            with ExitStack() as stack:
+                captures = [stack.enter_context(CaptureQueriesContext(connections[a])) for a in aliases]
+                start = time.perf_counter()
+                res = client.get(path, params)
+                elapsed = time.perf_counter() - start
+            return res.status_code, elapsed, sum(len(c.captured_queries) for c in captures)
+
+        return call
+
+    def _live_caller(self, base_url, token):
+        def call(path, params):
+            url = base_url + path + (f"?{urlencode(params)}" if params else "")
+            req = urllib.request.Request(url, headers={"Authorization": f"Bearer {token}"})
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(req) as res:
+                    res.read()
+                    code = res.status
+            except urllib.error.HTTPError as e:
+                code = e.code
+            return code, time.perf_counter() - start, None
+
+        return call
+
+    def _bench(self, endpoint, call, options):
+        path, params = endpoint["path"], endpoint["params"]
+        for _ in range(options["warmup"]):
+            call(path, params)
+
+        n = options["iterations"]
+        start = time.perf_counter()
+        if options["concurrency"] > 1:
+            with ThreadPoolExecutor(options["concurrency"]) as pool:
+                samples = list(pool.map(lambda _: call(path, params), range(n)))
+        else:
+            samples = [call(path, params) for _ in range(n)]
+        wall = time.perf_counter() - start
+
+        latencies = sorted(s[1] * 1000 for s in samples)
+        statuses = {}
+        for code, _, _ in samples:
+            statuses[str(code)] = statuses.get(str(code), 0) + 1
+        queries = [s[2] for s in samples if s[2] is not None]
+
+        return {
+            "name": endpoint["name"],
+            "path": path,
+            "params": params,
+            "n": n,
+            "errors": sum(1 for code, _, _ in samples if code >= 400),
+            "status": statuses,
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "mean_ms": round(sum(latencies) / n, 2),
+            "max_ms": round(latencies[-1], 2),
+            "rps": round(n / wall, 1),
+            "avg_queries": round(sum(queries) / len(queries), 1) if queries else None,
+        }
+
+    # ---------- EXPLAIN ----------
+
+    def _explain(self, endpoint, token, shard):
+        """
+        เรียก endpoint 1 ครั้ง แล้ว EXPLAIN (ANALYZE, BUFFERS) ทุก SELECT ที่ยิงไป shard ของ user
+        ดูว่าใช้ index ไหน / index-only scan ได้ไหม (heap fetches) / อ่านกี่ buffer
+        """
+        conn = connections[shard]
+        if conn.vendor != "postgresql":
+            raise CommandError("--explain needs PostgreSQL")
+
+        with CaptureQueriesContext(conn) as ctx:
+            self._client(token).get(endpoint["path"], endpoint["params"])
+
+        plans = []
+        for query in ctx.captured_queries:
+            sql = query["sql"]
+            if not sql.lstrip().upper().startswith("SELECT"):
+                continue
+            with conn.cursor() as c:
+                c.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}")
+                plan = c.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            plans.append(self._summarize_plan(sql, plan[0]))
+        return plans
+
+    @staticmethod
+    def _summarize_plan(sql, plan):
+        scans, heap_fetches = [], 0
+        stack = [plan["Plan"]]
+        while stack:
+            node = stack.pop()
+            stack.extend(node.get("Plans", []))
+            if "Scan" not in node["Node Type"]:
+                continue
+            target = node.get("Index Name") or node.get("Relation Name") or ""
+            scans.append(f"{node['Node Type']} {target}".strip())
+            heap_fetches += node.get("Heap Fetches", 0)
+        root = plan["Plan"]
+        return {
+            "sql": sql,
+            "execution_ms": round(plan["Execution Time"], 3),
+            "buffers": root.get("Shared Hit Blocks", 0) + root.get("Shared Read Blocks", 0),
+            "heap_fetches": heap_fetches,
+            "scans": scans,
+        }
+
+    def _compare(self, path, results):
+        with open(path) as f:
+            previous = {r["name"]: r for r in json.load(f)["results"]}
+
+        self.stdout.write(f"\nvs {path}")
+        for r in results:
+            old = previous.get(r["name"])
+            if not old:
+                self.stdout.write(f"{r['name']:<32} (new)")
+                continue
+            delta = (r["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+            self.stdout.write(f"{r['name']:<32} p95 {old['p95_ms']:>8.1f} -> {r['p95_ms']:>8.1f} ms ({delta:+.1f}%)")
+            if "explain" in r and "explain" in old:
+                buffers = [sum(p["buffers"] for p in x["explain"]) for x in (old, r)]
+                self.stdout.write(f"{'':<32} buffers {buffers[0]:>6} -> {buffers[1]:>6}")
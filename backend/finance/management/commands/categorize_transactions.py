@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from finance.services_categorize import categorize_uncategorized
+
+
+class Command(BaseCommand):
+    help = "Auto-categorize uncategorized transactions (rules + learned merchant map) in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--owner", type=int, default=None, help="user id (default: all users)")
+        parser.add_argument("--chunk-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        def progress(last_id, updated):
+            self.stdout.write(f"... up to id {last_id}: {updated} updated")
+
+        updated = categorize_uncategorized(
+            owner_id=options["owner"],
+            chunk_size=options["chunk_size"],
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Categorized {updated} transactions ✅"))
@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+
+from config.profiling import MODES, PROFILE_QUERY_PARAM, make_profile_token
+
+
+class Command(BaseCommand):
+    help = "Issue a single-use profiling token for a staff user and one path (send as X-Profile header or ?__profile=)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("path", help="request path to profile, e.g. /api/transactions/")
+        parser.add_argument("--mode", choices=MODES, default="cprofile")
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(username=options["username"]).first()
+        if user is None:
+            raise CommandError("User not found")
+        if not user.is_staff:
+            raise CommandError("Profiling tokens are for staff users only")
+
+        token = make_profile_token(user, options["path"], options["mode"])
+        self.stdout.write(token)
+        self.stdout.write(
+            f"single use on {options['path']}, valid for {settings.REQUEST_PROFILE_TOKEN_MAX_AGE}s - "
+            f"curl -H 'X-Profile: {token}' ...  or  ?{PROFILE_QUERY_PARAM}={token}",
+            style_func=lambda s: s,
+        )
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from finance import services_archive
+
+
+class Command(BaseCommand):
+    help = (
+        "Archive soft-deleted transactions older than TRANSACTION_PURGE_AFTER_DAYS (plus their transfer links) "
+        "to gzipped JSONL in storage, then delete them in chunks. --restore loads an archive file back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=services_archive.DEFAULT_CHUNK_SIZE)
+        parser.add_argument("--restore", metavar="FILE", help="archive file (storage name) to load back as soft-deleted rows")
+
+    def handle(self, *args, **options):
+        if options["restore"]:
+            n_tx, n_links = services_archive.restore_archive(options["restore"])
+            self.stdout.write(self.style.SUCCESS(f"Restored {n_tx} transactions, {n_links} links to the trash ✅"))
+            return
+
+        self.stdout.write(f"Purging transactions deleted more than {settings.TRANSACTION_PURGE_AFTER_DAYS} days ago")
+        result = services_archive.purge_deleted_transactions(chunk_size=options["chunk_size"], log=self.stdout.write)
+        total = sum(r["transactions"] for r in result.values())
+        self.stdout.write(self.style.SUCCESS(f"Archived and deleted {total} transactions ✅"))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from finance.services_rebase import rebase, resume_rebases
+
+
+class Command(BaseCommand):
+    help = "Recompute base amounts after a base currency change (default: retry failed/stuck rebases)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--id", type=int, help="Run this BaseCurrencyRebase only")
+
+    def handle(self, *args, **options):
+        if options["id"]:
+            job = rebase(options["id"])
+            self.stdout.write(self.style.SUCCESS(f"Rebased {job.from_currency} -> {job.to_currency}: {job.progress} ✅"))
+            return
+        done = resume_rebases()
+        self.stdout.write(self.style.SUCCESS(f"Finished {done} rebases ✅"))
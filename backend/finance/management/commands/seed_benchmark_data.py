@@ -0,0 +1,361 @@
+import csv
+import io
+import math
+import random
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, transaction as db_transaction
+from django.utils import timezone
+
+from config import sharding
+from finance.models import (
+    Budget,
+    Category,
+    Currency,
+    FxRate,
+    Merchant,
+    RecurringTransaction,
+    Transaction,
+    TransferLink,
+    Wallet,
+)
+from finance.services_etag import bump_reference_version
+from finance.services_merchants import normalize_merchant_key
+from users.models import UserProfile
+
+User = get_user_model()
+
+BASE_CURRENCY = "THB"
+# เรทเริ่มต้น (1 หน่วย -> THB) แล้วเดินแบบ random walk รายวัน
+FX_START = {"USD": 35.0, "EUR": 38.0, "JPY": 0.24, "GBP": 44.0}
+# สัดส่วน wallet แต่ละสกุล (ส่วนใหญ่เป็น THB)
+WALLET_CURRENCIES = [("THB", 80), ("USD", 10), ("EUR", 4), ("JPY", 4), ("GBP", 2)]
+WALLET_TYPES = ["cash", "bank", "card", "ewallet"]
+
+EXPENSE_CATEGORIES = ["Food", "Coffee", "Transport", "Groceries", "Shopping", "Bills", "Entertainment", "Health"]
+INCOME_CATEGORIES = ["Salary", "Freelance", "Interest"]
+
+# (ชื่อร้าน, หมวด) เรียงจากร้านที่ใช้บ่อยไปน้อย (น้ำหนักแบบ Zipf)
+MERCHANTS = [
+    ("7-Eleven", "Food"), ("Starbucks", "Coffee"), ("Grab", "Transport"), ("BTS", "Transport"),
+    ("Lotus's", "Groceries"), ("Big C", "Groceries"), ("Cafe Amazon", "Coffee"), ("Lineman", "Food"),
+    ("MRT", "Transport"), ("Tops Market", "Groceries"), ("FamilyMart", "Food"), ("Shopee", "Shopping"),
+    ("Lazada", "Shopping"), ("MK Restaurants", "Food"), ("Bolt", "Transport"), ("AIS", "Bills"),
+    ("True Move H", "Bills"), ("MEA", "Bills"), ("Netflix", "Entertainment"), ("Spotify", "Entertainment"),
+    ("Major Cineplex", "Entertainment"), ("Uniqlo", "Shopping"), ("Boots", "Health"), ("Watsons", "Health"),
+    ("Makro", "Groceries"), ("After You", "Food"), ("Swensen's", "Food"), ("KFC", "Food"),
+    ("McDonald's", "Food"), ("Shell", "Transport"), ("PTT Station", "Transport"), ("Central", "Shopping"),
+    ("IKEA", "Shopping"), ("Bumrungrad", "Health"), ("Agoda", "Entertainment"), ("Apple", "Shopping"),
+]
+MERCHANT_INDEXES = range(len(MERCHANTS))
+MERCHANT_CUM_WEIGHTS = list(accumulate(1 / (rank + 1) for rank in MERCHANT_INDEXES))
+
+# สัดส่วนรายรับในรายการเดี่ยว ที่เหลือเป็นรายจ่าย (transfer สร้างเป็นคู่แยกต่างหาก)
+INCOME_RATIO = 0.1
+
+
+def _weighted(rng, pairs):
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights=weights)[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a load-test dataset: N users x M wallets x K transactions with multi-currency wallets, "
+        "FX rates, categories, merchants, transfers, recurrings and budgets. "
+        "Uses COPY on PostgreSQL (bulk_create elsewhere). Writes to the configured DB - use a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10)
+        parser.add_argument("--wallets", type=int, default=3, help="wallets per user")
+        parser.add_argument("--transactions", type=int, default=1000, help="transactions per wallet")
+        parser.add_argument("--days", type=int, default=365, help="history length")
+        parser.add_argument("--transfer-ratio", type=float, default=0.05)
+        parser.add_argument("--batch-size", type=int, default=20000)
+        parser.add_argument("--prefix", default="bench")
+        parser.add_argument("--password", default="bench-pass-123")
+        parser.add_argument("--seed", type=int, default=42)
+        parser.add_argument("--no-copy", action="store_true", help="use bulk_create even on PostgreSQL")
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.use_copy = connection.vendor == "postgresql" and not options["no_copy"]
+        self.today = timezone.localdate()
+        self.start_date = self.today - timedelta(days=options["days"] - 1)
+        self.tz = timezone.get_current_timezone()
+
+        started = timezone.now()
+        call_command("seed_currencies", stdout=io.StringIO())
+        self.currencies = {c.code: c for c in Currency.objects.filter(code__in=[c for c, _ in WALLET_CURRENCIES])}
+
+        self._seed_fx_rates()
+        users = self._seed_users(options["users"], options["prefix"], options["password"])
+
+        # bulk_create ไม่ยิง signal -> copy user / currency / fx ไป shard เอง
+        sharding.sync_shards(batch_size=self.batch_size)
+
+        self.pending = []
+        self.tx_total = 0
+        done = 0
+        # ทีละ shard: batch ของ COPY / bulk_create ต้องไม่ปนข้าม shard
+        for alias in sharding.shard_aliases():
+            with sharding.use_shard(alias):
+                for user in users:
+                    if sharding.shard_for_owner(user.pk) != alias:
+                        continue
+                    self._seed_user_data(user, options["wallets"], options["transactions"], options["transfer_ratio"])
+                    done += 1
+                    if done % 10 == 0 or done == len(users):
+                        self.stdout.write(f"... users {done}/{len(users)}, transactions {self.tx_total + len(self.pending)}")
+                self._flush_transactions()
+
+        elapsed = (timezone.now() - started).total_seconds()
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users, {self.tx_total} transactions in {elapsed:.1f}s "
+            f"({self.tx_total / max(elapsed, 0.001):.0f} rows/s) ✅"
+        ))
+
+    # ---------- reference data ----------
+
+    def _seed_fx_rates(self):
+        """
+        เรทรายวันของทุกสกุล -> THB (random walk) เก็บไว้ใน memory ด้วยเพื่อคำนวณ base_amount
+        """
+        thb = self.currencies[BASE_CURRENCY]
+        self.fx = {}
+        rows = []
+        for code, rate in FX_START.items():
+            quote = self.currencies[code]
+            day = self.start_date
+            while day <= self.today:
+                rate *= math.exp(self.rng.gauss(0, 0.004))
+                value = Decimal(str(round(rate, 8)))
+                self.fx[(code, day)] = value
+                rows.append(FxRate(date=day, base=quote, quote=thb, rate=value))
+                day += timedelta(days=1)
+
+        FxRate.objects.bulk_create(rows, batch_size=self.batch_size, ignore_conflicts=True)
+        # bulk_create ไม่ยิง post_save -> ETag ของทุก user ต้องเปลี่ยนเอง
+        bump_reference_version()
+        # ถ้ามีเรทเดิมอยู่แล้ว ใช้ค่าจาก DB เพื่อให้ base_amount ตรงกับที่ API คำนวณ
+        existing = FxRate.objects.filter(quote=thb, date__gte=self.start_date).values_list("base__code", "date", "rate")
+        for code, day, rate in existing:
+            self.fx[(code, day)] = rate
+        self.stdout.write(f"... fx rates: {len(rows)}")
+
+    def _seed_users(self, n, prefix, password):
+        # hash ครั้งเดียวใช้กับทุก user (hash ต่อคนจะช้ามาก)
+        hashed = make_password(password)
+        existing = User.objects.filter(username__startswith=f"{prefix}-").count()
+        users = User.objects.bulk_create(
+            [
+                User(username=f"{prefix}-{existing + i:06d}", email=f"{prefix}-{existing + i:06d}@example.com", password=hashed)
+                for i in range(n)
+            ],
+            batch_size=self.batch_size,
+        )
+        # bulk_create ไม่ยิง post_save -> สร้าง profile เอง
+        UserProfile.objects.bulk_create([UserProfile(user=u, base_currency=BASE_CURRENCY) for u in users])
+        self.stdout.write(f"... users: {users[0].username if users else '-'} .. {users[-1].username if users else '-'}")
+        return users
+
+    # ---------- per user ----------
+
+    def _seed_user_data(self, user, n_wallets, per_wallet, transfer_ratio):
+        rng = self.rng
+
+        wallets = Wallet.objects.bulk_create([
+            Wallet(
+                owner=user,
+                name=f"{WALLET_TYPES[i % len(WALLET_TYPES)].title()} {i + 1}",
+                type=WALLET_TYPES[i % len(WALLET_TYPES)],
+                # wallet แรกเป็น THB เสมอ
+                currency=self.currencies[BASE_CURRENCY if i == 0 else _weighted(rng, WALLET_CURRENCIES)],
+                opening_balance=Decimal(rng.randrange(0, 50000)),
+            )
+            for i in range(n_wallets)
+        ])
+
+        categories = Category.objects.bulk_create(
+            [Category(owner=user, type="expense", name=name) for name in EXPENSE_CATEGORIES]
+            + [Category(owner=user, type="income", name=name) for name in INCOME_CATEGORIES]
+        )
+        by_name = {c.name: c for c in categories}
+
+        merchants = Merchant.objects.bulk_create([
+            Merchant(owner=user, key=normalize_merchant_key(name), name=name) for name, _ in MERCHANTS
+        ])
+
+        for wallet in wallets:
+            for _ in range(per_wallet):
+                self._add(self._random_tx(user, wallet, merchants, by_name))
+
+        if len(wallets) > 1:
+            self._seed_transfers(user, wallets, int(per_wallet * len(wallets) * transfer_ratio))
+
+        self._seed_recurrings(user, wallets[0], by_name)
+        self._seed_budgets(user, by_name)
+
+    def _random_tx(self, user, wallet, merchants, categories):
+        """
+        คืน dict ของ column (attname) แทน model instance — สร้าง Transaction() ทีละแถวช้าเกินไปสำหรับหลักล้านแถว
+        """
+        rng = self.rng
+        occurred_at = self._random_datetime()
+
+        if rng.random() < INCOME_RATIO:
+            tx_type, merchant_id, merchant_name = "income", None, ""
+            category = categories[rng.choice(INCOME_CATEGORIES)]
+            thb = rng.lognormvariate(9.5, 0.6)
+        else:
+            i = rng.choices(MERCHANT_INDEXES, cum_weights=MERCHANT_CUM_WEIGHTS)[0]
+            tx_type, merchant_id, merchant_name = "expense", merchants[i].id, MERCHANTS[i][0]
+            # บางรายการยังไม่ได้จัดหมวด
+            category = categories[MERCHANTS[i][1]] if rng.random() > 0.1 else None
+            thb = rng.lognormvariate(5.0, 1.0)
+
+        fx = self._rate(wallet.currency.code, occurred_at.date())
+        amount = max(Decimal(str(round(thb / float(fx), 2))), Decimal("0.01"))
+
+        return {
+            "owner_id": user.id,
+            "wallet_id": wallet.id,
+            "type": tx_type,
+            "occurred_at": occurred_at,
+            "amount": amount,
+            "currency_id": wallet.currency_id,
+            "fx_rate": fx,
+            "base_amount": (amount * fx).quantize(Decimal("0.01")),
+            "category_id": category.id if category else None,
+            "merchant": merchant_name,
+            "merchant_ref_id": merchant_id,
+        }
+
+    def _seed_transfers(self, user, wallets, n):
+        """
+        transfer ต้องได้ id ของทั้งสองฝั่งไปสร้าง TransferLink -> ใช้ bulk_create (จำนวนน้อยกว่ารายการปกติมาก)
+        """
+        rng = self.rng
+        outs, ins = [], []
+        for _ in range(n):
+            src, dst = rng.sample(wallets, 2)
+            occurred_at = self._random_datetime()
+            day = occurred_at.date()
+            src_fx, dst_fx = self._rate(src.currency.code, day), self._rate(dst.currency.code, day)
+
+            amount = Decimal(str(round(rng.lognormvariate(7.0, 0.8) / float(src_fx), 2))) + Decimal("0.01")
+            base_amount = (amount * src_fx).quantize(Decimal("0.01"))
+            in_amount = (base_amount / dst_fx).quantize(Decimal("0.01")) or Decimal("0.01")
+
+            common = {"owner": user, "occurred_at": occurred_at, "merchant": "Transfer"}
+            outs.append(Transaction(
+                wallet=src, type="transfer_out", amount=amount, currency_id=src.currency_id,
+                fx_rate=src_fx, base_amount=base_amount, **common,
+            ))
+            ins.append(Transaction(
+                wallet=dst, type="transfer_in", amount=in_amount, currency_id=dst.currency_id,
+                fx_rate=dst_fx, base_amount=(in_amount * dst_fx).quantize(Decimal("0.01")), **common,
+            ))
+
+        with db_transaction.atomic(using=sharding.current_shard()):
+            Transaction.objects.bulk_create(outs, batch_size=self.batch_size)
+            Transaction.objects.bulk_create(ins, batch_size=self.batch_size)
+            TransferLink.objects.bulk_create(
+                [TransferLink(out_tx=o, in_tx=i) for o, i in zip(outs, ins)], batch_size=self.batch_size
+            )
+        self.tx_total += len(outs) * 2
+
+    def _seed_recurrings(self, user, wallet, categories):
+        now = timezone.now()
+        rows = [
+            ("Netflix", "Entertainment", Decimal("419.00")),
+            ("AIS", "Bills", Decimal("599.00")),
+            ("Spotify", "Entertainment", Decimal("149.00")),
+        ]
+        RecurringTransaction.objects.bulk_create([
+            RecurringTransaction(
+                owner=user,
+                wallet=wallet,
+                category=categories[category],
+                type="expense",
+                amount=amount,
+                merchant=merchant,
+                frequency=RecurringTransaction.Frequency.MONTHLY,
+                start_date=self.start_date,
+                next_run_at=now + timedelta(days=self.rng.randrange(1, 28)),
+            )
+            for merchant, category, amount in rows
+        ])
+
+    def _seed_budgets(self, user, categories):
+        months = sorted({(self.today - timedelta(days=30 * i)).strftime("%Y-%m") for i in range(3)})
+        rows = []
+        for month in months:
+            rows.append(Budget(owner=user, month=month, scope="total", limit_base_amount=Decimal("30000")))
+            for name, limit in (("Food", "8000"), ("Transport", "3000")):
+                rows.append(Budget(
+                    owner=user, month=month, scope="category", category=categories[name],
+                    limit_base_amount=Decimal(limit),
+                ))
+        Budget.objects.bulk_create(rows)
+
+    # ---------- helpers ----------
+
+    def _random_datetime(self):
+        day = self.start_date + timedelta(days=self.rng.randrange((self.today - self.start_date).days + 1))
+        # กระจุกช่วงกลางวัน-เย็น
+        minute = int(min(max(self.rng.gauss(14 * 60, 4 * 60), 0), 24 * 60 - 1))
+        return datetime.combine(day, time(minute // 60, minute % 60), tzinfo=self.tz)
+
+    def _rate(self, code, day):
+        if code == BASE_CURRENCY:
+            return Decimal("1.0")
+        return self.fx[(code, day)]
+
+    def _add(self, tx):
+        self.pending.append(tx)
+        if len(self.pending) >= self.batch_size:
+            self._flush_transactions()
+
+    def _flush_transactions(self):
+        if not self.pending:
+            return
+        if self.use_copy:
+            self._copy(Transaction, self.pending)
+        else:
+            Transaction.objects.bulk_create([Transaction(**row) for row in self.pending], batch_size=self.batch_size)
+        self.tx_total += len(self.pending)
+        self.pending = []
+
+    def _copy(self, model, rows):
+        """
+        COPY ... FROM STDIN (psycopg2) เร็วกว่า INSERT หลายเท่า สำหรับข้อมูลหลักล้านแถว
+        rows เป็น dict ของ attname; column ที่ไม่มีใช้ default ของ field
+        """
+        now = timezone.now()
+        fields = [f for f in model._meta.concrete_fields if not f.primary_key]
+        defaults = {f.attname: now if getattr(f, "auto_now_add", False) else f.get_default() for f in fields}
+
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        for row in rows:
+            values = []
+            for f in fields:
+                value = row.get(f.attname, defaults[f.attname])
+                values.append("\\N" if value is None else value)
+            writer.writerow(values)
+        buf.seek(0)
+
+        connection = connections[sharding.current_shard()]
+        columns = ", ".join(connection.ops.quote_name(f.column) for f in fields)
+        sql = f"COPY {connection.ops.quote_name(model._meta.db_table)} ({columns}) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(sql, buf)
@@ -1,5 +1,6 @@
 from django.core.management.base import BaseCommand
 from finance.models import Currency
+from finance.serializers import clear_currency_cache
 
 class Command(BaseCommand):
     help = "Seed common currencies"
@@ -14,4 +15,5 @@ class Command(BaseCommand):
         ]
         for code, name, symbol in data:
             Currency.objects.update_or_create(code=code, defaults={"name": name, "symbol": symbol})
+        clear_currency_cache()
         self.stdout.write(self.style.SUCCESS("Seeded currencies ✅"))
\ No newline at end of file
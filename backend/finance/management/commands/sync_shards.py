@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from config import sharding
+
+
+class Command(BaseCommand):
+    help = (
+        "Copy reference data (currencies, FX rates) and users/profiles from the default database "
+        "to every shard. Run after adding a shard or after bulk writes that skip signals."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not sharding.is_sharded():
+            self.stdout.write("Only one shard configured (DB_SHARD_MAP) - nothing to copy")
+            return
+        sharding.sync_shards(batch_size=options["batch_size"], log=self.stdout.write)
+        self.stdout.write(self.style.SUCCESS("Shards in sync ✅"))
@@ -0,0 +1,48 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils.dateparse import parse_date
+
+from config import sharding
+from finance import partitioning
+
+
+class Command(BaseCommand):
+    help = (
+        "Manage monthly partitions of finance_transaction (PostgreSQL): list them, create upcoming "
+        "months, or detach old months for archiving (see finance/partitioning.py)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--ensure", action="store_true", help="Create partitions for this month and the next --months-ahead months")
+        parser.add_argument("--months-ahead", type=int, default=None)
+        parser.add_argument("--detach-before", type=str, default=None, help="YYYY-MM: detach every month before this one")
+        parser.add_argument("--list", action="store_true")
+
+    def handle(self, *args, **options):
+        before = None
+        if options["detach_before"]:
+            before = parse_date(f"{options['detach_before']}-01")
+            if before is None:
+                raise CommandError("--detach-before must be YYYY-MM")
+        months_ahead = options["months_ahead"]
+        if months_ahead is None:
+            months_ahead = settings.TRANSACTION_PARTITION_MONTHS_AHEAD
+
+        for alias in sharding.shard_aliases():
+            connection = connections[alias]
+            if not partitioning.is_partitioned(connection):
+                self.stdout.write(f"{alias}: {partitioning.TABLE} is not partitioned - skipped")
+                continue
+
+            if options["ensure"]:
+                for name in partitioning.ensure_partitions(connection, months_ahead):
+                    self.stdout.write(f"{alias}: created {name}")
+            if before:
+                for name in partitioning.detach_partitions_before(connection, before):
+                    self.stdout.write(f"{alias}: detached {name} (dump and drop it when archived)")
+            if options["list"] or not (options["ensure"] or before):
+                for name, bound in partitioning.list_partitions(connection):
+                    self.stdout.write(f"{alias}: {name} {bound}")
+
+        self.stdout.write(self.style.SUCCESS("Done ✅"))
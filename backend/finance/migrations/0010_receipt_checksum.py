@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-19 09:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0009_alter_transaction_receipt_url'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='receipt',
+            name='checksum',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-19 10:05
+
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.operations import TrigramExtension
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+# index สำหรับ /api/transactions/search/ (postgres เท่านั้น, sqlite ข้าม)
+SEARCH_INDEXES = [
+    GinIndex(fields=["merchant"], opclasses=["gin_trgm_ops"], name="finance_tx_merchant_trgm"),
+    GinIndex(fields=["note"], opclasses=["gin_trgm_ops"], name="finance_tx_note_trgm"),
+    GinIndex(SearchVector("merchant", "note", config="simple"), name="finance_tx_search_vec"),
+]
+
+
+def add_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Transaction = apps.get_model("finance", "Transaction")
+    for index in SEARCH_INDEXES:
+        schema_editor.add_index(Transaction, index)
+
+
+def remove_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    Transaction = apps.get_model("finance", "Transaction")
+    for index in SEARCH_INDEXES:
+        schema_editor.remove_index(Transaction, index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0010_receipt_checksum'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.RunPython(add_indexes, remove_indexes),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-19 09:59
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0012_merchant'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('merchant_contains', models.CharField(blank=True, default='', max_length=120)),
+                ('min_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('max_amount', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('priority', models.PositiveIntegerField(default=100)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rules', to='finance.category')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='category_rules', to=settings.AUTH_USER_MODEL)),
+                ('wallet', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='category_rules', to='finance.wallet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', 'is_active'], name='finance_cat_owner_i_0d7b02_idx')],
+            },
+        ),
+    ]
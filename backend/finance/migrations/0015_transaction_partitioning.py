@@ -0,0 +1,41 @@
+# Generated by Django 6.0 on 2026-10-19 10:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from finance.partitioning import rebuild_transaction_table
+
+# postgres เท่านั้น (sqlite ข้าม) ดูรายละเอียด/ขั้นตอน archive ใน finance/partitioning.py
+
+
+def partition_transactions(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    rebuild_transaction_table(schema_editor.connection, partitioned=True)
+
+
+def unpartition_transactions(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    rebuild_transaction_table(schema_editor.connection, partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0014_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transferlink',
+            name='in_tx',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='transfer_in_link', to='finance.transaction'),
+        ),
+        migrations.AlterField(
+            model_name='transferlink',
+            name='out_tx',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='transfer_out_link', to='finance.transaction'),
+        ),
+        migrations.RunPython(partition_transactions, unpartition_transactions),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 6.0 on 2026-10-19 10:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0015_transaction_partitioning'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    # สร้าง index ใหม่ก่อน แล้วค่อยลบของเดิม (ไม่มีช่วงที่ query ไม่มี index ใช้)
+    operations = [
+        migrations.AddIndex(
+            model_name='recurringtransaction',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['next_run_at'], name='finance_rt_due'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['owner', 'type', 'occurred_at'], include=('base_amount', 'category', 'merchant', 'merchant_ref'), name='finance_tx_live_type_time'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['owner', 'occurred_at'], include=('type', 'base_amount'), name='finance_tx_live_time'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('is_deleted', False)), fields=['owner', 'wallet', 'occurred_at'], include=('type', 'amount'), name='finance_tx_live_wallet_time'),
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='finance_tra_owner_i_a7bcee_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='finance_tra_owner_i_903a4e_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='finance_tra_owner_i_24824b_idx',
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 6.0 on 2026-10-19 10:46
+
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def stamp_deleted(apps, schema_editor):
+    # แถวที่ลบไปก่อนมี deleted_at -> เริ่มนับ grace period จากตอน migrate
+    Transaction = apps.get_model("finance", "Transaction")
+    Transaction.objects.using(schema_editor.connection.alias).filter(
+        is_deleted=True, deleted_at__isnull=True
+    ).update(deleted_at=timezone.now())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0016_transaction_covering_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(stamp_deleted, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('is_deleted', True)), fields=['owner', 'deleted_at'], name='finance_tx_trash'),
+        ),
+    ]
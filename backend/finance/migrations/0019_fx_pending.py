@@ -0,0 +1,29 @@
+# Generated by Django 6.0 on 2026-10-19 11:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0018_basecurrencyrebase'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='aiinsight',
+            name='stale',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='fx_pending',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['currency', 'occurred_at'], name='finance_tx_currency_time'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-19 11:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0021_sync_change_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='requestprofile',
+            name='token_id',
+            field=models.CharField(blank=True, editable=False, max_length=32, null=True, unique=True),
+        ),
+    ]
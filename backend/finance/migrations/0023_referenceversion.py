@@ -0,0 +1,27 @@
+# Generated by Django 6.0 on 2026-10-19 11:58
+
+from django.db import migrations, models
+
+
+def create_row(apps, schema_editor):
+    # แถวเดียวของ services_etag (ทุก shard มีตารางนี้ด้วย)
+    ReferenceVersion = apps.get_model("finance", "ReferenceVersion")
+    ReferenceVersion.objects.using(schema_editor.connection.alias).get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('finance', '0022_requestprofile_token_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReferenceVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_row, migrations.RunPython.noop),
+    ]
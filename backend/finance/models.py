@@ -1,5 +1,7 @@
 from django.conf import settings
-from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router
+from django.db import transaction as db_transaction
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
@@ -15,7 +17,46 @@ class Currency(models.Model):
         return self.code
 
 
-class Wallet(models.Model):
+class SyncTracked(models.Model):
+    """
+    model ที่ client sync แบบ delta ได้ (GET /api/sync/ ดู services_sync.py)
+    - change_seq: เลขลำดับการเปลี่ยนแปลงต่อ user (เพิ่มขึ้นเรื่อย ๆ) ตั้งใหม่ทุกครั้งที่ save
+    - delete จริง -> เขียน SyncTombstone + ขยับ seq ของแถวที่ถูก SET_NULL ตาม
+    update/bulk ที่ไม่ผ่าน save ต้องใช้ services_sync.touch / stamp
+    """
+    change_seq = models.BigIntegerField(default=0, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, **kwargs):
+        from .services_sync import next_seq
+
+        using = kwargs.get("using") or router.db_for_write(type(self), instance=self)
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "change_seq"}
+        # ถือ lock ของ counter ไว้จน commit: seq ที่ client เห็นเรียงตามลำดับ commit
+        with db_transaction.atomic(using=using, savepoint=False):
+            self.change_seq = next_seq(using, self.owner_id)
+            super().save(**kwargs)
+
+    save.alters_data = True
+
+    def delete(self, using=None, keep_parents=False):
+        from .services_sync import record_deleted, touch
+
+        using = using or router.db_for_write(type(self), instance=self)
+        with db_transaction.atomic(using=using, savepoint=False):
+            for rel in self._meta.related_objects:
+                if rel.on_delete is models.SET_NULL and issubclass(rel.related_model, SyncTracked):
+                    touch(rel.related_model._base_manager.using(using).filter(**{rel.field.name: self}))
+            record_deleted(using, [(self._meta.label_lower, self.owner_id, self.pk)])
+            return super().delete(using=using, keep_parents=keep_parents)
+
+    delete.alters_data = True
+
+
+class Wallet(SyncTracked):
     class WalletType(models.TextChoices):
         CASH = "cash", "Cash"
         BANK = "bank", "Bank"
@@ -35,6 +76,7 @@ class Wallet(models.Model):
 
     class Meta:
         unique_together = [("owner", "name")]
+        indexes = [models.Index(fields=["owner", "change_seq"], name="finance_wallet_sync")]
 
     def __str__(self):
         return f"{self.owner.username} - {self.name} ({self.currency.code})"
@@ -60,7 +102,7 @@ class FxRate(models.Model):
         return f"{self.date} 1 {self.base.code} = {self.rate} {self.quote.code}"
 
 
-class Category(models.Model):
+class Category(SyncTracked):
     class CategoryType(models.TextChoices):
         EXPENSE = "expense", "Expense"
         INCOME = "income", "Income"
@@ -72,13 +114,55 @@ class Category(models.Model):
 
     class Meta:
         unique_together = [("owner", "type", "name")]
-        indexes = [models.Index(fields=["owner", "type"])]
+        indexes = [
+            models.Index(fields=["owner", "type"]),
+            models.Index(fields=["owner", "change_seq"], name="finance_category_sync"),
+        ]
 
     def __str__(self):
         return f"{self.owner.username} - {self.type}:{self.name}"
 
 
-class Transaction(models.Model):
+class Merchant(models.Model):
+    """
+    ร้านค้าที่ normalize แล้ว (ต่อ user)
+    key = ชื่อที่ตัดเลขสาขา/สัญลักษณ์ออก เช่น "STARBUCKS #123" -> "starbucks"
+    """
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="merchants")
+    key = models.CharField(max_length=120)
+    name = models.CharField(max_length=120)  # ชื่อที่แสดง
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [("owner", "key")]
+
+    def __str__(self):
+        return f"{self.owner.username} - {self.name}"
+
+
+class MerchantAlias(models.Model):
+    """
+    กฎ map ชื่อร้านดิบ -> Merchant (เทียบกับ key ที่ normalize แล้ว)
+    """
+    class MatchType(models.TextChoices):
+        EXACT = "exact", "Exact"
+        PREFIX = "prefix", "Prefix"
+        CONTAINS = "contains", "Contains"
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="merchant_aliases")
+    pattern = models.CharField(max_length=120)
+    match_type = models.CharField(max_length=10, choices=MatchType.choices, default=MatchType.PREFIX)
+    merchant = models.ForeignKey(Merchant, on_delete=models.CASCADE, related_name="aliases")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [("owner", "pattern", "match_type")]
+
+    def __str__(self):
+        return f"{self.match_type}:{self.pattern} -> {self.merchant.name}"
+
+
+class Transaction(SyncTracked):
     class TxType(models.TextChoices):
         EXPENSE = "expense", "Expense"
         INCOME = "income", "Income"
@@ -98,28 +182,66 @@ class Transaction(models.Model):
     # แปลงเป็น base currency ของ user
     fx_rate = models.DecimalField(max_digits=18, decimal_places=8, default=Decimal("1.0"))
     base_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    # ยังไม่มี FX rate ของวันนั้น (allow_pending_fx): base_amount = 0 จนกว่า rate จะมา (services_fx.py)
+    fx_pending = models.BooleanField(default=False)
 
     category = models.ForeignKey(Category, null=True, blank=True, on_delete=models.SET_NULL, related_name="transactions")
     merchant = models.CharField(max_length=120, blank=True, default="")
+    # merchant ที่ normalize แล้ว (ใช้ group ใน report)
+    merchant_ref = models.ForeignKey(
+        Merchant, null=True, blank=True, on_delete=models.SET_NULL, related_name="transactions"
+    )
     note = models.TextField(blank=True, default="")
     receipt_url = models.CharField(max_length=500, blank=True, default="")
 
     receipt_file = models.ImageField(upload_to="receipts/%Y/%m/", null=True, blank=True)
 
     is_deleted = models.BooleanField(default=False)
+    # เวลาที่ soft delete: เกิน TRANSACTION_PURGE_AFTER_DAYS -> archive แล้วลบจริง (services_archive.py)
+    deleted_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
+        # query ของแอปแทบทั้งหมด: owner + is_deleted=False + ช่วง occurred_at (+ type)
+        # -> partial index เฉพาะแถวที่ยังไม่ลบ + INCLUDE คอลัมน์ที่ sum/group ให้เป็น index-only scan (postgres)
         indexes = [
-            models.Index(fields=["owner", "occurred_at"]),
-            models.Index(fields=["owner", "type"]),
-            models.Index(fields=["owner", "is_deleted"]),
+            # summary / by-category / top-merchants / budget status / สถิติ AI
+            models.Index(
+                fields=["owner", "type", "occurred_at"],
+                include=["base_amount", "category", "merchant", "merchant_ref"],
+                condition=models.Q(is_deleted=False),
+                name="finance_tx_live_type_time",
+            ),
+            # trend + list ของ transaction (เรียง -occurred_at)
+            models.Index(
+                fields=["owner", "occurred_at"],
+                include=["type", "base_amount"],
+                condition=models.Q(is_deleted=False),
+                name="finance_tx_live_time",
+            ),
+            # wallet-balances (ยอดต่อ wallet ถึงวันที่ as_of)
+            models.Index(
+                fields=["owner", "wallet", "occurred_at"],
+                include=["type", "amount"],
+                condition=models.Q(is_deleted=False),
+                name="finance_tx_live_wallet_time",
+            ),
+            # ถังขยะของ user + job purge (เฉพาะแถวที่ลบแล้ว index เล็ก)
+            models.Index(
+                fields=["owner", "deleted_at"],
+                condition=models.Q(is_deleted=True),
+                name="finance_tx_trash",
+            ),
+            # FX rate ของวันหนึ่งถูกเพิ่ม/แก้ -> หา transaction ของสกุลนั้นในวันนั้น (ทุก user)
+            models.Index(fields=["currency", "occurred_at"], name="finance_tx_currency_time"),
+            # delta sync (GET /api/sync/) รวมแถวที่ลบแล้วด้วย
+            models.Index(fields=["owner", "change_seq"], name="finance_tx_sync"),
         ]
 
     def __str__(self):
         return f"{self.owner.username} {self.type} {self.amount} {self.currency.code}"
     
-class Budget(models.Model):
+class Budget(SyncTracked):
     class Scope(models.TextChoices):
         TOTAL = "total", "Total"
         CATEGORY = "category", "Category"
@@ -146,15 +268,46 @@ class Budget(models.Model):
         indexes = [
             models.Index(fields=["owner", "month"]),
             models.Index(fields=["owner", "month", "scope"]),
+            models.Index(fields=["owner", "change_seq"], name="finance_budget_sync"),
         ]
 
     def __str__(self):
         extra = f" ({self.category.name})" if self.scope == "category" and self.category else ""
         return f"{self.owner.username} {self.month} {self.scope}{extra}"
         
+class CategoryRule(models.Model):
+    """
+    กฎจัดหมวดอัตโนมัติ (เงื่อนไขที่ไม่ว่าง ต้องตรงทั้งหมด)
+    priority น้อย = เช็คก่อน
+    """
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="category_rules")
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="rules")
+
+    merchant_contains = models.CharField(max_length=120, blank=True, default="")
+    min_amount = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    max_amount = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    wallet = models.ForeignKey(Wallet, null=True, blank=True, on_delete=models.CASCADE, related_name="category_rules")
+
+    priority = models.PositiveIntegerField(default=100)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["owner", "is_active"])]
+
+    def __str__(self):
+        return f"{self.owner.username} rule -> {self.category.name}"
+
+
 class TransferLink(models.Model):
-    out_tx = models.OneToOneField("finance.Transaction", on_delete=models.CASCADE, related_name="transfer_out_link")
-    in_tx = models.OneToOneField("finance.Transaction", on_delete=models.CASCADE, related_name="transfer_in_link")
+    # ไม่มี FK constraint ใน DB: Transaction เป็น partitioned table (PK = id + occurred_at, ดู partitioning.py)
+    # cascade ตอนลบยังทำผ่าน ORM ตามปกติ
+    out_tx = models.OneToOneField(
+        "finance.Transaction", on_delete=models.CASCADE, related_name="transfer_out_link", db_constraint=False
+    )
+    in_tx = models.OneToOneField(
+        "finance.Transaction", on_delete=models.CASCADE, related_name="transfer_in_link", db_constraint=False
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -164,12 +317,13 @@ class TransferLink(models.Model):
 class Receipt(models.Model):
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="receipts")
     file = models.ImageField(upload_to="receipts/%Y/%m/")
+    checksum = models.CharField(max_length=64, blank=True, default="")  # sha256 ของไฟล์
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
         return f"Receipt {self.id} by {self.owner.username}"
 
-class RecurringTransaction(models.Model):
+class RecurringTransaction(SyncTracked):
     class Frequency(models.TextChoices):
         DAILY = "daily", "Daily"
         WEEKLY = "weekly", "Weekly"
@@ -197,6 +351,13 @@ class RecurringTransaction(models.Model):
     is_active = models.BooleanField(default=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # run_due: is_active=True AND next_run_at <= now
+            models.Index(fields=["next_run_at"], condition=models.Q(is_active=True), name="finance_rt_due"),
+            models.Index(fields=["owner", "change_seq"], name="finance_rt_sync"),
+        ]
+
     def __str__(self):
         return f"{self.owner.username} {self.type} {self.amount} {self.frequency}/{self.interval}"
     
@@ -211,6 +372,8 @@ class AiInsight(models.Model):
     language = models.CharField(max_length=10, default="th")  # th/en
     content = models.TextField()  # ข้อความสรุปจาก AI
     meta = models.JSONField(default=dict, blank=True)  # เก็บตัวเลขที่ส่งให้ AI
+    # ยอดของเดือนนี้เปลี่ยนหลังสรุป (FX rate มาทีหลัง / เปลี่ยน base currency) -> ควร generate ใหม่
+    stale = models.BooleanField(default=False)
 
     created_at = models.DateTimeField(auto_now_add=True)
 
@@ -220,3 +383,141 @@ class AiInsight(models.Model):
 
     def __str__(self):
         return f"{self.owner.username} {self.month} {self.kind} ({self.language})"
+
+
+class IdempotencyKey(models.Model):
+    """
+    ผลของ POST ที่ส่ง header Idempotency-Key มา (ต่อ user) ไว้ replay ให้ request ซ้ำ
+    อยู่ shard เดียวกับข้อมูลของ user: เขียน key กับ transaction ใน DB transaction เดียวกัน
+    """
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="idempotency_keys")
+    key = models.CharField(max_length=255)
+    # sha256 ของ method + path + body: key เดิมแต่ request ต่าง -> 422
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    response = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["owner", "key"], name="finance_idempotency_owner_key")]
+        indexes = [models.Index(fields=["expires_at"])]
+
+    def __str__(self):
+        return f"{self.owner_id} {self.key}"
+
+
+class SyncCounter(models.Model):
+    """
+    change_seq ล่าสุดของ user (services_sync.next_seq) อยู่ shard เดียวกับข้อมูล
+    purged_seq: tombstone ที่ seq <= ค่านี้ถูกลบไปแล้ว -> cursor ที่เก่ากว่าต้อง sync ใหม่ทั้งหมด
+    """
+    owner = models.OneToOneField(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name="sync_counter"
+    )
+    value = models.BigIntegerField(default=0)
+    purged_seq = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.owner_id} @ {self.value}"
+
+
+class ReferenceVersion(models.Model):
+    """
+    version ของข้อมูลอ้างอิงที่ทุก user ใช้ร่วมกัน (Currency / FxRate) มีแถวเดียว
+    เพิ่มทุกครั้งที่ save/delete (services_etag.bump_reference_version) -> ETag ของทุก user เปลี่ยนตาม
+    """
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return str(self.value)
+
+
+class SyncTombstone(models.Model):
+    """
+    แถวของ SyncTracked ที่ถูกลบจริง (client ต้องลบตาม) เก็บ SYNC_TOMBSTONE_RETENTION_DAYS
+    """
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="sync_tombstones")
+    model = models.CharField(max_length=64)  # label เช่น finance.transaction
+    object_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["owner", "change_seq"]),
+            models.Index(fields=["deleted_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.model}#{self.object_id} @ {self.change_seq}"
+
+
+def request_profile_storage():
+    # เก็บนอก MEDIA_ROOT (ไม่ถูกเสิร์ฟเป็น media) ดาวน์โหลดผ่าน admin เท่านั้น
+    from django.core.files.storage import FileSystemStorage
+
+    return FileSystemStorage(location=settings.REQUEST_PROFILE_ROOT)
+
+
+class RequestProfile(models.Model):
+    """
+    ผล profile ของ request เดียว (staff สั่งผ่าน token ดู config.profiling)
+    """
+    class Mode(models.TextChoices):
+        CPROFILE = "cprofile", "cProfile (.prof)"
+        SAMPLE = "sample", "Sampling (folded stacks)"
+
+    # user ของ request (เจ้าของข้อมูลที่ช้า) และ staff ที่ออก token
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    # id ของ token ที่ใช้ (token ใช้ได้ครั้งเดียว)
+    token_id = models.CharField(max_length=32, unique=True, null=True, blank=True, editable=False)
+
+    mode = models.CharField(max_length=10, choices=Mode.choices, default=Mode.CPROFILE)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=500)
+    route = models.CharField(max_length=200, blank=True, default="")
+    status_code = models.PositiveSmallIntegerField()
+    duration_ms = models.FloatField()
+    file = models.FileField(upload_to="%Y/%m/", storage=request_profile_storage)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"{self.method} {self.route or self.path} {self.duration_ms:.0f}ms"
+
+
+class BaseCurrencyRebase(models.Model):
+    """
+    งานคำนวณ fx_rate/base_amount ใหม่ทั้งหมดหลัง user เปลี่ยน base currency (services_rebase.py)
+    อยู่ที่ default (ไม่ shard) เหมือนงานระบบอื่น ๆ
+    """
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+        CANCELLED = "cancelled", "Cancelled"
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="currency_rebases")
+    from_currency = models.CharField(max_length=3)
+    to_currency = models.CharField(max_length=3)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    # {"transactions": {"done": 1200, "total": 5000}, "budgets": {...}, "missing_rates": [...]}
+    progress = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default="")
+    requested_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["owner", "status"]),
+            models.Index(fields=["status", "requested_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.owner_id} {self.from_currency}->{self.to_currency} ({self.status})"
@@ -0,0 +1,232 @@
+"""
+Transaction แบ่ง partition รายเดือนตาม occurred_at (PostgreSQL declarative range partitioning)
+
+- migration 0015 แปลงตารางเดิมเป็น partitioned table (sqlite ข้าม)
+- partition ละ 1 เดือน (ตาม TIME_ZONE ของระบบ) + default partition กันแถวที่ไม่มี partition รองรับ
+- PK เป็น (id, occurred_at) เพราะ PK ของ partitioned table ต้องมี partition key
+  id ยัง unique จาก sequence เดียวกัน และ FK ที่ชี้มาที่ Transaction ใช้ db_constraint=False
+- query ที่มีช่วงเวลาต้อง filter occurred_at ตรง ๆ (gte/lt) ไม่ใช่ occurred_at__date ถึงจะ prune ได้
+- สร้าง partition ล่วงหน้า: ensure_transaction_partitions_task (Celery beat วันละครั้ง)
+  หรือ `manage.py transaction_partitions --ensure`
+
+archive partition เก่า:
+  1) manage.py transaction_partitions --detach-before 2023-01
+     (DETACH PARTITION ล็อก parent สั้น ๆ แต่รอ query ที่ค้างอยู่ ทำช่วงคนใช้น้อย)
+     ตารางที่ detach แล้วยังอยู่ครบ แต่ไม่อยู่ใน query ของแอปอีก
+  2) pg_dump -t finance_transaction_p2022_12 ... > finance_transaction_p2022_12.sql (เก็บไว้ที่ storage ถูก ๆ)
+  3) DROP TABLE finance_transaction_p2022_12
+  เอากลับมา: restore ตาราง แล้ว
+     ALTER TABLE finance_transaction ATTACH PARTITION finance_transaction_p2022_12
+         FOR VALUES FROM ('2022-12-01 00:00+07') TO ('2023-01-01 00:00+07');
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+TABLE = "finance_transaction"
+DEFAULT_PARTITION = f"{TABLE}_default"
+SEQUENCE = f"{TABLE}_id_seq"
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, months: int) -> date:
+    y, m = divmod(d.month - 1 + months, 12)
+    return date(d.year + y, m + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"{TABLE}_p{month:%Y_%m}"
+
+
+def month_bounds(month: date):
+    """
+    [ต้นเดือน, ต้นเดือนถัดไป) ตาม timezone ของระบบ
+    """
+    tz = timezone.get_current_timezone()
+    return (
+        datetime.combine(month, time.min, tzinfo=tz),
+        datetime.combine(add_months(month, 1), time.min, tzinfo=tz),
+    )
+
+
+def day_bounds(first: date, last: date = None):
+    """
+    [first 00:00, วันถัดจาก last 00:00) ตาม timezone ของระบบ (เท่ากับ occurred_at__date ระหว่าง first..last)
+    filter occurred_at ตรง ๆ -> ใช้ index และ prune partition รายเดือนได้
+    """
+    tz = timezone.get_current_timezone()
+    return (
+        datetime.combine(first, time.min, tzinfo=tz),
+        datetime.combine((last or first) + timedelta(days=1), time.min, tzinfo=tz),
+    )
+
+
+def is_partitioned(connection) -> bool:
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as c:
+        c.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+        row = c.fetchone()
+    return bool(row) and row[0] == "p"
+
+
+def list_partitions(connection):
+    """
+    [(ชื่อ partition, ช่วงค่า), ...] เรียงตามชื่อ (= ตามเดือน)
+    """
+    with connection.cursor() as c:
+        c.execute(
+            """
+            SELECT child.relname, pg_get_expr(child.relpartbound, child.oid)
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(%s)
+            ORDER BY child.relname
+            """,
+            [TABLE],
+        )
+        return c.fetchall()
+
+
+def create_partition(connection, month: date):
+    """
+    สร้าง partition ของเดือนนี้ (มีแล้ว -> None)
+    แถวของเดือนนี้ที่ตกไปอยู่ใน default partition จะถูกย้ายเข้า partition ใหม่
+    """
+    name = partition_name(month)
+    lo, hi = month_bounds(month)
+    with db_transaction.atomic(using=connection.alias), connection.cursor() as c:
+        c.execute("SELECT to_regclass(%s) IS NOT NULL", [name])
+        if c.fetchone()[0]:
+            return None
+        c.execute(f"CREATE TABLE {name} (LIKE {TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        c.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE occurred_at >= %s AND occurred_at < %s RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """,
+            [lo, hi],
+        )
+        # index / PK ของ parent ถูกสร้างให้ partition ตอน attach
+        c.execute(f"ALTER TABLE {TABLE} ATTACH PARTITION {name} FOR VALUES FROM (%s) TO (%s)", [lo, hi])
+    return name
+
+
+def ensure_partitions(connection, months_ahead=3, start=None):
+    """
+    สร้าง partition ตั้งแต่เดือนของ start (default = เดือนนี้) ไปอีก months_ahead เดือน
+    คืนชื่อ partition ที่สร้างใหม่ (ไม่ใช่ postgres / ยังไม่ได้แปลงตาราง -> [])
+    """
+    if not is_partitioned(connection):
+        return []
+    first = month_start(start or timezone.localdate())
+    created = []
+    for i in range(months_ahead + 1):
+        name = create_partition(connection, add_months(first, i))
+        if name:
+            created.append(name)
+    return created
+
+
+def detach_partitions_before(connection, before: date):
+    """
+    detach partition รายเดือนที่จบก่อน before (ไม่ลบตาราง ดูขั้นตอน archive ด้านบน)
+    """
+    if not is_partitioned(connection):
+        return []
+    cutoff = partition_name(month_start(before))
+    detached = []
+    for name, _ in list_partitions(connection):
+        if name == DEFAULT_PARTITION or name >= cutoff:
+            continue
+        with connection.cursor() as c:
+            c.execute(f"ALTER TABLE {TABLE} DETACH PARTITION {name}")
+        detached.append(name)
+    return detached
+
+
+# ---------- แปลงตาราง (ใช้ใน migration) ----------
+
+def _capture(c, table):
+    """
+    index (ยกเว้น PK) + FK ของตาราง ไว้สร้างใหม่ให้ตารางที่มาแทน
+    """
+    c.execute(
+        """
+        SELECT i.relname, pg_get_indexdef(i.oid)
+        FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = to_regclass(%s) AND NOT x.indisprimary
+        """,
+        [table],
+    )
+    indexes = c.fetchall()
+    c.execute(
+        "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = to_regclass(%s) AND contype = 'f'",
+        [table],
+    )
+    foreign_keys = c.fetchall()
+    c.execute("SELECT count(*) FROM pg_constraint WHERE confrelid = to_regclass(%s) AND contype = 'f'", [table])
+    if c.fetchone()[0]:
+        raise RuntimeError(f"{table} still has incoming foreign keys (use db_constraint=False)")
+    return indexes, foreign_keys
+
+
+def rebuild_transaction_table(connection, partitioned: bool, months_ahead=3):
+    """
+    สร้างตาราง Transaction ใหม่ (partitioned หรือแบบธรรมดา) แล้ว copy ข้อมูลทั้งหมด
+    ต้องรันใน transaction (migration) - ล็อกตารางตลอดการ copy ตารางใหญ่ควรทำช่วง maintenance
+    """
+    old = f"{TABLE}_old"
+    with connection.cursor() as c:
+        indexes, foreign_keys = _capture(c, TABLE)
+
+        c.execute(f"ALTER TABLE {TABLE} RENAME TO {old}")
+        c.execute(f"ALTER INDEX {TABLE}_pkey RENAME TO {old}_pkey")
+        for name, _ in indexes:
+            c.execute(f"ALTER INDEX {name} RENAME TO {name[:58]}_old")
+
+        # sequence ของ id แยกจากตารางเดิม (identity ของตารางเดิมจะหายไปพร้อมตาราง)
+        c.execute(f"CREATE SEQUENCE IF NOT EXISTS {SEQUENCE}_new")
+        c.execute(f"SELECT setval('{SEQUENCE}_new', COALESCE((SELECT max(id) FROM {old}), 0) + 1, false)")
+
+        suffix = " PARTITION BY RANGE (occurred_at)" if partitioned else ""
+        c.execute(f"CREATE TABLE {TABLE} (LIKE {old} INCLUDING DEFAULTS INCLUDING CONSTRAINTS){suffix}")
+        c.execute(f"ALTER TABLE {TABLE} ALTER COLUMN id SET DEFAULT nextval('{SEQUENCE}_new')")
+
+        if partitioned:
+            c.execute(f"SELECT min(occurred_at) FROM {old}")
+            oldest = c.fetchone()[0]
+            today = timezone.localdate()
+            first = month_start(timezone.localtime(oldest).date() if oldest else today)
+            month = first
+            while month <= add_months(month_start(today), months_ahead):
+                lo, hi = month_bounds(month)
+                c.execute(
+                    f"CREATE TABLE {partition_name(month)} PARTITION OF {TABLE} FOR VALUES FROM (%s) TO (%s)",
+                    [lo, hi],
+                )
+                month = add_months(month, 1)
+            c.execute(f"CREATE TABLE {DEFAULT_PARTITION} PARTITION OF {TABLE} DEFAULT")
+
+        c.execute(f"INSERT INTO {TABLE} SELECT * FROM {old}")
+
+        pk = "(id, occurred_at)" if partitioned else "(id)"
+        c.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_pkey PRIMARY KEY {pk}")
+        for _, definition in indexes:
+            # index ของ partitioned table เป็น "ON ONLY" -> สร้างแบบปกติให้ตารางใหม่
+            c.execute(definition.replace(" ON ONLY ", " ON ", 1))
+        for name, definition in foreign_keys:
+            c.execute(f"ALTER TABLE {TABLE} ADD CONSTRAINT {name} {definition}")
+
+        c.execute(f"DROP TABLE {old}")
+        c.execute(f"DROP SEQUENCE IF EXISTS {SEQUENCE}")
+        c.execute(f"ALTER SEQUENCE {SEQUENCE}_new RENAME TO {SEQUENCE}")
+        c.execute(f"ALTER SEQUENCE {SEQUENCE} OWNED BY {TABLE}.id")
+        c.execute(f"ANALYZE {TABLE}")
@@ -1,6 +1,8 @@
 from django.urls import path
-from .views_receipts import ReceiptUploadView
+from .views_receipts import ReceiptUploadView, ReceiptDownloadView, SignedMediaView
 
 urlpatterns = [
     path("receipts/upload/", ReceiptUploadView.as_view()),
+    path("receipts/<int:pk>/download/", ReceiptDownloadView.as_view()),
+    path("media/s/<str:token>/", SignedMediaView.as_view(), name="signed-media"),
 ]
@@ -1,7 +1,13 @@
 from decimal import Decimal
+from django.db.models import Q
 from django.utils import timezone
 from rest_framework import serializers
-from .models import Currency, Wallet, FxRate, Category, Transaction, Budget, TransferLink
+from .models import Currency, Wallet, FxRate, Category, Transaction, Budget, TransferLink, Receipt
+from .services_media import media_name_from_url, signed_media_url
+from .services_merchants import resolve_merchant
+from .services_categorize import suggest_category_id
+from .cache_utils import TTLCache
+from config import sharding
 from django.db import transaction as db_transaction
 from django.utils import timezone
 
@@ -70,6 +76,26 @@ class CategorySerializer(serializers.ModelSerializer):
         fields = ["id", "type", "name", "parent"]
 
 
+_currency_cache = TTLCache(maxsize=1, ttl=300, name="currency")
+
+
+def _get_currency(code: str) -> Currency:
+    """
+    หา Currency จาก code โดยใช้ cache ใน process (ข้อมูลอ้างอิง เปลี่ยนน้อยมาก)
+    """
+    by_code = _currency_cache.get_or_load("all", lambda: {c.code: c for c in Currency.objects.all()})
+    currency = by_code.get(code)
+    if currency is None:
+        # เพิ่งเพิ่มใหม่และ cache ยังไม่รู้จัก
+        currency = Currency.objects.get(code=code)
+        _currency_cache.pop("all")
+    return currency
+
+
+def clear_currency_cache():
+    _currency_cache.clear()
+
+
 def _get_fx_rate(date, from_currency: Currency, to_currency: Currency) -> Decimal:
     """
     หา fx rate ที่ใช้แปลง: from_currency -> to_currency
@@ -94,6 +120,39 @@ def _get_fx_rate(date, from_currency: Currency, to_currency: Currency) -> Decima
     )
 
 
+def _get_fx_rates(pairs, to_currency: Currency) -> dict:
+    """
+    _get_fx_rate หลายคู่ใน query เดียว: pairs = {(date, from_currency)} -> {(date, from_currency.id): rate}
+    กติกาเดียวกัน (เรทตรงก่อน แล้วค่อย inverse) ขาดคู่ไหน -> ValidationError
+    """
+    rates = {(d, c.id): Decimal("1.0") for d, c in pairs if c.id == to_currency.id}
+    pending = {(d, c.id): c for d, c in pairs if c.id != to_currency.id}
+    if not pending:
+        return rates
+
+    currency_ids = {cid for _, cid in pending}
+    found = {}
+    for d, base_id, quote_id, rate in FxRate.objects.filter(
+        Q(base_id__in=currency_ids, quote=to_currency) | Q(base=to_currency, quote_id__in=currency_ids),
+        date__in={d for d, _ in pending},
+    ).values_list("date", "base_id", "quote_id", "rate"):
+        found[(d, base_id, quote_id)] = Decimal(rate)
+
+    for (d, cid), currency in sorted(pending.items(), key=lambda item: item[0]):
+        direct = found.get((d, cid, to_currency.id))
+        inv = found.get((d, to_currency.id, cid))
+        if direct is not None:
+            rates[(d, cid)] = direct
+        elif inv is not None:
+            rates[(d, cid)] = Decimal("1.0") / inv
+        else:
+            raise serializers.ValidationError(
+                f"Missing FX rate for {d}: {currency.code}->{to_currency.code}. "
+                f"Create it via /api/fx-rates/ first."
+            )
+    return rates
+
+
 class TransactionSerializer(serializers.ModelSerializer):
     wallet_id = serializers.PrimaryKeyRelatedField(queryset=Wallet.objects.all(), source="wallet", write_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
@@ -104,29 +163,39 @@ class TransactionSerializer(serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     currency = CurrencySerializer(read_only=True)
     receipt_abs_url = serializers.SerializerMethodField()
+    # ยังไม่มี FX rate ของวันนั้น -> รับไว้ก่อนเป็น fx_pending (ยอดเติมให้เมื่อ rate มา) แทน 400
+    allow_pending_fx = serializers.BooleanField(write_only=True, required=False, default=False)
 
     class Meta:
         model = Transaction
         fields = [
             "id", "type", "occurred_at", "amount",
             "wallet", "wallet_id", "currency",
-            "fx_rate", "base_amount",
+            "fx_rate", "base_amount", "fx_pending", "allow_pending_fx",
             "category", "category_id",
             "merchant", "note",
             "receipt_url", "receipt_abs_url",
-            "is_deleted", "created_at",
+            "is_deleted", "deleted_at", "created_at",
+        ]
+        read_only_fields = [
+            "currency", "fx_rate", "base_amount", "fx_pending", "is_deleted", "deleted_at", "created_at", "receipt_abs_url"
         ]
-        read_only_fields = ["currency", "fx_rate", "base_amount", "is_deleted", "created_at", "receipt_abs_url"]
     
     def get_receipt_abs_url(self, obj: Transaction):
         raw = getattr(obj, "receipt_url", None)
         if not raw:
             return None
 
+        request = self.context.get("request")
+
+        # ไฟล์ใน media ของเรา -> ออก signed URL ใหม่ทุกครั้ง (url เดิมอาจหมดอายุแล้ว)
+        name = media_name_from_url(raw)
+        if name:
+            return signed_media_url(request, name)
+
         if raw.startswith("http://") or raw.startswith("https://"):
             return raw
 
-        request = self.context.get("request")
         if not request:
             return raw
 
@@ -138,6 +207,15 @@ class TransactionSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri("/" + raw[idx:])
         return request.build_absolute_uri("/" + raw)
         
+    def validate_receipt_url(self, value: str):
+        # กันการแนบไฟล์ใน media ของคนอื่น (เพราะ get_receipt_abs_url จะเซ็น url ให้)
+        name = media_name_from_url(value)
+        if name:
+            request = self.context["request"]
+            if not Receipt.objects.filter(owner=request.user, file=name).exists():
+                raise serializers.ValidationError("Receipt not found.")
+        return value
+
     def validate_wallet(self, wallet: Wallet):
         request = self.context["request"]
         if wallet.owner_id != request.user.id:
@@ -158,23 +236,51 @@ class TransactionSerializer(serializers.ModelSerializer):
         # currency ตาม wallet เสมอ
         tx_currency = wallet.currency
         base_code = user.profile.base_currency
-        base_currency = Currency.objects.get(code=base_code)
+        base_currency = _get_currency(base_code)
 
         occurred_at = validated_data.get("occurred_at") or timezone.now()
-        date = occurred_at.date()
-
-        fx = _get_fx_rate(date, tx_currency, base_currency)
+        date = timezone.localtime(occurred_at).date()
+        allow_pending_fx = validated_data.pop("allow_pending_fx", False)
+
+        try:
+            fx, fx_pending = _get_fx_rate(date, tx_currency, base_currency), False
+        except serializers.ValidationError:
+            if not allow_pending_fx:
+                raise
+            fx, fx_pending = Decimal("0"), True
         base_amount = (Decimal(validated_data["amount"]) * fx).quantize(Decimal("0.01"))
 
+        merchant_ref = resolve_merchant(user.id, validated_data.get("merchant", ""))
+
+        # ไม่ได้เลือกหมวด -> ให้ engine เดา (rules + ประวัติของ user)
+        if not validated_data.get("category"):
+            validated_data["category_id"] = suggest_category_id(
+                user.id,
+                validated_data["type"],
+                validated_data.get("merchant", ""),
+                validated_data["amount"],
+                wallet.id,
+                merchant_ref.key if merchant_ref else None,
+            )
+            validated_data.pop("category", None)
+
         tx = Transaction.objects.create(
             owner=user,
             currency=tx_currency,
             fx_rate=fx,
             base_amount=base_amount,
+            fx_pending=fx_pending,
+            merchant_ref=merchant_ref,
             **validated_data,
         )
         return tx
 
+    def update(self, instance, validated_data):
+        validated_data.pop("allow_pending_fx", None)
+        if "merchant" in validated_data:
+            validated_data["merchant_ref"] = resolve_merchant(instance.owner_id, validated_data["merchant"])
+        return super().update(instance, validated_data)
+
 class BudgetSerializer(serializers.ModelSerializer):
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=Category.objects.all(),
@@ -259,7 +365,7 @@ class TransferCreateSerializer(serializers.Serializer):
         to_wallet: Wallet = validated_data["to_wallet"]
 
         occurred_at = validated_data.get("occurred_at") or timezone.now()
-        date = occurred_at.date()
+        date = timezone.localtime(occurred_at).date()
 
         merchant = validated_data.get("merchant", "Transfer")
         note = validated_data.get("note", "")
@@ -269,7 +375,7 @@ class TransferCreateSerializer(serializers.Serializer):
         to_currency = to_wallet.currency
 
         base_code = user.profile.base_currency
-        base_currency = Currency.objects.get(code=base_code)
+        base_currency = _get_currency(base_code)
 
         # --- OUT TX ---
         # base_amount ของ out_tx คิดจาก from_currency -> base_currency
@@ -289,7 +395,7 @@ class TransferCreateSerializer(serializers.Serializer):
         fx_in = _get_fx_rate(date, to_currency, base_currency)
         base_in = (amount_in * fx_in).quantize(Decimal("0.01"))
 
-        with db_transaction.atomic():
+        with db_transaction.atomic(using=sharding.shard_for_owner(user.pk)):
             out_tx = Transaction.objects.create(
                 owner=user,
                 wallet=from_wallet,
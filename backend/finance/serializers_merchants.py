@@ -0,0 +1,48 @@
+from rest_framework import serializers
+from .models import Merchant, MerchantAlias
+from .services_merchants import normalize_merchant_key
+
+
+class MerchantSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Merchant
+        fields = ["id", "key", "name", "created_at"]
+        read_only_fields = ["key", "created_at"]
+
+    def validate(self, attrs):
+        if "name" in attrs:
+            attrs["key"] = normalize_merchant_key(attrs["name"])
+            if not attrs["key"]:
+                raise serializers.ValidationError({"name": "Invalid merchant name."})
+
+            request = self.context["request"]
+            dup = Merchant.objects.filter(owner=request.user, key=attrs["key"])
+            if self.instance:
+                dup = dup.exclude(id=self.instance.id)
+            if dup.exists():
+                raise serializers.ValidationError({"name": "Merchant already exists."})
+        return attrs
+
+
+class MerchantAliasSerializer(serializers.ModelSerializer):
+    merchant_id = serializers.PrimaryKeyRelatedField(
+        queryset=Merchant.objects.all(), source="merchant", write_only=True
+    )
+    merchant = MerchantSerializer(read_only=True)
+
+    class Meta:
+        model = MerchantAlias
+        fields = ["id", "pattern", "match_type", "merchant", "merchant_id", "created_at"]
+        read_only_fields = ["created_at"]
+
+    def validate_pattern(self, value: str):
+        if not normalize_merchant_key(value):
+            raise serializers.ValidationError("Invalid pattern.")
+        return value
+
+    def validate(self, attrs):
+        # field ชื่อ merchant_id -> DRF ไม่เรียก validate_merchant เช็ค owner ที่นี่
+        merchant = attrs.get("merchant")
+        if merchant and merchant.owner_id != self.context["request"].user.id:
+            raise serializers.ValidationError({"merchant_id": "You do not own this merchant."})
+        return attrs
@@ -1,23 +1,33 @@
 from rest_framework import serializers
 from .models import Receipt
+from .services_media import signed_media_url
 
 class ReceiptUploadSerializer(serializers.ModelSerializer):
     file_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Receipt
-        fields = ["id", "file", "file_url", "created_at"]
-        read_only_fields = ["id", "file_url", "created_at"]
+        fields = ["id", "file", "file_url", "checksum", "created_at"]
+        read_only_fields = ["id", "file_url", "checksum", "created_at"]
 
     def get_file_url(self, obj: Receipt):
         if not obj.file:
             return None
-        url = obj.file.url
-        request = self.context.get("request")
-        return request.build_absolute_uri(url) if request else url
+        # signed URL อายุสั้น แทน /media/ ที่เปิด public
+        return signed_media_url(self.context.get("request"), obj.file.name)
 
     def validate_file(self, f):
         max_size = 5 * 1024 * 1024
         if f.size > max_size:
             raise serializers.ValidationError("File too large. Max 5MB.")
-        return f
\ No newline at end of file
+        return f
+
+    def create(self, validated_data):
+        f = validated_data["file"]
+        storage_name = getattr(f, "storage_name", None)
+        if storage_name:
+            # upload handler เขียนไฟล์ลง storage แล้ว -> เก็บแค่ชื่อ ไม่ต้อง copy ซ้ำ
+            f.close()
+            validated_data["file"] = storage_name
+            validated_data["checksum"] = f.checksum
+        return super().create(validated_data)
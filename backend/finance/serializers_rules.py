@@ -0,0 +1,46 @@
+from rest_framework import serializers
+from .models import CategoryRule, Category, Wallet
+from .serializers import CategorySerializer
+
+
+class CategoryRuleSerializer(serializers.ModelSerializer):
+    category_id = serializers.PrimaryKeyRelatedField(
+        queryset=Category.objects.all(), source="category", write_only=True
+    )
+    wallet_id = serializers.PrimaryKeyRelatedField(
+        queryset=Wallet.objects.all(), source="wallet", write_only=True, required=False, allow_null=True
+    )
+    category = CategorySerializer(read_only=True)
+    is_active = serializers.BooleanField(default=True)
+
+    class Meta:
+        model = CategoryRule
+        fields = [
+            "id",
+            "category", "category_id",
+            "merchant_contains",
+            "min_amount", "max_amount",
+            "wallet_id",
+            "priority",
+            "is_active",
+            "created_at",
+        ]
+        read_only_fields = ["created_at"]
+
+    def validate(self, attrs):
+        user = self.context["request"].user
+
+        category = attrs.get("category")
+        if category and category.owner_id != user.id:
+            raise serializers.ValidationError("You do not own this category")
+
+        wallet = attrs.get("wallet")
+        if wallet and wallet.owner_id != user.id:
+            raise serializers.ValidationError("You do not own this wallet")
+
+        min_amt = attrs.get("min_amount")
+        max_amt = attrs.get("max_amount")
+        if min_amt is not None and max_amt is not None and min_amt > max_amt:
+            raise serializers.ValidationError("min_amount must be <= max_amount")
+
+        return attrs
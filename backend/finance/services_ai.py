@@ -1,5 +1,7 @@
+import time
 from decimal import Decimal
-from django.db.models import Sum
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.utils.dateparse import parse_date
 from datetime import date
@@ -7,7 +9,10 @@ from datetime import date
 from openai import OpenAI
 from django.conf import settings
 
+from config import metrics, sharding
+from config.db_routers import read_from_replica
 from .models import Transaction, AiInsight
+from .partitioning import month_bounds
 
 
 def month_range(month: str):
@@ -22,44 +27,50 @@ def month_range(month: str):
     return start, end  # [start, end)
 
 
+@read_from_replica
 def build_monthly_stats(user, month: str):
-    start, end = month_range(month)
+    # ช่วงเวลาของเดือน (datetime) -> filter occurred_at ตรง ๆ ให้ prune partition ได้
+    start, end = month_bounds(month_range(month)[0])
 
     qs = Transaction.objects.filter(
         owner=user,
         is_deleted=False,
-        occurred_at__date__gte=start,
-        occurred_at__date__lt=end,
+        occurred_at__gte=start,
+        occurred_at__lt=end,
     )
 
-    income = qs.filter(type="income").aggregate(s=Sum("base_amount"))["s"] or Decimal("0")
-    expense = qs.filter(type="expense").aggregate(s=Sum("base_amount"))["s"] or Decimal("0")
+    # ยอดรวม + count ใน query เดียว, top categories / merchants (expense) -> 3 query ที่ไม่ขึ้นต่อกัน รันพร้อมกัน
+    totals, by_cat, by_mer = sharding.gather(
+        lambda: qs.aggregate(
+            income=Sum("base_amount", filter=Q(type="income")),
+            expense=Sum("base_amount", filter=Q(type="expense")),
+            count=Count("id"),
+        ),
+        lambda: list(
+            qs.filter(type="expense")
+            .values("category__name")
+            .annotate(total=Sum("base_amount"))
+            .order_by("-total")[:5]
+        ),
+        lambda: list(
+            qs.filter(type="expense")
+            .exclude(merchant="")
+            .values(merchant_name=Coalesce("merchant_ref__name", "merchant"))
+            .annotate(total=Sum("base_amount"))
+            .order_by("-total")[:5]
+        ),
+    )
+
+    income = totals["income"] or Decimal("0")
+    expense = totals["expense"] or Decimal("0")
     net = income - expense
+    count = totals["count"]
 
-    # top categories (expense)
-    by_cat = (
-        qs.filter(type="expense")
-        .values("category__name")
-        .annotate(total=Sum("base_amount"))
-        .order_by("-total")[:5]
-    )
     top_categories = [
         {"category": r["category__name"] or "Uncategorized", "total": str(r["total"] or 0)}
         for r in by_cat
     ]
-
-    # top merchants (expense)
-    by_mer = (
-        qs.filter(type="expense")
-        .exclude(merchant="")
-        .values("merchant")
-        .annotate(total=Sum("base_amount"))
-        .order_by("-total")[:5]
-    )
-    top_merchants = [{"merchant": r["merchant"], "total": str(r["total"] or 0)} for r in by_mer]
-
-    # count
-    count = qs.count()
+    top_merchants = [{"merchant": r["merchant_name"], "total": str(r["total"] or 0)} for r in by_mer]
 
     return {
         "month": month,
@@ -114,14 +125,21 @@ Format:
 - 3 actionable recommendations for next month
 """
 
-    resp = client.chat.completions.create(
-        model=model,
-        messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.3,
-    )
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        resp = client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system},
+                {"role": "user", "content": user_prompt},
+            ],
+            temperature=0.3,
+        )
+        outcome = "ok"
+    finally:
+        metrics.AI_LATENCY.labels("openai", model, outcome).observe(time.perf_counter() - start)
+    metrics.observe_ai_usage("openai", model, getattr(resp, "usage", None))
 
     return resp.choices[0].message.content.strip()
 
@@ -141,7 +159,7 @@ def generate_monthly_summary(user, month: str, language: str = "th"):
         month=month,
         kind=AiInsight.Kind.MONTHLY_SUMMARY,
         language=language,
-        defaults={"content": text, "meta": {**stats, "provider": used_provider}},
+        defaults={"content": text, "meta": {**stats, "provider": used_provider}, "stale": False},
     )
     return insight
 
@@ -0,0 +1,189 @@
+"""
+ลบ transaction ที่ soft delete เกิน TRANSACTION_PURGE_AFTER_DAYS ออกจากตารางจริง
+- ก่อนลบ เขียนแถว (+ TransferLink ที่ผูกอยู่) เป็น JSONL gzip ลง storage (TRANSACTION_ARCHIVE_DIR)
+- ทำทีละ chunk: 1 chunk = 1 transaction สั้น ๆ (ล็อกเฉพาะแถวใน chunk) ไม่ล็อกตารางนาน
+- ระหว่าง grace period user กู้คืนเองได้ (POST /api/transactions/restore/)
+- เกินนั้นกู้จากไฟล์ archive: manage.py purge_deleted_transactions --restore <ไฟล์>
+"""
+import gzip
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction as db_transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from config import sharding
+
+from .models import Transaction, TransferLink
+from .services_sync import record_deleted, stamp, touch
+
+DEFAULT_CHUNK_SIZE = 1000
+DATETIME_FIELDS = ("occurred_at", "created_at", "deleted_at")
+
+
+def purge_cutoff(now=None):
+    return (now or timezone.now()) - timedelta(days=settings.TRANSACTION_PURGE_AFTER_DAYS)
+
+
+def _archive_name(shard, ids):
+    return f"{settings.TRANSACTION_ARCHIVE_DIR}/{shard}/{timezone.now():%Y/%m/%Y%m%d-%H%M%S}-{ids[0]}-{ids[-1]}.jsonl.gz"
+
+
+def _write_archive(shard, ids, rows, links):
+    """
+    1 บรรทัด = {"model": "transaction" | "transferlink", "fields": {...}}
+    datetime/Decimal เก็บเป็น str เต็มความละเอียด (DjangoJSONEncoder ตัด microsecond)
+    """
+    lines = [json.dumps({"model": "transaction", "fields": r}, default=str) for r in rows]
+    lines += [json.dumps({"model": "transferlink", "fields": r}, default=str) for r in links]
+    data = gzip.compress(("\n".join(lines) + "\n").encode())
+    return default_storage.save(_archive_name(shard, ids), ContentFile(data))
+
+
+def _purgeable(cutoff, prefix=""):
+    return Q(**{f"{prefix}is_deleted": True, f"{prefix}deleted_at__lt": cutoff})
+
+
+def _purge_chunk(cutoff, chunk_size, skipped):
+    """
+    archive + ลบ 1 chunk ใน shard ปัจจุบัน คืน (จำนวน transaction, จำนวน link, ชื่อไฟล์) / None ถ้าหมดแล้ว
+    transfer: ลบสองขาพร้อมกัน (ไฟล์เดียวกัน -> restore ได้ link คืน) อีกขายังไม่ถึงเวลาลบ -> ข้ามทั้งคู่ไว้ก่อน
+    skipped: id ที่ข้ามในรอบนี้ (อีกขาถูกล็อกอยู่) ไม่หยิบซ้ำใน chunk ถัดไป
+    """
+    shard = sharding.current_shard()
+    with db_transaction.atomic(using=shard):
+        partner_kept = Exists(
+            TransferLink.objects.filter(out_tx_id=OuterRef("pk")).exclude(_purgeable(cutoff, "in_tx__"))
+        ) | Exists(
+            TransferLink.objects.filter(in_tx_id=OuterRef("pk")).exclude(_purgeable(cutoff, "out_tx__"))
+        )
+        # skip_locked: แถวที่ user กำลังกู้คืนอยู่ค่อยไปรอบหน้า
+        ids = set(
+            Transaction.objects.filter(_purgeable(cutoff))
+            .exclude(partner_kept)
+            .exclude(pk__in=skipped)
+            .order_by("pk")
+            .select_for_update(skip_locked=True)
+            .values_list("pk", flat=True)[:chunk_size]
+        )
+        if not ids:
+            return None
+
+        links = list(TransferLink.objects.filter(Q(out_tx_id__in=ids) | Q(in_tx_id__in=ids)).values())
+        partners = {pk for link in links for pk in (link["out_tx_id"], link["in_tx_id"])} - ids
+        if partners:
+            # อีกขาที่อยู่นอก chunk นี้ -> ลบรอบเดียวกัน (ล็อกไม่ได้ / ถูกกู้คืนไปแล้ว -> ข้ามขานี้ด้วย)
+            partners_locked = set(
+                Transaction.objects.filter(_purgeable(cutoff), pk__in=partners)
+                .select_for_update(skip_locked=True)
+                .values_list("pk", flat=True)
+            )
+            ids |= partners_locked
+            for link in links:
+                legs = (link["out_tx_id"], link["in_tx_id"])
+                if not all(pk in ids for pk in legs):
+                    ids.difference_update(legs)
+                    skipped.update(legs)
+            links = [link for link in links if link["out_tx_id"] in ids]
+            if not ids:
+                return 0, 0, None
+
+        ids = sorted(ids)
+        rows = list(Transaction.objects.filter(pk__in=ids).order_by("pk").values())
+        link_qs = TransferLink.objects.filter(pk__in=[link["id"] for link in links])
+        name = _write_archive(shard, ids, rows, links)
+
+        link_qs.delete()
+        Transaction.objects.filter(pk__in=ids).delete()
+        record_deleted(shard, [(Transaction._meta.label_lower, r["owner_id"], r["id"]) for r in rows])
+    return len(rows), len(links), name
+
+
+def _purge_on_shard(cutoff, chunk_size, log):
+    purged = {"transactions": 0, "links": 0, "files": []}
+    skipped = set()
+    while True:
+        result = _purge_chunk(cutoff, chunk_size, skipped)
+        if result is None:
+            return purged
+        n_tx, n_links, name = result
+        if name is None:
+            continue
+        purged["transactions"] += n_tx
+        purged["links"] += n_links
+        purged["files"].append(name)
+        if log:
+            log(f"{sharding.current_shard()}: archived {n_tx} transactions, {n_links} links -> {name}")
+
+
+def purge_deleted_transactions(chunk_size=DEFAULT_CHUNK_SIZE, now=None, log=None):
+    """
+    archive + ลบ transaction ที่ soft delete ก่อน purge_cutoff() ทุก shard
+    คืน {shard: {"transactions": n, "links": n, "files": [...]}}
+    """
+    return sharding.fan_out(_purge_on_shard, purge_cutoff(now), chunk_size, log)
+
+
+def restore_transactions(owner, ids=None):
+    """
+    กู้คืน transaction ที่ soft delete (ยังไม่ถูก purge) ids=None -> ทั้งถังขยะ คืนจำนวนที่กู้ได้
+    """
+    qs = Transaction.objects.filter(owner=owner, is_deleted=True)
+    if ids is not None:
+        qs = qs.filter(pk__in=ids)
+    return touch(qs, [owner.pk], is_deleted=False, deleted_at=None)
+
+
+def restore_archive(name):
+    """
+    โหลดไฟล์ archive กลับเข้าตาราง (แถวที่ id มีอยู่แล้วข้าม)
+    กลับมาเป็น soft delete เริ่ม grace period ใหม่ -> user กู้คืนต่อเองได้
+    คืน (จำนวน transaction, จำนวน link) ที่เพิ่มเข้าไป
+    """
+    rows, links = [], []
+    with default_storage.open(name, "rb") as f:
+        for line in gzip.decompress(f.read()).decode().splitlines():
+            if not line:
+                continue
+            item = json.loads(line)
+            (rows if item["model"] == "transaction" else links).append(item["fields"])
+    if not rows:
+        return 0, 0
+
+    now = timezone.now()
+    for r in rows:
+        for field in DATETIME_FIELDS:
+            if r.get(field):
+                r[field] = parse_datetime(r[field])
+        r["deleted_at"] = now
+
+    # ไฟล์หนึ่งมาจาก shard เดียว (ทุกแถวอยู่ shard เดียวกัน)
+    with sharding.for_owner(rows[0]["owner_id"]) as shard, db_transaction.atomic(using=shard):
+        existing = set(
+            Transaction.objects.filter(pk__in=[r["id"] for r in rows]).values_list("pk", flat=True)
+        )
+        new_rows = stamp(shard, [Transaction(**r) for r in rows if r["id"] not in existing])
+        created_at = {tx.pk: tx.created_at for tx in new_rows}
+        Transaction.objects.bulk_create(new_rows)
+        # auto_now_add ทับ created_at ตอน insert -> ใส่ค่าเดิมกลับ
+        for tx in new_rows:
+            tx.created_at = created_at[tx.pk]
+        Transaction.objects.bulk_update(new_rows, ["created_at"], batch_size=DEFAULT_CHUNK_SIZE)
+
+        present = set(
+            Transaction.objects.filter(
+                pk__in=[pk for link in links for pk in (link["out_tx_id"], link["in_tx_id"])]
+            ).values_list("pk", flat=True)
+        )
+        new_links = [
+            TransferLink(**link)
+            for link in links
+            if link["out_tx_id"] in present and link["in_tx_id"] in present
+        ]
+        TransferLink.objects.bulk_create(new_links, ignore_conflicts=True)
+    return len(new_rows), len(new_links)
@@ -0,0 +1,160 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Count
+
+from config import sharding
+
+from .cache_utils import TTLCache
+from .models import CategoryRule, Transaction
+from .services_merchants import normalize_merchant_key
+from .services_sync import touch
+
+ENGINE_CACHE_SIZE = 1000
+ENGINE_TTL_SECONDS = 60
+CATEGORIZABLE_TYPES = (Transaction.TxType.EXPENSE, Transaction.TxType.INCOME)
+
+
+class CategoryEngine:
+    """
+    จัดหมวดให้ transaction ของ user คนเดียว
+    1) user rules (ตาม priority)
+    2) learned map: merchant key + type -> หมวดที่ user ใช้บ่อยสุด
+    """
+
+    def __init__(self, rules, learned_rows):
+        self.rules = []
+        for r in rules:
+            self.rules.append((
+                r.category.type,
+                normalize_merchant_key(r.merchant_contains),
+                r.min_amount,
+                r.max_amount,
+                r.wallet_id,
+                r.category_id,
+            ))
+
+        # learned_rows: (key, type, category_id, n) เรียง n มาก -> น้อย
+        self.learned = {}
+        for key, tx_type, category_id, _n in learned_rows:
+            self.learned.setdefault((key, tx_type), category_id)
+
+    def classify(self, tx_type, merchant: str, amount, wallet_id, merchant_key=None):
+        if tx_type not in CATEGORIZABLE_TYPES:
+            return None
+
+        amount = Decimal(amount)
+        raw_key = None  # rule เทียบกับชื่อดิบ (normalize เฉพาะเมื่อมี rule แบบ contains)
+
+        for r_type, contains, min_amt, max_amt, r_wallet, category_id in self.rules:
+            if r_type != tx_type:
+                continue
+            if contains:
+                if raw_key is None:
+                    raw_key = normalize_merchant_key(merchant)
+                if contains not in raw_key:
+                    continue
+            if min_amt is not None and amount < min_amt:
+                continue
+            if max_amt is not None and amount > max_amt:
+                continue
+            if r_wallet is not None and r_wallet != wallet_id:
+                continue
+            return category_id
+
+        # learned map ใช้ key ของ Merchant ที่ link แล้ว (หลัง alias)
+        key = merchant_key if merchant_key is not None else (raw_key or normalize_merchant_key(merchant))
+        if key:
+            return self.learned.get((key, tx_type))
+        return None
+
+
+_cache = TTLCache(maxsize=ENGINE_CACHE_SIZE, ttl=ENGINE_TTL_SECONDS, name="category_engine")
+
+
+def _load_engine(owner_id) -> CategoryEngine:
+    rules = (
+        CategoryRule.objects.filter(owner_id=owner_id, is_active=True)
+        .select_related("category")
+        .order_by("priority", "id")
+    )
+    learned_rows = (
+        Transaction.objects.filter(
+            owner_id=owner_id,
+            is_deleted=False,
+            category__isnull=False,
+            merchant_ref__isnull=False,
+        )
+        .values_list("merchant_ref__key", "type", "category_id")
+        .annotate(n=Count("id"))
+        .order_by("-n")
+    )
+    with sharding.for_owner(owner_id):
+        return CategoryEngine(rules, learned_rows)
+
+
+def get_category_engine(owner_id) -> CategoryEngine:
+    return _cache.get_or_load(owner_id, lambda: _load_engine(owner_id))
+
+
+def invalidate_category_engine(owner_id):
+    _cache.pop(owner_id)
+
+
+def suggest_category_id(owner_id, tx_type, merchant, amount, wallet_id, merchant_key=None):
+    return get_category_engine(owner_id).classify(tx_type, merchant, amount, wallet_id, merchant_key)
+
+
+def categorize_uncategorized(owner_id=None, chunk_size=5000, progress=None):
+    """
+    backfill: จัดหมวดให้ transaction ที่ category ว่าง ทีละ chunk ตาม id
+    จัดหมวดใน memory แล้ว UPDATE ... WHERE id IN (...) ครั้งเดียวต่อหมวด
+    ไม่ระบุ owner -> ทำทุก shard พร้อมกัน
+    """
+    if owner_id is not None:
+        # rule อาจเพิ่งแก้ใน process อื่น (web) -> โหลด engine ใหม่
+        invalidate_category_engine(owner_id)
+        with sharding.for_owner(owner_id):
+            return _categorize_uncategorized(owner_id, chunk_size, progress)
+    return sum(sharding.fan_out(_categorize_uncategorized, None, chunk_size, progress).values())
+
+
+def _categorize_uncategorized(owner_id, chunk_size, progress):
+    qs = Transaction.objects.filter(
+        category__isnull=True,
+        is_deleted=False,
+        type__in=CATEGORIZABLE_TYPES,
+    )
+    if owner_id is not None:
+        qs = qs.filter(owner_id=owner_id)
+
+    last_id = 0
+    updated = 0
+    while True:
+        rows = list(
+            qs.filter(id__gt=last_id)
+            .order_by("id")
+            .values_list("id", "owner_id", "type", "merchant", "merchant_ref__key", "amount", "wallet_id")[:chunk_size]
+        )
+        if not rows:
+            break
+
+        ids_by_category = defaultdict(list)
+        for tx_id, owner, tx_type, merchant, key, amount, wallet_id in rows:
+            category_id = get_category_engine(owner).classify(tx_type, merchant, amount, wallet_id, key)
+            if category_id:
+                ids_by_category[(owner, category_id)].append(tx_id)
+
+        with db_transaction.atomic(using=sharding.current_shard()):
+            # เรียงตาม owner: lock ของ SyncCounter ได้ตามลำดับเดียวกันทุก job
+            for (owner, category_id), ids in sorted(ids_by_category.items()):
+                updated += touch(
+                    Transaction.objects.filter(id__in=ids, category__isnull=True), [owner], category_id=category_id
+                )
+
+        last_id = rows[-1][0]
+        if progress:
+            progress(last_id, updated)
+
+    return updated
@@ -0,0 +1,114 @@
+"""
+ETag / conditional GET ของ list + report ที่ client poll บ่อย
+- ETag มาจาก data version ของ user (SyncCounter.value: เพิ่มทุกครั้งที่ข้อมูลของ user เปลี่ยน ดู services_sync.py)
+  + reference version (ReferenceVersion: Currency / FxRate เปลี่ยน เช่น rate ของ wallet-balances?as_of=)
+  + URL + ค่าใน profile ที่มีผลกับผลลัพธ์ + วันนี้ (ค่า default ที่อิงวันปัจจุบัน) ไม่ต้อง serialize body มา hash
+- If-None-Match ตรง -> 304 ก่อน query ของ report (ใช้ query เดียว: อ่าน version)
+- อ่าน version ก่อนสร้าง body: เขียนระหว่างนั้น -> ETag เก่ากว่า body (ครั้งหน้าแค่ได้ 200 ซ้ำ ไม่ได้ข้อมูลเก่า)
+"""
+import functools
+import hashlib
+from urllib.parse import urlencode
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F, Subquery
+from django.utils import timezone
+from django.utils.cache import parse_etags, patch_vary_headers, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from config import sharding
+
+from .models import ReferenceVersion, SyncCounter
+
+CACHE_CONTROL = "private, no-cache"
+REFERENCE_VERSION_PK = 1
+
+
+def data_version(owner_id):
+    """
+    "<version ของ user>.<reference version>" ใน query เดียว (ReferenceVersion ถูก copy ไปทุก shard)
+    """
+    reference = ReferenceVersion.objects.filter(pk=REFERENCE_VERSION_PK).values("value")
+    row = SyncCounter.objects.filter(owner_id=owner_id).values_list("value", Subquery(reference)).first()
+    if row is None:
+        # user ที่ยังไม่เคยเขียนข้อมูล (ยังไม่มี SyncCounter)
+        row = 0, next(iter(ReferenceVersion.objects.filter(pk=REFERENCE_VERSION_PK).values_list("value", flat=True)), 0)
+    return f"{row[0]}.{row[1] or 0}"
+
+
+def bump_reference_version():
+    """
+    เรียกหลังเขียน Currency / FxRate (signal ทำให้แล้ว / bulk_create หรือ update() ต้องเรียกเอง)
+    """
+    if not ReferenceVersion.objects.filter(pk=REFERENCE_VERSION_PK).update(value=F("value") + 1):
+        ReferenceVersion.objects.get_or_create(pk=REFERENCE_VERSION_PK, defaults={"value": 1})
+    if sharding.is_sharded():
+        sharding.copy_to_shards(ReferenceVersion.objects.get(pk=REFERENCE_VERSION_PK))
+
+
+def _on_reference_change(sender, raw=False, using=None, **kwargs):
+    if raw or using != DEFAULT_DB_ALIAS:
+        return
+    bump_reference_version()
+
+
+def connect_etag_signals():
+    from django.db.models.signals import post_delete, post_save
+
+    from .models import Currency, FxRate
+
+    for model in (Currency, FxRate):
+        label = model._meta.label_lower
+        post_save.connect(_on_reference_change, sender=model, dispatch_uid=f"finance.etag.save.{label}")
+        post_delete.connect(_on_reference_change, sender=model, dispatch_uid=f"finance.etag.delete.{label}")
+
+
+def compute_etag(request, version):
+    profile = request.user.profile
+    key = "|".join([
+        str(request.user.pk),
+        profile.base_currency,
+        profile.timezone,
+        profile.language,
+        timezone.localdate().isoformat(),
+        request.path,
+        urlencode(sorted(request.query_params.lists()), doseq=True),
+        request.accepted_renderer.format,
+    ])
+    return quote_etag(f"{version}-{hashlib.sha256(key.encode()).hexdigest()[:16]}")
+
+
+def _matches(etag, header):
+    # If-None-Match ใช้ weak comparison (RFC 9110)
+    return any(tag == "*" or tag.removeprefix("W/") == etag for tag in parse_etags(header))
+
+
+def _with_cache_headers(response, etag):
+    response["ETag"] = etag
+    response["Cache-Control"] = CACHE_CONTROL
+    patch_vary_headers(response, ["Authorization"])
+    return response
+
+
+def conditional_get(view_method):
+    """
+    decorator ของ GET (APIView.get / ViewSet.list): ETag + 304
+    ระหว่างเปลี่ยน base currency -> ไม่ใช้ ETag (ให้ view ตอบ 409 ตามเดิม)
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.user.profile.rebasing:
+            return view_method(self, request, *args, **kwargs)
+
+        etag = compute_etag(request, data_version(request.user.pk))
+        if _matches(etag, request.headers.get("If-None-Match", "")):
+            return _with_cache_headers(Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+
+        response = view_method(self, request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            _with_cache_headers(response, etag)
+        return response
+
+    return wrapper
@@ -0,0 +1,124 @@
+"""
+FX rate ที่มาทีหลัง / ถูกแก้ย้อนหลัง
+- save/delete FxRate -> (on_commit) revalue_fx_rate_task(วันที่, base, quote)
+- หา transaction ของวันนั้น (ตาม TIME_ZONE ของระบบ) ด้วย index (currency, occurred_at) แล้ว UPDATE ทีเดียวต่อคู่
+  คู่ A/B: transaction สกุล A ของ user ที่ base เป็น B และกลับกัน (rate ตรงก่อน ไม่มีใช้ 1/rate ของทางกลับ)
+- transaction ที่ fx_pending (สร้างก่อนมี rate) ได้ยอดจริงในรอบเดียวกัน
+- AiInsight ของเดือนที่ยอดเปลี่ยนถูก mark stale
+- user ที่กำลัง rebase (profile.rebasing) ข้ามไป: services_rebase ตรวจ rate ที่เปลี่ยนระหว่างรันเองตอนจบ
+"""
+import logging
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS
+from django.db import transaction as db_transaction
+from django.db.models import DecimalField, F, Q, Value
+from django.db.models.functions import Round
+
+from config import sharding
+
+from .models import AiInsight, Currency, FxRate, Transaction
+from .partitioning import day_bounds
+from .services_sync import touch
+
+logger = logging.getLogger(__name__)
+
+ONE = Decimal("1.0")
+
+
+def _apply(currency, base_code, day, rate):
+    """
+    UPDATE transaction สกุล currency ในวันนั้นของ user ที่ base = base_code (shard ปัจจุบัน) คืนจำนวนแถว
+    """
+    lo, hi = day_bounds(day)
+    qs = Transaction.objects.filter(
+        currency=currency,
+        occurred_at__gte=lo,
+        occurred_at__lt=hi,
+        owner__profile__base_currency=base_code,
+        owner__profile__rebasing=False,
+    )
+    owners = list(qs.values_list("owner_id", flat=True).distinct())
+    if not owners:
+        return 0
+
+    with db_transaction.atomic(using=sharding.current_shard()):
+        updated = touch(
+            qs,
+            owners,
+            fx_rate=rate,
+            base_amount=Round(
+                F("amount") * Value(rate, output_field=DecimalField(max_digits=18, decimal_places=8)),
+                2,
+                output_field=DecimalField(max_digits=14, decimal_places=2),
+            ),
+            fx_pending=False,
+        )
+        AiInsight.objects.filter(owner_id__in=owners, month=f"{day:%Y-%m}").update(stale=True)
+    return updated
+
+
+def _revalue_on_shard(day, base, quote, to_quote, to_base):
+    updated = 0
+    if to_quote is not None:
+        updated += _apply(base, quote.code, day, to_quote)
+    if to_base is not None:
+        updated += _apply(quote, base.code, day, to_base)
+    return updated
+
+
+def _pick(rates, from_id, to_id):
+    # rate ตรงก่อน ไม่มีค่อยใช้ 1/rate ของทางกลับ (เหมือน _get_fx_rate)
+    if from_id in rates:
+        return rates[from_id]
+    if to_id in rates:
+        return ONE / rates[to_id]
+    return None
+
+
+def revalue_fx_rate(day, base_code, quote_code):
+    """
+    คำนวณ fx_rate/base_amount ใหม่ให้ transaction ที่ใช้คู่สกุลเงินนี้ในวันนั้น ทั้งสองทาง (ทุก shard)
+    ไม่เหลือ rate ทั้งสองทาง (ถูกลบ) -> แถวเดิมคงค่าเดิมไว้
+    คืน {shard: จำนวนแถวที่แก้}
+    """
+    currencies = {c.code: c for c in Currency.objects.filter(code__in=[base_code, quote_code])}
+    base, quote = currencies.get(base_code), currencies.get(quote_code)
+    if base is None or quote is None or base.pk == quote.pk:
+        return {}
+
+    # {base_id ของแถว: rate} (คู่เดียวกัน 2 ทาง)
+    rates = {
+        base_id: Decimal(rate)
+        for base_id, rate in FxRate.objects.filter(
+            Q(base=base, quote=quote) | Q(base=quote, quote=base), date=day
+        ).values_list("base_id", "rate")
+    }
+    if not rates:
+        return {}
+    return sharding.fan_out(
+        _revalue_on_shard, day, base, quote, _pick(rates, base.pk, quote.pk), _pick(rates, quote.pk, base.pk)
+    )
+
+
+def _enqueue(day, base_code, quote_code):
+    from .tasks import revalue_fx_rate_task
+
+    try:
+        revalue_fx_rate_task.delay(day.isoformat(), base_code, quote_code)
+    except Exception:
+        logger.exception("failed to enqueue fx revaluation %s %s->%s", day, base_code, quote_code)
+
+
+def _on_fx_change(sender, instance, raw=False, using=None, **kwargs):
+    if raw or using != DEFAULT_DB_ALIAS:
+        return
+    day, base_code, quote_code = instance.date, instance.base.code, instance.quote.code
+    db_transaction.on_commit(lambda: _enqueue(day, base_code, quote_code), using=DEFAULT_DB_ALIAS)
+
+
+def connect_fx_signals():
+    from django.db.models.signals import post_delete, post_save
+
+    post_save.connect(_on_fx_change, sender=FxRate, dispatch_uid="finance.fx.save")
+    post_delete.connect(_on_fx_change, sender=FxRate, dispatch_uid="finance.fx.delete")
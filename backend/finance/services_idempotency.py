@@ -0,0 +1,123 @@
+"""
+Idempotency-Key สำหรับ POST ที่สร้างข้อมูล (mobile retry ตอนเน็ตหลุด ไม่ให้เกิดรายการซ้ำ)
+- request แรก: INSERT key + ทำงานจริง + เก็บ response ใน DB transaction เดียวกัน (shard ของ user)
+- request ซ้ำ (key เดิม, body เดิม) -> replay response เดิม ไม่เรียก serializer.create อีก
+  header Idempotent-Replayed: true
+- ส่งมาพร้อมกัน: INSERT ของตัวที่สองรอ unique index จนตัวแรก commit แล้วชน -> replay ผลของตัวแรก
+  (ตัวแรก rollback -> ตัวที่สอง INSERT ผ่านแล้วทำงานเอง)
+- ไม่สำเร็จ (ไม่ใช่ 2xx / exception) -> ไม่เก็บ key ส่งซ้ำแล้วทำใหม่ได้
+- key เดิมแต่ body ต่าง -> 422
+- เก็บ IDEMPOTENCY_KEY_TTL_HOURS แล้วลบทิ้ง (purge_expired_idempotency_keys_task)
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from config import sharding
+
+from .models import IdempotencyKey
+
+HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+def _fingerprint(request):
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(f"{request.method} {request.path}\n{body}".encode()).hexdigest()
+
+
+def _replay(owner_id, key, fingerprint):
+    """
+    response เดิมของ key นี้ / None ถ้ายังไม่มี (หรือหมดอายุแล้ว -> ลบทิ้งให้ใช้ key ใหม่ได้)
+    """
+    record = IdempotencyKey.objects.filter(owner_id=owner_id, key=key).first()
+    if record is None:
+        return None
+    if record.expires_at <= timezone.now():
+        IdempotencyKey.objects.filter(pk=record.pk).delete()
+        return None
+    if record.fingerprint != fingerprint:
+        return Response(
+            {"detail": f"{HEADER} was already used with a different request."},
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        )
+    return Response(record.response, status=record.status_code, headers={REPLAYED_HEADER: "true"})
+
+
+def idempotent(view_method):
+    """
+    decorator ของ view method (APIView / action): ใช้ Idempotency-Key ถ้า client ส่งมา
+    ไม่ส่ง header -> ทำงานตามปกติ (ไม่มี query เพิ่ม)
+    """
+
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"detail": f"{HEADER} must be at most {MAX_KEY_LENGTH} characters."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        owner_id = request.user.pk
+        fingerprint = _fingerprint(request)
+        replay = _replay(owner_id, key, fingerprint)
+        if replay is not None:
+            return replay
+
+        shard = sharding.shard_for_owner(owner_id)
+        with db_transaction.atomic(using=shard):
+            try:
+                with db_transaction.atomic(using=shard):
+                    record = IdempotencyKey.objects.create(
+                        owner_id=owner_id,
+                        key=key,
+                        fingerprint=fingerprint,
+                        expires_at=timezone.now() + timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS),
+                    )
+            except IntegrityError:
+                # request เดียวกันที่มาพร้อมกันเพิ่ง commit
+                return _replay(owner_id, key, fingerprint) or Response(
+                    {"detail": f"A request with this {HEADER} is in progress."},
+                    status=status.HTTP_409_CONFLICT,
+                )
+
+            response = view_method(self, request, *args, **kwargs)
+            if not status.is_success(response.status_code):
+                db_transaction.set_rollback(True, using=shard)
+                return response
+
+            record.status_code = response.status_code
+            record.response = response.data
+            record.save(update_fields=["status_code", "response"])
+        return response
+
+    return wrapper
+
+
+def _purge_on_shard(now, chunk_size):
+    deleted = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lt=now).values_list("pk", flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        IdempotencyKey.objects.filter(pk__in=ids).delete()
+        deleted += len(ids)
+
+
+def purge_expired_idempotency_keys(chunk_size=10000):
+    """
+    ลบ key ที่หมดอายุทีละ chunk ทุก shard คืน {shard: จำนวนที่ลบ}
+    """
+    return sharding.fan_out(_purge_on_shard, timezone.now(), chunk_size)
@@ -0,0 +1,200 @@
+import mimetypes
+import re
+import time
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseRedirect, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+SIGNED_MEDIA_SALT = "finance.media"
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+class _BucketedSigner(signing.TimestampSigner):
+    """
+    timestamp ปัดลงทีละ MEDIA_SIGNED_URL_BUCKET_SECONDS: ไฟล์เดียวกันในช่วงเดียวกันได้ URL เดิม
+    (CDN / browser cache ได้ และ body ของ response ที่มี URL ไม่เปลี่ยนทุกครั้ง)
+    """
+
+    def timestamp(self):
+        now = int(time.time())
+        return signing.b62_encode(now - now % settings.MEDIA_SIGNED_URL_BUCKET_SECONDS)
+
+
+def _signer():
+    return _BucketedSigner(salt=SIGNED_MEDIA_SALT)
+
+
+def signed_media_max_age():
+    # timestamp ถูกปัดลง -> บวกช่วง bucket ให้ URL ใช้ได้อย่างน้อย MEDIA_SIGNED_URL_MAX_AGE เสมอ
+    return settings.MEDIA_SIGNED_URL_MAX_AGE + settings.MEDIA_SIGNED_URL_BUCKET_SECONDS
+
+
+def sign_media_name(name: str) -> str:
+    return _signer().sign_object({"n": name})
+
+
+def unsign_media_name(token: str, max_age=None) -> str:
+    """
+    คืนชื่อไฟล์ใน storage จาก token ที่เซ็นไว้
+    - max_age=None ไม่เช็ควันหมดอายุ (ใช้ตอน re-sign url เก่า)
+    """
+    data = _signer().unsign_object(token, max_age=max_age)
+    return data["n"]
+
+
+def signed_media_url(request, name: str) -> str:
+    """
+    สร้าง URL อายุสั้นที่เซ็นด้วย HMAC (SECRET_KEY)
+    proxy/CDN เสิร์ฟต่อได้โดยไม่ต้องมี JWT
+    """
+    url = reverse("signed-media", kwargs={"token": sign_media_name(name)})
+    return request.build_absolute_uri(url) if request else url
+
+
+def media_name_from_url(raw: str):
+    """
+    แปลง url/path ของไฟล์ใน media (แบบเก่า /media/... หรือแบบ signed) กลับเป็นชื่อใน storage
+    ถ้าไม่ใช่ไฟล์ของเรา คืน None
+    """
+    if not raw:
+        return None
+
+    path = urlparse(raw).path if "://" in raw else raw
+    if not path.startswith("/"):
+        path = "/" + path
+
+    signed_prefix = reverse("signed-media", kwargs={"token": "x"})[:-2]
+    if path.startswith(signed_prefix):
+        token = path[len(signed_prefix):].strip("/")
+        try:
+            return unsign_media_name(token)
+        except signing.BadSignature:
+            return None
+
+    idx = path.find(settings.MEDIA_URL)
+    if idx != -1:
+        name = path[idx + len(settings.MEDIA_URL):]
+        return name if name and ".." not in name.split("/") else None
+
+    return None
+
+
+def _parse_range(header: str, size: int):
+    """
+    รองรับ single range เท่านั้น: bytes=start-end / bytes=start- / bytes=-suffix
+    คืน (start, end) หรือ None ถ้า parse ไม่ได้, (None, None) ถ้าช่วงเกินไฟล์
+    """
+    m = RANGE_RE.match(header.strip())
+    if not m:
+        return None
+
+    start_s, end_s = m.groups()
+    if not start_s and not end_s:
+        return None
+
+    if not start_s:
+        length = int(end_s)
+        if length == 0:
+            return None, None
+        return max(size - length, 0), size - 1
+
+    start = int(start_s)
+    end = int(end_s) if end_s else size - 1
+    if start >= size or end < start:
+        return None, None
+    return start, min(end, size - 1)
+
+
+def _iter_file_range(f, start: int, length: int):
+    try:
+        f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def _file_response(request, name: str):
+    """
+    fallback เมื่อไม่มี proxy: เสิร์ฟเองพร้อม conditional GET (ETag/Last-Modified) และ Range
+    """
+    if not default_storage.exists(name):
+        raise Http404("File not found")
+
+    size = default_storage.size(name)
+    mtime = int(default_storage.get_modified_time(name).timestamp())
+    etag = quote_etag(f"{mtime:x}-{size:x}")
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+    res = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if res is None:
+        range_header = request.META.get("HTTP_RANGE", "")
+        if_range = request.META.get("HTTP_IF_RANGE", "")
+        rng = _parse_range(range_header, size) if range_header else None
+
+        # If-Range ไม่ตรง -> ส่งทั้งไฟล์
+        if rng and if_range and if_range not in (etag, http_date(mtime)):
+            rng = None
+
+        if rng == (None, None):
+            res = HttpResponse(status=416)
+            res["Content-Range"] = f"bytes */{size}"
+        elif rng:
+            start, end = rng
+            length = end - start + 1
+            res = StreamingHttpResponse(
+                _iter_file_range(default_storage.open(name, "rb"), start, length),
+                status=206,
+                content_type=content_type,
+            )
+            res["Content-Length"] = str(length)
+            res["Content-Range"] = f"bytes {start}-{end}/{size}"
+        else:
+            res = FileResponse(default_storage.open(name, "rb"), content_type=content_type)
+
+    res["ETag"] = etag
+    res["Last-Modified"] = http_date(mtime)
+    res["Accept-Ranges"] = "bytes"
+    return res
+
+
+def serve_media(request, name: str):
+    """
+    ส่งไฟล์ใน media หลังจาก authorize แล้ว
+    - MEDIA_ACCEL_REDIRECT_PREFIX -> ให้ nginx ส่งไฟล์ (X-Accel-Redirect)
+    - MEDIA_X_SENDFILE -> ให้ apache/lighttpd ส่งไฟล์ (X-Sendfile) storage ไม่มี path บนเครื่อง -> redirect ไป storage.url()
+    - ไม่ตั้งค่า -> Django ส่งเอง (FileResponse + Range)
+    nginx/apache จัดการ Range และ conditional GET ให้เองอยู่แล้ว
+    """
+    accel_prefix = getattr(settings, "MEDIA_ACCEL_REDIRECT_PREFIX", "")
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+    if accel_prefix:
+        res = HttpResponse(content_type=content_type)
+        res["X-Accel-Redirect"] = accel_prefix.rstrip("/") + "/" + name
+    elif getattr(settings, "MEDIA_X_SENDFILE", False):
+        try:
+            path = default_storage.path(name)
+        except NotImplementedError:
+            # เช่น S3: url() ของ storage เซ็นมาให้แล้ว (ไม่ redirect ไป signed-media ของเรา จะวนกลับมาที่นี่)
+            res = HttpResponseRedirect(default_storage.url(name))
+        else:
+            res = HttpResponse(content_type=content_type)
+            res["X-Sendfile"] = path
+    else:
+        res = _file_response(request, name)
+
+    res["Cache-Control"] = f"private, max-age={settings.MEDIA_SIGNED_URL_MAX_AGE}"
+    return res
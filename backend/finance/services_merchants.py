@@ -0,0 +1,175 @@
+import re
+import threading
+import unicodedata
+from bisect import bisect_left, insort
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count
+
+from config import sharding
+
+from .cache_utils import TTLCache
+from .models import Merchant, MerchantAlias, Transaction
+
+# "STARBUCKS #123", "Starbucks - Siam 0123", "starbucks*" -> "starbucks" / "starbucks siam"
+_STORE_NO_RE = re.compile(r"(#\s*\d+|\bno\.?\s*\d+\b)")
+
+INDEX_CACHE_SIZE = 1000  # จำนวน user ที่เก็บ index ไว้ใน memory ต่อ process
+INDEX_TTL_SECONDS = 60  # process อื่นสร้าง merchant ใหม่ -> เห็นภายใน TTL
+
+
+def normalize_merchant_key(raw: str) -> str:
+    s = _STORE_NO_RE.sub(" ", (raw or "").casefold())
+    # ตัดเครื่องหมาย/สัญลักษณ์ (แต่เก็บสระ/วรรณยุกต์ไทยไว้)
+    s = "".join(" " if unicodedata.category(ch)[0] in "PS" else ch for ch in s)
+    tokens = s.split()
+
+    # ตัดเลขสาขา: ตัวเลขยาว ๆ หรือเลขท้ายชื่อ (แต่ "7 eleven" ยังอยู่)
+    tokens = [t for t in tokens if not (t.isdigit() and len(t) >= 3)]
+    while len(tokens) > 1 and tokens[-1].isdigit():
+        tokens.pop()
+
+    return " ".join(tokens)[:120]
+
+
+def display_merchant_name(raw: str) -> str:
+    # ชื่อที่แสดง: ตัดเลขสาขาแต่คงตัวพิมพ์เดิม
+    name = " ".join(_STORE_NO_RE.sub(" ", raw or "").split()).strip(" -*#")
+    return (name or (raw or "").strip())[:120]
+
+
+class MerchantIndex:
+    """
+    index ของ merchant ต่อ user (โหลดครั้งเดียว แล้วใช้จาก memory)
+    - keys เรียงไว้ -> หา prefix ด้วย bisect
+    - alias rules compile ไว้แล้ว (exact เป็น dict, prefix/contains เรียงตามความยาว)
+    - usage (จำนวน tx ต่อร้าน ใช้เรียง autocomplete) โหลดตอน autocomplete ครั้งแรก ไม่อยู่ในทาง resolve
+    """
+
+    def __init__(self, merchants, aliases, usage=None):
+        self.by_key = {m.key: m for m in merchants}
+        self.usage = usage
+        self.keys = sorted(self.by_key)
+
+        self.exact = {}
+        self.rules = []
+        for a in aliases:
+            pattern = normalize_merchant_key(a.pattern)
+            if not pattern:
+                continue
+            if a.match_type == MerchantAlias.MatchType.EXACT:
+                self.exact[pattern] = a.merchant_id
+            else:
+                self.rules.append((a.match_type, pattern, a.merchant_id))
+        # pattern ยาวกว่า = เจาะจงกว่า ให้มาก่อน
+        self.rules.sort(key=lambda r: -len(r[1]))
+        self.by_id = {m.id: m for m in self.by_key.values()}
+        # index อยู่ใน cache ใช้ร่วมกันหลาย thread
+        self._lock = threading.Lock()
+
+    def add(self, merchant):
+        """
+        merchant ที่เพิ่งสร้าง -> ใส่ใน index เลย (ไม่ต้องโหลดทั้ง index ใหม่)
+        """
+        with self._lock:
+            if merchant.key in self.by_key:
+                return
+            self.by_key[merchant.key] = merchant
+            self.by_id[merchant.id] = merchant
+            if self.usage is not None:
+                self.usage.setdefault(merchant.id, 0)
+            insort(self.keys, merchant.key)
+
+    def match_alias(self, key: str):
+        merchant_id = self.exact.get(key)
+        if merchant_id is None:
+            for match_type, pattern, mid in self.rules:
+                if match_type == MerchantAlias.MatchType.PREFIX and key.startswith(pattern):
+                    merchant_id = mid
+                    break
+                if match_type == MerchantAlias.MatchType.CONTAINS and pattern in key:
+                    merchant_id = mid
+                    break
+        return self.by_id.get(merchant_id)
+
+    def lookup(self, key: str):
+        return self.match_alias(key) or self.by_key.get(key)
+
+    def autocomplete(self, prefix: str, limit: int = 10):
+        prefix = normalize_merchant_key(prefix)
+        if not prefix:
+            return []
+
+        i = bisect_left(self.keys, prefix)
+        hits = []
+        while i < len(self.keys) and self.keys[i].startswith(prefix):
+            hits.append(self.by_key[self.keys[i]])
+            i += 1
+
+        usage = self.usage or {}
+        hits.sort(key=lambda m: (-usage.get(m.id, 0), m.name))
+        return hits[:limit]
+
+
+_cache = TTLCache(maxsize=INDEX_CACHE_SIZE, ttl=INDEX_TTL_SECONDS, name="merchant_index")
+
+
+def _load_index(owner_id) -> MerchantIndex:
+    with sharding.for_owner(owner_id):
+        merchants = Merchant.objects.filter(owner_id=owner_id)
+        aliases = MerchantAlias.objects.filter(owner_id=owner_id).only("pattern", "match_type", "merchant_id")
+        return MerchantIndex(merchants, aliases)
+
+
+def _load_usage(owner_id) -> dict:
+    with sharding.for_owner(owner_id):
+        return dict(
+            Transaction.objects.filter(owner_id=owner_id, merchant_ref__isnull=False)
+            .order_by()
+            .values("merchant_ref")
+            .annotate(n=Count("id"))
+            .values_list("merchant_ref", "n")
+        )
+
+
+def get_merchant_index(owner_id, with_usage=False) -> MerchantIndex:
+    """
+    with_usage=True: ต้องใช้ usage (autocomplete) -> โหลดครั้งแรกแล้วเก็บไว้กับ index ใน cache
+    """
+    index = _cache.get_or_load(owner_id, lambda: _load_index(owner_id))
+    if with_usage and index.usage is None:
+        index.usage = _load_usage(owner_id)
+    return index
+
+
+def invalidate_merchant_index(owner_id):
+    _cache.pop(owner_id)
+
+
+def resolve_merchant(owner_id, raw: str):
+    """
+    ชื่อร้านดิบ -> Merchant (สร้างใหม่ถ้ายังไม่มี)
+    คืน None ถ้า raw ว่าง
+    """
+    key = normalize_merchant_key(raw)
+    if not key:
+        return None
+
+    merchant = get_merchant_index(owner_id).lookup(key)
+    if merchant:
+        return merchant
+
+    with sharding.for_owner(owner_id) as shard:
+        try:
+            with db_transaction.atomic(using=shard):
+                merchant, _ = Merchant.objects.get_or_create(
+                    owner_id=owner_id, key=key, defaults={"name": display_merchant_name(raw)}
+                )
+        except IntegrityError:
+            # request อื่นสร้างไปพร้อมกัน
+            merchant = Merchant.objects.get(owner_id=owner_id, key=key)
+
+        # ใส่ key ใหม่ใน index ที่ cache ไว้หลัง commit (backfill / import สร้างร้านใหม่ทีละมาก ๆ ไม่ต้องโหลด index ใหม่ทุกร้าน)
+        # rollback -> ไม่ใส่ (index ไม่มีร้านที่ไม่มีอยู่จริง)
+        db_transaction.on_commit(lambda: get_merchant_index(owner_id).add(merchant), using=shard)
+    return merchant
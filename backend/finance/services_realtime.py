@@ -0,0 +1,235 @@
+"""
+push ยอด wallet / budget ให้ frontend แบบ real-time (Server-Sent Events) แทนการ poll
+- GET /api/events/ ผ่าน ASGI เท่านั้น (config/asgi.py; WSGI/gunicorn ไม่มี endpoint นี้)
+  Authorization: Bearer <access token> หรือ ?token=<stream token> (EventSource ตั้ง header ไม่ได้)
+  stream token ขอจาก POST /api/events/token/ ใช้เปิด stream ได้อย่างเดียว อายุสั้น (REALTIME_STREAM_TOKEN_MAX_AGE)
+  ไม่ส่ง access token ใน URL (ติดไปกับ access log / proxy log)
+- ข้อมูลของ user เปลี่ยน -> services_sync.next_seqs publish {"type": "changed"} หลัง commit
+  recurring สร้างรายการ -> publish {"type": "recurring", "transaction": {...}}
+- ต่อ connection: รวม event ที่มาติดกัน (REALTIME_DEBOUNCE_MS) แล้วคำนวณ snapshot ครั้งเดียว ส่งเฉพาะค่าที่เปลี่ยน
+    event: balances   {"wallets": [{"id", "balance"}], "budgets": [{"id", "percent_used"}]}  (ครั้งแรกส่งทั้งหมด)
+    event: recurring  {"id", "wallet_id", "type", "amount", "occurred_at"}
+  ไม่มี event นาน REALTIME_KEEPALIVE_SECONDS -> ส่ง comment กัน proxy ตัด connection
+- snapshot อ่านจาก primary (replica อาจยังไม่เห็นรายการที่เพิ่ง commit)
+"""
+import asyncio
+import json
+import logging
+from decimal import Decimal
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db import close_old_connections
+from django.db.models import Case, DecimalField, F, Q, Sum, When
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
+
+from config import realtime, sharding
+
+from .models import Budget, Transaction, Wallet
+from .partitioning import month_bounds, month_start
+
+logger = logging.getLogger(__name__)
+
+PATH = "/api/events/"
+STREAM_TOKEN_SALT = "finance.event-stream"
+
+
+def make_stream_token(user_id) -> str:
+    return signing.TimestampSigner(salt=STREAM_TOKEN_SALT).sign_object({"u": user_id})
+
+
+def read_stream_token(token):
+    """
+    user id จาก stream token / None ถ้าเซ็นไม่ถูก หรือหมดอายุ
+    """
+    try:
+        data = signing.TimestampSigner(salt=STREAM_TOKEN_SALT).unsign_object(
+            token, max_age=settings.REALTIME_STREAM_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return None
+    return data.get("u")
+
+
+def recurring_event(tx):
+    return {
+        "type": "recurring",
+        "transaction": {
+            "id": tx.pk,
+            "wallet_id": tx.wallet_id,
+            "type": tx.type,
+            "amount": str(tx.amount),
+            "occurred_at": tx.occurred_at.isoformat(),
+        },
+    }
+
+
+def snapshot(owner_id):
+    """
+    {"wallets": {id: ยอดคงเหลือ (สกุล wallet)}, "budgets": {id: % ที่ใช้ของเดือนนี้}} (4 query)
+    """
+    close_old_connections()
+    try:
+        with sharding.for_owner(owner_id):
+            return _snapshot(owner_id)
+    finally:
+        close_old_connections()
+
+
+def _snapshot(owner_id):
+    signed = Case(
+        When(type__in=["income", "transfer_in"], then=F("amount")),
+        default=-F("amount"),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+    moved = dict(
+        Transaction.objects.filter(owner_id=owner_id, is_deleted=False)
+        .values("wallet_id")
+        .annotate(total=Sum(signed))
+        .values_list("wallet_id", "total")
+    )
+    wallets = {
+        pk: f"{opening + (moved.get(pk) or 0):.2f}"
+        for pk, opening in Wallet.objects.filter(owner_id=owner_id, is_active=True).values_list("id", "opening_balance")
+    }
+
+    month = month_start(timezone.localdate())
+    budgets = list(
+        Budget.objects.filter(owner_id=owner_id, month=f"{month:%Y-%m}").values_list(
+            "id", "scope", "category_id", "limit_base_amount"
+        )
+    )
+    percent = {}
+    if budgets:
+        # aggregate เดียวทุก budget (เหมือน /api/budgets/status/)
+        lo, hi = month_bounds(month)
+        sums = {"total": Sum("base_amount")}
+        for cid in {c for _, scope, c, _ in budgets if scope != Budget.Scope.TOTAL}:
+            sums[f"c{cid}"] = Sum("base_amount", filter=Q(category_id=cid) if cid else Q(category_id__isnull=True))
+        spent = Transaction.objects.filter(
+            owner_id=owner_id, is_deleted=False, type="expense", occurred_at__gte=lo, occurred_at__lt=hi
+        ).aggregate(**sums)
+        for pk, scope, cid, limit in budgets:
+            used = spent.get("total" if scope == Budget.Scope.TOTAL else f"c{cid}") or Decimal("0")
+            pct = (used / limit * 100) if limit > 0 else Decimal("0")
+            percent[pk] = f"{pct:.2f}"
+    return {"wallets": wallets, "budgets": percent}
+
+
+def diff(previous, current):
+    """
+    ค่าที่เปลี่ยนจาก snapshot ก่อนหน้า (None = ไม่มีอะไรเปลี่ยน)
+    """
+    wallets = [{"id": pk, "balance": v} for pk, v in current["wallets"].items() if previous["wallets"].get(pk) != v]
+    budgets = [
+        {"id": pk, "percent_used": v} for pk, v in current["budgets"].items() if previous["budgets"].get(pk) != v
+    ]
+    if not wallets and not budgets:
+        return None
+    return {"wallets": wallets, "budgets": budgets}
+
+
+def _authenticate(scope):
+    """
+    user id จาก access token (header) หรือ stream token (?token=) / None ถ้าไม่ผ่าน
+    """
+    from users.authentication import CachedJWTAuthentication, get_cached_user
+
+    auth = CachedJWTAuthentication()
+    try:
+        for name, value in scope.get("headers", []):
+            if name == b"authorization":
+                raw = auth.get_raw_token(value)
+                return auth.get_user(auth.get_validated_token(raw)).pk if raw else None
+
+        token = (parse_qs(scope.get("query_string", b"").decode()).get("token") or [None])[0]
+        user_id = read_stream_token(token) if token else None
+        if user_id is None:
+            return None
+        user = get_cached_user(user_id)
+        return user.pk if user is not None and user.is_active else None
+    except (AuthenticationFailed, TokenError):
+        return None
+    finally:
+        close_old_connections()
+
+
+async def _respond(send, status, body):
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", b"application/json")]})
+    await send({"type": "http.response.body", "body": json.dumps(body).encode()})
+
+
+def _frame(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+
+
+async def _stream(owner_id, send):
+    async def write(chunk):
+        await send({"type": "http.response.body", "body": chunk, "more_body": True})
+
+    load = sync_to_async(snapshot, thread_sensitive=False)
+    debounce = settings.REALTIME_DEBOUNCE_MS / 1000
+
+    async with realtime.get_broker().subscribe(owner_id) as queue:
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", b"text/event-stream"),
+                (b"cache-control", b"no-cache"),
+                # nginx: ไม่ buffer stream
+                (b"x-accel-buffering", b"no"),
+            ],
+        })
+        last = await load(owner_id)
+        await write(_frame("balances", diff({"wallets": {}, "budgets": {}}, last) or {"wallets": [], "budgets": []}))
+
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), settings.REALTIME_KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                await write(b": keepalive\n\n")
+                continue
+
+            await asyncio.sleep(debounce)
+            messages = [message]
+            while not queue.empty():
+                messages.append(queue.get_nowait())
+
+            for m in messages:
+                if m.get("type") == "recurring":
+                    await write(_frame("recurring", m["transaction"]))
+            current = await load(owner_id)
+            changed = diff(last, current)
+            last = current
+            if changed:
+                await write(_frame("balances", changed))
+
+
+async def _disconnected(receive):
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def events_app(scope, receive, send):
+    """
+    ASGI app ของ GET /api/events/ (route จาก config/asgi.py)
+    """
+    if scope["method"] != "GET":
+        return await _respond(send, 405, {"detail": "Method not allowed."})
+    owner_id = await sync_to_async(_authenticate)(scope)
+    if owner_id is None:
+        return await _respond(send, 401, {"detail": "Authentication credentials were not provided or are invalid."})
+
+    stream = asyncio.ensure_future(_stream(owner_id, send))
+    closed = asyncio.ensure_future(_disconnected(receive))
+    done, pending = await asyncio.wait({stream, closed}, return_when=asyncio.FIRST_COMPLETED)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    if stream in done and stream.exception() is not None:
+        logger.warning("event stream for user %s failed", owner_id, exc_info=stream.exception())
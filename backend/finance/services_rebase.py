@@ -0,0 +1,348 @@
+"""
+เปลี่ยน base currency ของ user: คำนวณ Transaction.fx_rate/base_amount และ Budget.limit_base_amount ใหม่
+- PATCH /api/auth/me/ (profile.base_currency) -> request_rebase(): profile.rebasing=True + ส่ง rebase_task
+- ระหว่างนั้น report / budget status / AI ตอบ 409 "rebasing" (ไม่ปนยอดสองสกุลเงิน)
+- หา rate ที่ต้องใช้ทั้งหมดครั้งเดียวก่อนเริ่ม ขาดตัวไหน -> FAILED + missing_rates (ยังไม่แก้ข้อมูลสักแถว)
+  เพิ่ม rate ผ่าน /api/fx-rates/ แล้วรัน `manage.py rebase_base_currency` (หรือ resume_rebases_task)
+- แก้ transaction ทีละเดือน (ตรงกับ partition) ด้วย UPDATE ... FROM (ตาราง rate ของเดือนนั้น) 1 statement
+- rate ใช้วันที่ของ occurred_at ตาม TIME_ZONE ของระบบ (เหมือน report)
+- rate ที่ถูกแก้ระหว่างรัน (FX revaluation ข้าม user ที่กำลัง rebase) ทำซ้ำตอนจบ
+"""
+import logging
+from bisect import bisect_right
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db import transaction as db_transaction
+from django.db.models import F, Max, Min, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from config import sharding
+from users.authentication import USER_CACHE_TTL_SECONDS, invalidate_user_cache
+from users.models import UserProfile
+
+from .models import AiInsight, BaseCurrencyRebase, Budget, Currency, FxRate, Transaction
+from .partitioning import add_months, day_bounds, month_bounds, month_start
+from .services_sync import next_seq, stamp
+
+logger = logging.getLogger(__name__)
+
+MAX_MISSING_RATES = 50
+ONE = Decimal("1.0")
+
+
+class Rebasing(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Base currency change in progress. Try again shortly."
+    default_code = "rebasing"
+
+
+def ensure_not_rebasing(user):
+    """
+    เรียกก่อนคำนวณยอดจาก base_amount (profile มาจาก cache ของ authentication ไม่มี query เพิ่ม)
+    """
+    if not user.profile.rebasing:
+        return
+    job = BaseCurrencyRebase.objects.filter(owner_id=user.pk).order_by("-requested_at").first()
+    detail = {"detail": Rebasing.default_detail, "code": Rebasing.default_code}
+    if job:
+        detail.update(status=job.status, to_currency=job.to_currency, progress=job.progress)
+    raise Rebasing(detail)
+
+
+def active_rebase(owner_id):
+    return (
+        BaseCurrencyRebase.objects.filter(
+            owner_id=owner_id,
+            status__in=[
+                BaseCurrencyRebase.Status.PENDING,
+                BaseCurrencyRebase.Status.RUNNING,
+                BaseCurrencyRebase.Status.FAILED,
+            ],
+        )
+        .order_by("-requested_at")
+        .first()
+    )
+
+
+def request_rebase(profile, new_code):
+    """
+    เรียกใน transaction เดียวกับที่บันทึก profile.base_currency ใหม่
+    งานที่ FAILED ค้างอยู่ถูกแทนที่ (budget ยังเป็นสกุลเดิมของงานนั้น เพราะแปลง budget เป็นขั้นสุดท้าย)
+    """
+    previous = active_rebase(profile.user_id)
+    from_code = profile.base_currency
+    if previous is not None:
+        from_code = previous.from_currency
+        BaseCurrencyRebase.objects.filter(pk=previous.pk).update(
+            status=BaseCurrencyRebase.Status.CANCELLED, finished_at=timezone.now()
+        )
+
+    job = BaseCurrencyRebase.objects.create(owner_id=profile.user_id, from_currency=from_code, to_currency=new_code)
+    profile.base_currency = new_code
+    profile.rebasing = True
+    db_transaction.on_commit(lambda: _enqueue(job.pk), using=DEFAULT_DB_ALIAS)
+    return job
+
+
+def _enqueue(rebase_id):
+    from .tasks import rebase_base_currency_task
+
+    try:
+        # รอให้ user cache ของทุก process หมดอายุก่อน: process ที่ยังถือ profile เก่าจะเขียน
+        # transaction ด้วย base เดิม ถ้าเริ่มก่อนนี้แถวเหล่านั้นจะหลุดรอบ
+        rebase_base_currency_task.apply_async((rebase_id,), countdown=USER_CACHE_TTL_SECONDS)
+    except Exception:
+        logger.exception("failed to enqueue currency rebase %s", rebase_id)
+
+
+# ---------- rate ----------
+
+def _currency_ids(codes):
+    return dict(Currency.objects.filter(code__in=codes).values_list("code", "id"))
+
+
+def _resolve_rates(owner_id, to_id):
+    """
+    rate ของทุก (สกุลเงิน, วัน) ที่ transaction ของ user ใช้ -> {(currency_id, date): rate}, [ที่ขาด]
+    query transaction 1 ครั้ง + FxRate 1 ครั้ง
+    """
+    pairs = set(
+        Transaction.objects.filter(owner_id=owner_id)
+        .exclude(currency_id=to_id)
+        .annotate(day=TruncDate("occurred_at"))
+        .values_list("currency_id", "day")
+        .distinct()
+    )
+    if not pairs:
+        return {}, []
+
+    currency_ids = {c for c, _ in pairs}
+    days = {d for _, d in pairs}
+    direct, inverse = {}, {}
+    for base_id, quote_id, day, rate in FxRate.objects.filter(
+        Q(base_id__in=currency_ids, quote_id=to_id) | Q(base_id=to_id, quote_id__in=currency_ids),
+        date__in=days,
+    ).values_list("base_id", "quote_id", "date", "rate"):
+        if quote_id == to_id:
+            direct[(base_id, day)] = Decimal(rate)
+        else:
+            inverse[(quote_id, day)] = ONE / Decimal(rate)
+
+    rates, missing = {}, []
+    for key in sorted(pairs):
+        rate = direct.get(key) or inverse.get(key)
+        if rate is None:
+            missing.append(key)
+        else:
+            rates[key] = rate
+    return rates, missing
+
+
+def _budget_rates(budgets, from_id, to_id):
+    """
+    rate ของ budget แต่ละเดือน = rate ล่าสุดที่มีไม่เกินวันสุดท้ายของเดือน (หรือวันนี้)
+    """
+    if from_id == to_id or not budgets:
+        return {b.month: ONE for b in budgets}, []
+
+    last_day = {}
+    today = timezone.localdate()
+    for b in budgets:
+        year, month = map(int, b.month.split("-"))
+        end = add_months(date(year, month, 1), 1) - timedelta(days=1)
+        last_day[b.month] = min(end, today)
+
+    history = {}
+    for base_id, day, rate in FxRate.objects.filter(
+        Q(base_id=from_id, quote_id=to_id) | Q(base_id=to_id, quote_id=from_id),
+        date__lte=max(last_day.values()),
+    ).values_list("base_id", "date", "rate"):
+        # วันเดียวกันมีทั้งสองทาง -> ใช้ทางตรง
+        if base_id == from_id or day not in history:
+            history[day] = Decimal(rate) if base_id == from_id else ONE / Decimal(rate)
+
+    days = sorted(history)
+    rates, missing = {}, []
+    for month, day in last_day.items():
+        i = bisect_right(days, day)
+        if i:
+            rates[month] = history[days[i - 1]]
+        else:
+            missing.append(month)
+    return rates, missing
+
+
+# ---------- apply ----------
+
+def _update_month(alias, owner_id, to_id, month, rates):
+    """
+    transaction ของเดือนนี้: สกุลเดียวกับ base -> rate 1, ที่เหลือ UPDATE ... FROM ตาราง rate รายวัน
+    ทั้งเดือนได้ change_seq เดียวกัน (delta sync)
+    """
+    lo, hi = month_bounds(month)
+    seq = next_seq(alias, owner_id)
+    qs = Transaction.objects.filter(owner_id=owner_id, occurred_at__gte=lo, occurred_at__lt=hi)
+    updated = qs.filter(currency_id=to_id).update(
+        fx_rate=ONE, base_amount=F("amount"), fx_pending=False, change_seq=seq
+    )
+
+    connection = connections[alias]
+    adapt = connection.ops.adapt_datetimefield_value
+    table = connection.ops.quote_name(Transaction._meta.db_table)
+    rows, params = [], []
+    for (currency_id, day), rate in rates:
+        day_lo, day_hi = day_bounds(day)
+        rows.append("SELECT %s AS currency_id, %s AS day_start, %s AS day_end, %s AS rate")
+        params += [currency_id, adapt(day_lo), adapt(day_hi), rate]
+    if not rows:
+        return updated
+
+    sql = f"""
+        UPDATE {table}
+        SET fx_rate = r.rate, base_amount = ROUND({table}.amount * r.rate, 2), fx_pending = %s, change_seq = %s
+        FROM ({" UNION ALL ".join(rows)}) AS r
+        WHERE {table}.owner_id = %s
+          AND {table}.occurred_at >= %s AND {table}.occurred_at < %s
+          AND {table}.currency_id = r.currency_id
+          AND {table}.occurred_at >= r.day_start AND {table}.occurred_at < r.day_end
+    """
+    with connection.cursor() as c:
+        c.execute(sql, [False, seq] + params + [owner_id, adapt(lo), adapt(hi)])
+        updated += c.rowcount
+    return updated
+
+
+def _save(job, *fields):
+    BaseCurrencyRebase.objects.filter(pk=job.pk).update(**{f: getattr(job, f) for f in fields})
+
+
+def rebase(rebase_id):
+    """
+    คำนวณยอดของงานนี้ใหม่ทั้งหมด รันซ้ำได้ (คำนวณจาก amount + currency ของแต่ละแถว ไม่ได้คูณต่อจากค่าเดิม)
+    """
+    job = BaseCurrencyRebase.objects.get(pk=rebase_id)
+    if job.status in (BaseCurrencyRebase.Status.DONE, BaseCurrencyRebase.Status.CANCELLED):
+        return job
+    owner_id = job.owner_id
+
+    job.status = BaseCurrencyRebase.Status.RUNNING
+    job.started_at = job.started_at or timezone.now()
+    job.error = ""
+    _save(job, "status", "started_at", "error")
+
+    try:
+        ids = _currency_ids([job.from_currency, job.to_currency])
+        if job.to_currency not in ids:
+            raise ValueError(f"Unknown currency {job.to_currency}")
+        to_id = ids[job.to_currency]
+
+        with sharding.for_owner(owner_id) as shard:
+            budgets = list(Budget.objects.filter(owner_id=owner_id))
+            rates, missing = _resolve_rates(owner_id, to_id)
+            budget_rates, budget_missing = _budget_rates(budgets, ids.get(job.from_currency), to_id)
+            if missing or budget_missing:
+                codes = dict(Currency.objects.values_list("id", "code"))
+                job.progress["missing_rates"] = (
+                    [f"{day} {codes.get(c, c)}->{job.to_currency}" for c, day in missing]
+                    + [f"{month} {job.from_currency}->{job.to_currency}" for month in budget_missing]
+                )[:MAX_MISSING_RATES]
+                raise ValueError(f"Missing {len(missing) + len(budget_missing)} FX rates")
+            job.progress.pop("missing_rates", None)
+
+            bounds = Transaction.objects.filter(owner_id=owner_id).aggregate(lo=Min("occurred_at"), hi=Max("occurred_at"))
+            months = []
+            if bounds["lo"]:
+                month = month_start(timezone.localtime(bounds["lo"]).date())
+                last = month_start(timezone.localtime(bounds["hi"]).date())
+                while month <= last:
+                    months.append(month)
+                    month = add_months(month, 1)
+
+            by_month = {}
+            for (currency_id, day), rate in rates.items():
+                by_month.setdefault(month_start(day), []).append(((currency_id, day), rate))
+
+            total = Transaction.objects.filter(owner_id=owner_id).count()
+            job.progress["transactions"] = {"done": 0, "total": total}
+            job.progress["budgets"] = {"done": 0, "total": len(budgets)}
+            _save(job, "progress")
+
+            done = 0
+            for month in months:
+                # 1 เดือน = 1 transaction สั้น ๆ
+                with db_transaction.atomic(using=shard):
+                    done += _update_month(shard, owner_id, to_id, month, by_month.get(month, []))
+                job.progress["transactions"]["done"] = done
+                _save(job, "progress")
+
+            for b in budgets:
+                b.limit_base_amount = (b.limit_base_amount * budget_rates[b.month]).quantize(Decimal("0.01"))
+
+            # budget คูณจากค่าเดิม (ไม่ idempotent) -> แปลงพร้อมปิดงานใน transaction เดียวกัน
+            # (shard แยกจาก default: commit ติดกันสองครั้ง)
+            with db_transaction.atomic(using=DEFAULT_DB_ALIAS), db_transaction.atomic(using=shard):
+                Budget.objects.bulk_update(stamp(shard, budgets), ["limit_base_amount", "change_seq"], batch_size=1000)
+                AiInsight.objects.filter(owner_id=owner_id).update(stale=True)
+                job.progress["budgets"]["done"] = len(budgets)
+                job.status = BaseCurrencyRebase.Status.DONE
+                job.finished_at = timezone.now()
+                _save(job, "status", "finished_at", "progress")
+                profile = UserProfile.objects.get(user_id=owner_id)
+                profile.rebasing = False
+                profile.save(update_fields=["rebasing"])
+    except Exception as e:
+        job.status = BaseCurrencyRebase.Status.FAILED
+        job.error = repr(e)
+        _save(job, "status", "error", "progress")
+        raise
+
+    invalidate_user_cache(owner_id)
+    # นอก try: งานปิดเป็น DONE แล้ว (budget แปลงแล้ว) พังตรงนี้ห้าม mark FAILED ให้ resume รันซ้ำ
+    _apply_changed_rates(owner_id, to_id, rates)
+    logger.info("rebased user %s %s->%s", owner_id, job.from_currency, job.to_currency)
+    return job
+
+
+def _apply_changed_rates(owner_id, to_id, rates):
+    """
+    FX revaluation ข้าม user ที่กำลัง rebase (services_fx) -> rate ที่ถูกแก้หลัง _resolve_rates ทำซ้ำที่นี่
+    เรียกหลัง rebasing=False commit แล้ว: แก้ rate หลังจากนี้ revaluation เห็น user นี้เอง
+    """
+    with sharding.for_owner(owner_id) as shard:
+        changed = {}
+        for (currency_id, day), rate in _resolve_rates(owner_id, to_id)[0].items():
+            if rates.get((currency_id, day)) != rate:
+                changed.setdefault(month_start(day), []).append(((currency_id, day), rate))
+        for month, month_rates in sorted(changed.items()):
+            with db_transaction.atomic(using=shard):
+                _update_month(shard, owner_id, to_id, month, month_rates)
+
+
+def resume_rebases(stale_after=timedelta(hours=1)):
+    """
+    งานที่ค้าง: พัง (เช่นเพิ่ง เพิ่ม rate ที่ขาด) / PENDING หรือ RUNNING นานผิดปกติ -> รันต่อ
+    คืนจำนวนงานที่ทำสำเร็จ
+    """
+    stale = timezone.now() - stale_after
+    ids = list(
+        BaseCurrencyRebase.objects.filter(
+            Q(status=BaseCurrencyRebase.Status.FAILED)
+            | Q(status=BaseCurrencyRebase.Status.PENDING, requested_at__lt=stale)
+            | Q(status=BaseCurrencyRebase.Status.RUNNING, started_at__lt=stale)
+        )
+        .order_by("requested_at")
+        .values_list("pk", flat=True)
+    )
+    done = 0
+    for rebase_id in ids:
+        try:
+            rebase(rebase_id)
+            done += 1
+        except Exception:
+            logger.exception("currency rebase %s failed", rebase_id)
+    return done
@@ -3,8 +3,13 @@ from decimal import Decimal
 from django.db import transaction as db_transaction
 from django.utils import timezone
 
-from .models import RecurringTransaction, Transaction, Currency
-from .serializers import _get_fx_rate  # helper เดิมสำหรับ FX
+from config import realtime, sharding
+
+from .models import RecurringTransaction, Transaction
+from .serializers import _get_fx_rate, _get_currency  # helper เดิมสำหรับ FX
+from .services_merchants import resolve_merchant
+from .services_categorize import suggest_category_id
+from .services_realtime import recurring_event
 
 
 def _add_months(dt, months: int):
@@ -29,12 +34,17 @@ def create_transaction_from_recurring(rt: RecurringTransaction, occurred_at: tim
     user = rt.owner
     wallet = rt.wallet
     tx_currency = wallet.currency
-    base_currency = Currency.objects.get(code=user.profile.base_currency)
-    date = occurred_at.date()
+    base_currency = _get_currency(user.profile.base_currency)
+    date = timezone.localtime(occurred_at).date()
 
     fx = _get_fx_rate(date, tx_currency, base_currency)
     base_amount = (Decimal(rt.amount) * fx).quantize(Decimal("0.01"))
 
+    merchant_ref = resolve_merchant(user.id, rt.merchant)
+    category_id = rt.category_id or suggest_category_id(
+        user.id, rt.type, rt.merchant, rt.amount, wallet.id, merchant_ref.key if merchant_ref else None
+    )
+
     return Transaction.objects.create(
         owner=user,
         wallet=wallet,
@@ -44,8 +54,9 @@ def create_transaction_from_recurring(rt: RecurringTransaction, occurred_at: tim
         currency=tx_currency,
         fx_rate=fx,
         base_amount=base_amount,
-        category=rt.category,
+        category_id=category_id,
         merchant=rt.merchant,
+        merchant_ref=merchant_ref,
         note=rt.note,
     )
 
@@ -53,15 +64,19 @@ def create_transaction_from_recurring(rt: RecurringTransaction, occurred_at: tim
 def run_due(now=None):
     """
     รันรายการที่ถึงเวลา (next_run_at <= now) แล้วสร้าง Transaction
+    ทุก shard พร้อมกัน คืนจำนวนที่สร้างรวม
     """
     now = now or timezone.now()
+    return sum(sharding.fan_out(_run_due_on_shard, now).values())
+
 
+def _run_due_on_shard(now):
     qs = RecurringTransaction.objects.filter(is_active=True, next_run_at__lte=now).select_related(
-        "owner", "wallet", "wallet__currency", "category"
+        "owner__profile", "wallet", "wallet__currency", "category"
     )
 
     created = 0
-    with db_transaction.atomic():
+    with db_transaction.atomic(using=sharding.current_shard()):
         for rt in qs:
             # ถ้ามี end_date และเลยแล้ว -> ปิด
             if rt.end_date and rt.next_run_at.date() > rt.end_date:
@@ -70,7 +85,8 @@ def run_due(now=None):
                 continue
 
             # สร้าง tx
-            create_transaction_from_recurring(rt, rt.next_run_at)
+            tx = create_transaction_from_recurring(rt, rt.next_run_at)
+            realtime.publish_on_commit([rt.owner_id], recurring_event(tx), using=sharding.current_shard())
             created += 1
 
             # อัปเดตรอบถัดไป
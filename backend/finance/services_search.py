@@ -0,0 +1,71 @@
+from django.db import connections
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.db.models.functions import Greatest
+
+# ต้องเป็น expression เดียวกับ index ใน migration 0011 ไม่งั้น postgres จะไม่ใช้ index
+SEARCH_CONFIG = "simple"
+
+
+def search_vector():
+    from django.contrib.postgres.search import SearchVector
+
+    return SearchVector("merchant", "note", config=SEARCH_CONFIG)
+
+
+def _search_postgres(qs, q: str):
+    """
+    - full-text: to_tsvector(merchant || note) @@ websearch_to_tsquery  (GIN tsvector)
+    - fuzzy/substring: q <% merchant / note  (GIN gin_trgm_ops)
+    rank = ts_rank + word similarity
+    """
+    from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+
+    query = SearchQuery(q, config=SEARCH_CONFIG, search_type="websearch")
+    vector = search_vector()
+
+    return (
+        qs.alias(search=vector)
+        .filter(
+            Q(search=query)
+            | Q(merchant__trigram_word_similar=q)
+            | Q(note__trigram_word_similar=q)
+        )
+        .annotate(
+            rank=SearchRank(vector, query)
+            + Greatest(TrigramWordSimilarity(q, "merchant"), TrigramWordSimilarity(q, "note"))
+        )
+        .order_by("-rank", "-occurred_at")
+    )
+
+
+def _search_fallback(qs, q: str):
+    """
+    ใช้ตอนไม่ใช่ postgres (เช่น test ด้วย sqlite): icontains + rank แบบง่าย
+    """
+    return (
+        qs.filter(Q(merchant__icontains=q) | Q(note__icontains=q))
+        .annotate(
+            rank=Case(
+                When(merchant__iexact=q, then=Value(3)),
+                When(merchant__istartswith=q, then=Value(2)),
+                When(merchant__icontains=q, then=Value(1)),
+                default=Value(0),
+                output_field=IntegerField(),
+            )
+        )
+        .order_by(F("rank").desc(), "-occurred_at")
+    )
+
+
+def search_transactions(qs, q: str):
+    """
+    ค้นหา transaction จาก merchant/note
+    qs ควร filter owner/is_deleted/ช่วงวันที่มาแล้ว
+    """
+    q = (q or "").strip()
+    if not q:
+        return qs.none()
+
+    if connections[qs.db].vendor == "postgresql":
+        return _search_postgres(qs, q)
+    return _search_fallback(qs, q)
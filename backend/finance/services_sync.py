@@ -0,0 +1,221 @@
+"""
+delta sync สำหรับ client offline (GET /api/sync/?since=<cursor>)
+- ทุกแถวของ SyncTracked มี change_seq ต่อ user: ได้จาก SyncCounter ด้วย upsert เดียว (INSERT ... ON CONFLICT ... RETURNING)
+  แถวของ counter ถูกล็อกจน commit -> transaction ของ user เดียวกัน commit ตามลำดับ seq
+  (client ไม่มีทางเห็น seq 11 ก่อน seq 10 commit แล้วข้าม 10 ไป)
+- update/bulk ที่ไม่ผ่าน Model.save ใช้ touch(qs, ...) / stamp(objs) / record_deleted(...)
+- cursor = "seq.model.pk" เรียง (change_seq, ลำดับ model, pk) แบ่ง batch ได้แม้ seq เดียวมีหลายแถว
+- tombstone เก็บ SYNC_TOMBSTONE_RETENTION_DAYS แล้วลบ (purge_sync_tombstones_task)
+  cursor ที่เก่ากว่า tombstone ที่ลบไปแล้ว -> 410 ให้ client sync ใหม่ทั้งหมด
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connections, router
+from django.db import transaction as db_transaction
+from django.db.models import BigIntegerField, Case, F, Max, Q, Value, When
+from django.utils import timezone
+
+from config import realtime, sharding
+
+from .models import Budget, Category, RecurringTransaction, SyncCounter, SyncTombstone, Transaction, Wallet
+
+# (ชื่อใน response, model) ลำดับนี้เป็นส่วนหนึ่งของ cursor ห้ามสลับ (เพิ่มต่อท้ายได้)
+FEEDS = (
+    ("transactions", Transaction),
+    ("wallets", Wallet),
+    ("categories", Category),
+    ("budgets", Budget),
+    ("recurrings", RecurringTransaction),
+)
+DELETED = len(FEEDS)
+FEED_NAMES = {model._meta.label_lower: name for name, model in FEEDS}
+CHANGED = {"type": "changed"}
+
+
+class ResyncRequired(Exception):
+    """
+    cursor เก่ากว่า tombstone ที่ลบไปแล้ว
+    """
+
+
+def next_seqs(alias, owner_ids, n=1):
+    """
+    จอง seq ให้แต่ละ owner คืน {owner_id: seq สุดท้ายที่จอง} (จองทีละ n: seq-n+1 .. seq)
+    ต้องเรียกใน atomic ของ alias (lock ของ counter ค้างจน commit) เรียง owner กัน deadlock
+    """
+    table = connections[alias].ops.quote_name(SyncCounter._meta.db_table)
+    seqs = {}
+    with connections[alias].cursor() as cursor:
+        for owner_id in sorted(set(owner_ids)):
+            cursor.execute(
+                f"INSERT INTO {table} (owner_id, value, purged_seq) VALUES (%s, %s, 0) "
+                f"ON CONFLICT (owner_id) DO UPDATE SET value = {table}.value + excluded.value "
+                "RETURNING value",
+                [owner_id, n],
+            )
+            seqs[owner_id] = cursor.fetchone()[0]
+    # ข้อมูลเปลี่ยน -> push ให้ client ที่เปิด /api/events/ อยู่ (services_realtime.py)
+    realtime.publish_on_commit(seqs, CHANGED, using=alias)
+    return seqs
+
+
+def next_seq(alias, owner_id, n=1):
+    return next_seqs(alias, [owner_id], n)[owner_id]
+
+
+def bump(owner_id):
+    """
+    ขยับ version ของ user โดยไม่มีแถวที่ sync เปลี่ยน (ข้อมูลที่มีผลกับ report เช่นชื่อร้าน) -> ETag เปลี่ยน
+    """
+    alias = sharding.shard_for_owner(owner_id)
+    with db_transaction.atomic(using=alias, savepoint=False):
+        return next_seq(alias, owner_id)
+
+
+def _seq_expression(seqs):
+    if len(seqs) == 1:
+        return Value(next(iter(seqs.values())))
+    return Case(
+        *[When(owner_id=owner_id, then=Value(seq)) for owner_id, seq in seqs.items()],
+        default=F("change_seq"),
+        output_field=BigIntegerField(),
+    )
+
+
+def touch(qs, owners=None, **values):
+    """
+    qs.update(**values) พร้อมตั้ง change_seq ใหม่ (seq เดียวต่อ owner) คืนจำนวนแถว
+    owners: owner ที่มีแถวใน qs (รู้อยู่แล้ว -> ไม่ต้อง query หา)
+    """
+    alias = router.db_for_write(qs.model)
+    with db_transaction.atomic(using=alias, savepoint=False):
+        if owners is None:
+            owners = qs.order_by().values_list("owner_id", flat=True).distinct()
+        seqs = next_seqs(alias, owners)
+        if not seqs:
+            return 0
+        return qs.update(change_seq=_seq_expression(seqs), **values)
+
+
+def stamp(alias, objs):
+    """
+    ตั้ง change_seq ให้ object ก่อน bulk_create / bulk_update (ต้องอยู่ใน atomic ของ alias)
+    """
+    seqs = next_seqs(alias, [obj.owner_id for obj in objs])
+    for obj in objs:
+        obj.change_seq = seqs[obj.owner_id]
+    return objs
+
+
+def record_deleted(alias, rows):
+    """
+    rows: [(label, owner_id, pk)] ของแถวที่กำลังลบจริง -> SyncTombstone (เรียกใน atomic เดียวกับ delete)
+    """
+    if not rows:
+        return
+    seqs = next_seqs(alias, [owner_id for _, owner_id, _ in rows])
+    SyncTombstone.objects.using(alias).bulk_create([
+        SyncTombstone(owner_id=owner_id, model=label, object_id=pk, change_seq=seqs[owner_id])
+        for label, owner_id, pk in rows
+    ])
+
+
+def parse_cursor(raw):
+    """
+    "seq.model.pk" -> (seq, model, pk) / ไม่ส่งมา -> เริ่มจากต้น ("0.-1.0") / รูปแบบผิด -> ValueError
+    """
+    if not raw:
+        return (0, -1, 0)
+    seq, index, pk = (int(part) for part in raw.split("."))
+    if seq < 0 or not -1 <= index <= DELETED:
+        raise ValueError(raw)
+    return seq, index, pk
+
+
+def format_cursor(key):
+    return "{}.{}.{}".format(*key)
+
+
+def _after(cursor, index):
+    # แถวที่ (change_seq, index, pk) > cursor
+    seq, at, pk = cursor
+    if index < at:
+        return Q(change_seq__gt=seq)
+    if index == at:
+        return Q(change_seq__gt=seq) | Q(change_seq=seq, pk__gt=pk)
+    return Q(change_seq__gte=seq)
+
+
+def _plain(row):
+    return {k: str(v) if isinstance(v, Decimal) else v for k, v in row.items()}
+
+
+def changes_since(owner_id, since, limit):
+    """
+    การเปลี่ยนแปลงของ user หลัง cursor since ไม่เกิน limit แถว (รวม tombstone)
+    คืน {"cursor", "has_more", "changes": {ชื่อ: [แถว]}, "deleted": [{"model", "id"}]}
+    ใช้ query คงที่ (counter 1 + ต่อ model 1 + tombstone 1) ไม่ขึ้นกับจำนวนแถว
+    """
+    if since != (0, -1, 0):
+        purged = SyncCounter.objects.filter(owner_id=owner_id).values_list("purged_seq", flat=True).first() or 0
+        if purged and (since[0], since[1]) < (purged, DELETED):
+            raise ResyncRequired()
+
+    found = []
+    for index, (_, model) in enumerate(FEEDS):
+        fields = [f.attname for f in model._meta.concrete_fields if f.attname != "owner_id"]
+        rows = (
+            model._base_manager.filter(_after(since, index), owner_id=owner_id)
+            .order_by("change_seq", "pk")
+            .values(*fields)[: limit + 1]
+        )
+        found += [((r["change_seq"], index, r["id"]), _plain(r)) for r in rows]
+    tombstones = (
+        SyncTombstone.objects.filter(_after(since, DELETED), owner_id=owner_id)
+        .order_by("change_seq", "pk")
+        .values("pk", "model", "object_id", "change_seq")[: limit + 1]
+    )
+    found += [
+        ((t["change_seq"], DELETED, t["pk"]), {"model": FEED_NAMES.get(t["model"], t["model"]), "id": t["object_id"]})
+        for t in tombstones
+    ]
+
+    found.sort(key=lambda item: item[0])
+    page = found[:limit]
+    result = {
+        "cursor": format_cursor(page[-1][0] if page else since),
+        "has_more": len(found) > limit,
+        "changes": {name: [] for name, _ in FEEDS},
+        "deleted": [],
+    }
+    for (_, index, _), row in page:
+        if index == DELETED:
+            result["deleted"].append(row)
+        else:
+            result["changes"][FEEDS[index][0]].append(row)
+    return result
+
+
+def _purge_tombstones_on_shard(cutoff, chunk_size):
+    deleted = 0
+    while True:
+        with db_transaction.atomic(using=sharding.current_shard()):
+            ids = list(SyncTombstone.objects.filter(deleted_at__lt=cutoff).order_by("pk").values_list("pk", flat=True)[:chunk_size])
+            if not ids:
+                return deleted
+            chunk = SyncTombstone.objects.filter(pk__in=ids)
+            for owner_id, seq in chunk.values_list("owner_id").annotate(seq=Max("change_seq")).order_by("owner_id"):
+                SyncCounter.objects.filter(owner_id=owner_id, purged_seq__lt=seq).update(purged_seq=seq)
+            chunk.delete()
+        deleted += len(ids)
+
+
+def purge_sync_tombstones(chunk_size=10000, now=None):
+    """
+    ลบ tombstone ที่เก่ากว่า SYNC_TOMBSTONE_RETENTION_DAYS ทุก shard (จำ purged_seq ไว้ใน counter)
+    คืน {shard: จำนวนที่ลบ}
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    return sharding.fan_out(_purge_tombstones_on_shard, cutoff, chunk_size)
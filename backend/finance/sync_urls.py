@@ -0,0 +1,7 @@
+from django.urls import path
+from .views_sync import EventTokenView, SyncView
+
+urlpatterns = [
+    path("sync/", SyncView.as_view()),
+    path("events/token/", EventTokenView.as_view()),
+]
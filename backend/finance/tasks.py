@@ -1,6 +1,77 @@
 from celery import shared_task
+from django.conf import settings
+from django.db import connections
+from django.utils.dateparse import parse_date
+
+from config import sharding
+from finance import partitioning
+from finance.services_archive import purge_deleted_transactions
+from finance.services_fx import revalue_fx_rate
+from finance.services_idempotency import purge_expired_idempotency_keys
+from finance.services_rebase import rebase, resume_rebases
 from finance.services_recurring import run_due
+from finance.services_sync import purge_sync_tombstones
+from finance.services_categorize import categorize_uncategorized
 
 @shared_task
 def run_recurrings_task():
     return run_due()
+
+@shared_task
+def categorize_uncategorized_task(owner_id=None):
+    return categorize_uncategorized(owner_id=owner_id)
+
+@shared_task
+def ensure_transaction_partitions_task(months_ahead=None):
+    """
+    สร้าง partition ของ Transaction ล่วงหน้า (ทุก shard) ตั้งเวลาใน beat วันละครั้ง
+    """
+    months_ahead = settings.TRANSACTION_PARTITION_MONTHS_AHEAD if months_ahead is None else months_ahead
+
+    def ensure():
+        return partitioning.ensure_partitions(connections[sharding.current_shard()], months_ahead)
+
+    return sharding.fan_out(ensure)
+
+@shared_task
+def purge_deleted_transactions_task(chunk_size=1000):
+    """
+    archive + ลบ transaction ที่ soft delete เกิน TRANSACTION_PURGE_AFTER_DAYS (ทุก shard) ตั้งเวลาใน beat วันละครั้ง
+    """
+    result = purge_deleted_transactions(chunk_size=chunk_size)
+    return {shard: {"transactions": r["transactions"], "links": r["links"]} for shard, r in result.items()}
+
+@shared_task
+def rebase_base_currency_task(rebase_id):
+    """
+    คำนวณ fx_rate/base_amount ใหม่หลัง user เปลี่ยน base currency
+    """
+    return rebase(rebase_id).progress
+
+@shared_task
+def resume_rebases_task():
+    """
+    รันงาน rebase ที่พัง/ค้างต่อ (เช่นหลังเพิ่ม FX rate ที่ขาด) ตั้งเวลาใน beat
+    """
+    return resume_rebases()
+
+@shared_task
+def revalue_fx_rate_task(day, base_code, quote_code):
+    """
+    FxRate ถูกเพิ่ม/แก้/ลบ -> คำนวณยอดของ transaction วันนั้นใหม่ (ส่งจาก signal ของ FxRate)
+    """
+    return revalue_fx_rate(parse_date(day), base_code, quote_code)
+
+@shared_task
+def purge_expired_idempotency_keys_task():
+    """
+    ลบ Idempotency-Key ที่เกิน IDEMPOTENCY_KEY_TTL_HOURS (ทุก shard) ตั้งเวลาใน beat ชั่วโมงละครั้ง
+    """
+    return purge_expired_idempotency_keys()
+
+@shared_task
+def purge_sync_tombstones_task():
+    """
+    ลบ tombstone ของ delta sync ที่เกิน SYNC_TOMBSTONE_RETENTION_DAYS (ทุก shard) ตั้งเวลาใน beat วันละครั้ง
+    """
+    return purge_sync_tombstones()
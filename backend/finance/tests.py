@@ -1,3 +1,1492 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import marshal
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.db.models import Sum
+from django.utils import timezone
+from django.test import SimpleTestCase, override_settings
+from PIL import Image
+from prometheus_client import REGISTRY
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from config import db_routers, metrics, middleware, profiling, realtime, sharding
+from users.authentication import _user_cache, invalidate_user_cache
+from users.models import UserProfile
+
+from . import serializers as finance_serializers
+from . import (
+    partitioning,
+    services_archive,
+    services_categorize,
+    services_etag,
+    services_fx,
+    services_idempotency,
+    services_media,
+    services_merchants,
+    services_realtime,
+    services_rebase,
+    services_sync,
+)
+from .models import (
+    AiInsight,
+    BaseCurrencyRebase,
+    Budget,
+    Category,
+    CategoryRule,
+    Currency,
+    FxRate,
+    IdempotencyKey,
+    Merchant,
+    Receipt,
+    RecurringTransaction,
+    RequestProfile,
+    SyncCounter,
+    Transaction,
+    TransferLink,
+    Wallet,
+)
+from .serializers_receipts import ReceiptUploadSerializer
+from .services_ai import build_monthly_stats
+from .services_recurring import run_due
+
+User = get_user_model()
+
+MERCHANTS = ["Starbucks", "7-Eleven", "Grab", "Lotus", "Makro"]
+
+
+# ---------- factory helpers ----------
+
+def make_currency(code="THB"):
+    currency, _ = Currency.objects.get_or_create(code=code, defaults={"name": code})
+    return currency
+
+
+def make_user(username="alice", base_currency="THB"):
+    user = User.objects.create_user(username, email=f"{username}@example.com", password="pass12345")
+    if base_currency != "THB":
+        user.profile.base_currency = base_currency
+        user.profile.save(update_fields=["base_currency"])
+    return user
+
+
+def make_wallet(user, name="Cash", currency=None, opening_balance=Decimal("1000.00")):
+    return Wallet.objects.create(
+        owner=user,
+        name=name,
+        currency=currency or make_currency(),
+        opening_balance=opening_balance,
+    )
+
+
+def make_category(user, name="Food", type=Category.CategoryType.EXPENSE):
+    return Category.objects.create(owner=user, name=name, type=type)
+
+
+def make_merchants(user):
+    return Merchant.objects.bulk_create(
+        [Merchant(owner=user, key=services_merchants.normalize_merchant_key(n), name=n) for n in MERCHANTS]
+    )
+
+
+def make_transactions(user, wallets, categories, merchants, n, start=None):
+    """
+    สร้าง transaction n แถวด้วย bulk_create (วน wallet/หมวด/ร้าน/type)
+    """
+    start = start or timezone.now() - timedelta(days=1)
+    types = ["expense", "expense", "expense", "income"]
+    rows = []
+    for i in range(n):
+        wallet = wallets[i % len(wallets)]
+        merchant = merchants[i % len(merchants)]
+        amount = Decimal(10 + i % 90)
+        rows.append(Transaction(
+            owner=user,
+            wallet=wallet,
+            type=types[i % len(types)],
+            occurred_at=start - timedelta(hours=i),
+            amount=amount,
+            currency_id=wallet.currency_id,
+            base_amount=amount,
+            category=categories[i % len(categories)],
+            merchant=merchant.name,
+            merchant_ref=merchant,
+        ))
+    return Transaction.objects.bulk_create(rows, batch_size=1000)
+
+
+def clear_process_caches():
+    _user_cache.clear()
+    finance_serializers.clear_currency_cache()
+    services_merchants._cache.clear()
+    services_categorize._cache.clear()
+
+
+class FinanceTestCase(APITestCase):
+    """
+    user + wallet/หมวด/ร้านชุดเล็ก (ยังไม่มี transaction) test แต่ละตัวสร้างแถวที่ต้องใช้เอง
+    """
+
+    def setUp(self):
+        clear_process_caches()
+        self.addCleanup(clear_process_caches)
+
+        self.thb = make_currency("THB")
+        self.usd = make_currency("USD")
+        self.user = make_user()
+        self.cash = make_wallet(self.user, "Cash")
+        self.bank = make_wallet(self.user, "Bank")
+        self.usd_wallet = make_wallet(self.user, "Travel", currency=self.usd)
+        self.food = make_category(self.user, "Food")
+        self.transport = make_category(self.user, "Transport")
+        self.salary = make_category(self.user, "Salary", type=Category.CategoryType.INCOME)
+        self.merchants = make_merchants(self.user)
+        FxRate.objects.create(date=timezone.now().date(), base=self.usd, quote=self.thb, rate=Decimal("35"))
+
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+    def seed(self, n, **kwargs):
+        return make_transactions(
+            self.user,
+            [self.cash, self.bank, self.usd_wallet],
+            [self.food, self.transport, self.salary],
+            self.merchants,
+            n,
+            **kwargs,
+        )
+
+    def get_ok(self, url, params=None):
+        def call():
+            res = self.client.get(url, params or {})
+            self.assertEqual(res.status_code, 200, res.content)
+            return res
+        return call
+
+    def post_ok(self, url, data_func, expected=201):
+        def call():
+            res = self.client.post(url, data_func(), format="json")
+            self.assertEqual(res.status_code, expected, res.content)
+            return res
+        return call
+
+    @property
+    def range_params(self):
+        today = timezone.now().date()
+        return {"from": str(today - timedelta(days=60)), "to": str(today)}
+
+
+class QueryBudgetTestCase(FinanceTestCase):
+    """
+    จำนวน SQL ต่อ endpoint ต้องคงที่ ไม่ว่าจะมีข้อมูลกี่แถว
+    (N+1 ใน serializer/view จะทำให้ test พังทันที)
+    """
+
+    SMALL = 30
+    LARGE = 300
+
+    def setUp(self):
+        super().setUp()
+        self.seed(self.SMALL)
+
+    def assertQueryBudget(self, num, func):
+        """
+        เรียก func ครั้งแรกเพื่อ warm cache (user/currency/merchant index)
+        แล้วนับ query ทั้งตอนข้อมูลน้อยและหลังเพิ่มข้อมูล
+        """
+        func()
+        with self.assertNumQueries(num):
+            func()
+
+        self.seed(self.LARGE)
+        func()
+        with self.assertNumQueries(num):
+            func()
+
+
+class WalletQueryBudgetTests(QueryBudgetTestCase):
+    def test_wallet_list(self):
+        # data version (ETag) + count + page (tx_count เป็น annotate)
+        self.assertQueryBudget(3, self.get_ok("/api/wallets/"))
+
+
+class TransactionQueryBudgetTests(QueryBudgetTestCase):
+    def test_transaction_list(self):
+        # count + page (wallet/currency/category มากับ select_related)
+        self.assertQueryBudget(2, self.get_ok("/api/transactions/"))
+
+    def test_transaction_list_filtered(self):
+        self.assertQueryBudget(2, self.get_ok("/api/transactions/", self.range_params))
+
+    def test_transaction_search(self):
+        self.assertQueryBudget(2, self.get_ok("/api/transactions/search/", {"q": "star"}))
+
+    def test_transaction_create(self):
+        data = lambda: {
+            "wallet_id": self.cash.id,
+            "type": "expense",
+            "amount": "120.00",
+            "occurred_at": timezone.now().isoformat(),
+            "merchant": "Starbucks #12",
+        }
+        # wallet, wallet.currency, change_seq, insert, category ที่จัดให้อัตโนมัติ (merchant/หมวดมาจาก cache)
+        self.assertQueryBudget(5, self.post_ok("/api/transactions/", data))
+
+    def test_transfer(self):
+        data = lambda: {
+            "from_wallet_id": self.cash.id,
+            "to_wallet_id": self.bank.id,
+            "amount": "50.00",
+        }
+        # wallet x2, currency x2, savepoint, (change_seq + insert) x2, insert link, release
+        self.assertQueryBudget(11, self.post_ok("/api/transactions/transfer/", data))
+
+    def test_trash_list(self):
+        Transaction.objects.filter(owner=self.user).update(is_deleted=True, deleted_at=timezone.now())
+        self.assertQueryBudget(2, self.get_ok("/api/transactions/deleted/"))
+
+
+class TransactionSearchTests(FinanceTestCase):
+    URL = "/api/transactions/search/"
+
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+
+        def tx(merchant, days_ago, note="", type="expense", owner=None, **extra):
+            owner = owner or self.user
+            wallet = self.cash if owner == self.user else make_wallet(owner)
+            return Transaction.objects.create(
+                owner=owner, wallet=wallet, type=type, occurred_at=now - timedelta(days=days_ago), amount=Decimal("10"),
+                currency=self.thb, base_amount=Decimal("10"), merchant=merchant, note=note, **extra,
+            )
+
+        self.exact = tx("Starbucks", 3)
+        self.prefix = tx("Starbucks Reserve", 1)
+        self.refund = tx("Starbucks refund", 2, type="income")
+        self.in_note = tx("Lotus", 0, note="coffee beans from starbucks")
+        tx("Grab", 0, note="ride")
+        tx("Starbucks", 0, is_deleted=True, deleted_at=now)
+        tx("Starbucks", 0, owner=make_user("bob"))
+
+    def ids(self, params):
+        res = self.client.get(self.URL, params)
+        self.assertEqual(res.status_code, 200, res.content)
+        return [r["id"] for r in res.json()["results"]]
+
+    def test_rank_order_and_scope(self):
+        # ตรงทั้งชื่อ > ขึ้นต้น (ใหม่ก่อน) > เจอใน note / ไม่เห็นแถวที่ลบ และของ user อื่น
+        self.assertEqual(self.ids({"q": "STARBUCKS"}), [self.exact.pk, self.prefix.pk, self.refund.pk, self.in_note.pk])
+        self.assertEqual(self.ids({"q": "beans"}), [self.in_note.pk])
+        self.assertEqual(self.ids({"q": "nothing"}), [])
+        self.assertEqual(self.client.get(self.URL, {"q": "  "}).status_code, 400)
+
+    def test_filters(self):
+        self.assertEqual(self.ids({"q": "starbucks", "type": "income"}), [self.refund.pk])
+        today = timezone.localdate()
+        window = {"from": str(today - timedelta(days=2)), "to": str(today - timedelta(days=1))}
+        self.assertEqual(self.ids({"q": "starbucks", **window}), [self.prefix.pk, self.refund.pk])
+
+    @skipUnless(connection.vendor == "postgresql", "tsvector / pg_trgm มีเฉพาะ PostgreSQL")
+    def test_postgres_fulltext_and_fuzzy(self):
+        # สะกดผิดก็เจอ (trigram) / คำใน note (tsvector) / ตรงทุกคำได้ rank สูงสุด
+        self.assertEqual(set(self.ids({"q": "starbuks"})), {self.exact.pk, self.prefix.pk, self.refund.pk, self.in_note.pk})
+        self.assertEqual(self.ids({"q": "coffee beans"}), [self.in_note.pk])
+        self.assertEqual(self.ids({"q": "starbucks reserve"})[0], self.prefix.pk)
+        self.assertEqual(self.ids({"q": "starbucks", "type": "income"}), [self.refund.pk])
+
+
+class TransactionTrashTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seed(5)
+
+    def test_delete_and_restore(self):
+        tx = Transaction.objects.filter(owner=self.user).first()
+        self.assertEqual(self.client.delete(f"/api/transactions/{tx.pk}/").status_code, 204)
+        tx.refresh_from_db()
+        self.assertTrue(tx.is_deleted)
+        self.assertIsNotNone(tx.deleted_at)
+
+        trash = self.client.get("/api/transactions/deleted/").json()
+        self.assertEqual([r["id"] for r in trash["results"]], [tx.pk])
+
+        res = self.client.post(f"/api/transactions/{tx.pk}/restore/")
+        self.assertEqual(res.status_code, 200, res.content)
+        self.assertFalse(res.json()["is_deleted"])
+        tx.refresh_from_db()
+        self.assertFalse(tx.is_deleted)
+        self.assertIsNone(tx.deleted_at)
+        # ไม่อยู่ในถังขยะแล้ว
+        self.assertEqual(self.client.post(f"/api/transactions/{tx.pk}/restore/").status_code, 404)
+
+    def test_bulk_restore(self):
+        ids = list(Transaction.objects.filter(owner=self.user).values_list("pk", flat=True)[:5])
+        Transaction.objects.filter(pk__in=ids).update(is_deleted=True, deleted_at=timezone.now())
+
+        res = self.client.post("/api/transactions/restore/", {"ids": ids[:3]}, format="json")
+        self.assertEqual(res.json(), {"restored": 3})
+        res = self.client.post("/api/transactions/restore/", {"all": True}, format="json")
+        self.assertEqual(res.json(), {"restored": 2})
+        self.assertEqual(self.client.post("/api/transactions/restore/", {"ids": "1"}, format="json").status_code, 400)
+
+    def test_purge_archives_old_deleted_rows(self):
+        out_tx, in_tx, recent = Transaction.objects.filter(owner=self.user)[:3]
+        link = TransferLink.objects.create(out_tx=out_tx, in_tx=in_tx)
+        old = timezone.now() - timedelta(days=31)
+        Transaction.objects.filter(pk__in=[out_tx.pk, in_tx.pk]).update(is_deleted=True, deleted_at=old)
+        Transaction.objects.filter(pk=recent.pk).update(is_deleted=True, deleted_at=timezone.now())
+
+        with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media, TRANSACTION_PURGE_AFTER_DAYS=30):
+            result = services_archive.purge_deleted_transactions(chunk_size=1)
+            self.assertEqual(result["default"]["transactions"], 2)
+            self.assertEqual(result["default"]["links"], 1)
+            # chunk_size=1 แต่สองขาของ transfer ลงไฟล์เดียวกัน
+            self.assertEqual(len(result["default"]["files"]), 1)
+            self.assertFalse(Transaction.objects.filter(pk__in=[out_tx.pk, in_tx.pk]).exists())
+            self.assertFalse(TransferLink.objects.filter(pk=link.pk).exists())
+            # ยังอยู่ใน grace period
+            self.assertTrue(Transaction.objects.filter(pk=recent.pk).exists())
+
+            self.assertEqual(services_archive.restore_archive(result["default"]["files"][0]), (2, 1))
+            restored = Transaction.objects.get(pk=out_tx.pk)
+            self.assertTrue(restored.is_deleted)
+            self.assertEqual(restored.created_at, out_tx.created_at)
+            self.assertEqual(restored.base_amount, out_tx.base_amount)
+            self.assertTrue(TransferLink.objects.filter(pk=link.pk, out_tx=out_tx, in_tx=in_tx).exists())
+
+    def test_purge_keeps_transfer_until_both_legs_expire(self):
+        out_tx, in_tx = Transaction.objects.filter(owner=self.user)[:2]
+        link = TransferLink.objects.create(out_tx=out_tx, in_tx=in_tx)
+        old = timezone.now() - timedelta(days=31)
+        Transaction.objects.filter(pk=out_tx.pk).update(is_deleted=True, deleted_at=old)
+
+        with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media, TRANSACTION_PURGE_AFTER_DAYS=30):
+            # อีกขายังใช้อยู่ -> ไม่ลบขาที่หมดเวลาแล้ว (ไม่ทิ้ง link ไว้ครึ่งเดียว)
+            result = services_archive.purge_deleted_transactions()
+            self.assertEqual(result["default"]["transactions"], 0)
+            # อีกขาเพิ่งลบ (ยังอยู่ใน grace period) -> ยังไม่ลบ
+            Transaction.objects.filter(pk=in_tx.pk).update(is_deleted=True, deleted_at=timezone.now())
+            result = services_archive.purge_deleted_transactions()
+            self.assertEqual(result["default"]["transactions"], 0)
+            self.assertTrue(TransferLink.objects.filter(pk=link.pk).exists())
+
+            Transaction.objects.filter(pk=in_tx.pk).update(deleted_at=old)
+            result = services_archive.purge_deleted_transactions()
+            self.assertEqual((result["default"]["transactions"], result["default"]["links"]), (2, 1))
+
+
+class MerchantTests(FinanceTestCase):
+    def test_alias_for_other_users_merchant_rejected(self):
+        other = make_user("bob")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(other)}")
+        data = {"pattern": "sbux", "match_type": "prefix", "merchant_id": self.merchants[0].id}
+        res = self.client.post("/api/merchant-aliases/", data, format="json")
+        self.assertEqual(res.status_code, 400, res.content)
+        self.assertIn("merchant_id", res.json())
+        self.assertNotIn(self.merchants[0].name, res.content.decode())
+
+    def test_autocomplete_orders_by_usage(self):
+        self.seed(len(MERCHANTS))
+        Merchant.objects.create(owner=self.user, key="star mart", name="Star Mart")
+        res = self.client.get("/api/merchants/autocomplete/", {"q": "STA"})
+        self.assertEqual([m["name"] for m in res.json()], ["Starbucks", "Star Mart"])
+        # index + usage อยู่ใน memory แล้ว
+        with self.assertNumQueries(0):
+            self.get_ok("/api/merchants/autocomplete/", {"q": "sta"})()
+
+    def test_new_merchant_extends_cached_index(self):
+        index = services_merchants.get_merchant_index(self.user.id, with_usage=True)
+        with self.captureOnCommitCallbacks(execute=True):
+            created = services_merchants.resolve_merchant(self.user.id, "Central Festival #3")
+        self.assertIs(services_merchants.get_merchant_index(self.user.id), index)
+        with self.assertNumQueries(0):
+            self.assertEqual(services_merchants.resolve_merchant(self.user.id, "central festival"), created)
+        self.assertEqual([m.id for m in index.autocomplete("cent")], [created.id])
+        self.assertEqual(index.keys, sorted(index.keys))
+
+
+def make_png(color="red"):
+    buf = io.BytesIO()
+    Image.new("RGB", (4, 4), color).save(buf, "PNG")
+    return buf.getvalue()
+
+
+class MediaTestCase(FinanceTestCase):
+    """
+    MEDIA_ROOT ชั่วคราวต่อ test
+    """
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = self.settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class ReceiptUploadTests(MediaTestCase):
+    URL = "/api/receipts/upload/"
+
+    def upload(self, content, name="r.png", content_type="image/png", **extra):
+        f = SimpleUploadedFile(name, content, content_type=content_type)
+        return self.client.post(self.URL, {"file": f}, format="multipart", **extra)
+
+    def test_upload_stores_file_with_checksum(self):
+        content = make_png()
+        res = self.upload(content)
+        self.assertEqual(res.status_code, 201, res.content)
+        receipt = Receipt.objects.get(pk=res.json()["id"])
+        self.assertEqual(receipt.checksum, hashlib.sha256(content).hexdigest())
+        with default_storage.open(receipt.file.name, "rb") as f:
+            self.assertEqual(f.read(), content)
+
+    def test_rejects_before_reading_body(self):
+        res = self.upload(make_png(), CONTENT_LENGTH=str(50 * 1024 * 1024))
+        self.assertEqual(res.status_code, 413)
+        self.assertFalse(Receipt.objects.exists())
+
+    def test_rejects_other_content_types(self):
+        res = self.upload(b"hello", name="r.txt", content_type="text/plain")
+        self.assertEqual(res.status_code, 415)
+        self.assertFalse(Receipt.objects.exists())
+
+    def test_retries_when_name_taken_concurrently(self):
+        first = self.upload(make_png("red"))
+        taken = Receipt.objects.get(pk=first.json()["id"]).file.name
+        available = default_storage.get_available_name
+        # จำลอง upload อื่นที่ได้ชื่อเดียวกันไประหว่างจองชื่อกับเปิดไฟล์
+        names = iter([taken])
+        with mock.patch.object(
+            default_storage, "get_available_name", side_effect=lambda name, **kw: next(names, None) or available(name, **kw)
+        ):
+            res = self.upload(make_png("blue"))
+        self.assertEqual(res.status_code, 201, res.content)
+        second = Receipt.objects.get(pk=res.json()["id"]).file.name
+        self.assertNotEqual(second, taken)
+        self.assertTrue(default_storage.exists(taken))
+
+    def test_storage_without_local_path(self):
+        storages = {
+            "default": {"BACKEND": "django.core.files.storage.InMemoryStorage"},
+            "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+        }
+        content = make_png()
+        with self.settings(STORAGES=storages):
+            res = self.upload(content)
+            self.assertEqual(res.status_code, 201, res.content)
+            receipt = Receipt.objects.get(pk=res.json()["id"])
+            with default_storage.open(receipt.file.name, "rb") as f:
+                self.assertEqual(f.read(), content)
+            self.assertEqual(receipt.checksum, hashlib.sha256(content).hexdigest())
+
+
+class SignedMediaTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.name = default_storage.save("receipts/test.txt", ContentFile(b"0123456789"))
+        self.url = services_media.signed_media_url(None, self.name)
+
+    def test_url_stable_within_bucket(self):
+        self.assertEqual(services_media.signed_media_url(None, self.name), self.url)
+        later = time.time() + settings.MEDIA_SIGNED_URL_BUCKET_SECONDS
+        with mock.patch("time.time", return_value=later):
+            self.assertNotEqual(services_media.signed_media_url(None, self.name), self.url)
+
+    def test_bad_and_expired_signature(self):
+        self.assertEqual(self.client.get(self.url[:-2] + "xx/").status_code, 404)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        expired = time.time() + services_media.signed_media_max_age() + 1
+        with mock.patch("time.time", return_value=expired):
+            self.assertEqual(self.client.get(self.url).status_code, 410)
+
+    def test_range_and_conditional_requests(self):
+        res = self.client.get(self.url, HTTP_RANGE="bytes=2-5")
+        self.assertEqual(res.status_code, 206)
+        self.assertEqual(b"".join(res.streaming_content), b"2345")
+        self.assertEqual(res["Content-Range"], "bytes 2-5/10")
+        etag = res["ETag"]
+
+        res = self.client.get(self.url, HTTP_RANGE="bytes=-3", HTTP_IF_RANGE=etag)
+        self.assertEqual(b"".join(res.streaming_content), b"789")
+        # If-Range ไม่ตรง (ไฟล์เปลี่ยนแล้ว) -> ทั้งไฟล์
+        res = self.client.get(self.url, HTTP_RANGE="bytes=2-5", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b"".join(res.streaming_content), b"0123456789")
+
+        res = self.client.get(self.url, HTTP_RANGE="bytes=20-")
+        self.assertEqual(res.status_code, 416)
+        self.assertEqual(res["Content-Range"], "bytes */10")
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+class ReceiptDownloadTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.receipt = Receipt.objects.create(
+            owner=self.user, file=default_storage.save("receipts/r.png", ContentFile(b"png-bytes"))
+        )
+        self.url = f"/api/receipts/{self.receipt.pk}/download/"
+
+    def test_owner_downloads(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b"".join(res.streaming_content), b"png-bytes")
+        self.assertEqual(res["Content-Type"], "image/png")
+        self.assertTrue(res["Cache-Control"].startswith("private"))
+
+    def test_other_user_gets_404(self):
+        bob = make_user("bob")
+        other = Receipt.objects.create(owner=bob, file=self.receipt.file.name)
+        self.assertEqual(self.client.get(f"/api/receipts/{other.pk}/download/").status_code, 404)
+        self.client.credentials()
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    def test_signed_file_url(self):
+        file_url = ReceiptUploadSerializer(self.receipt).data["file_url"]
+        self.client.credentials()
+        res = self.client.get(file_url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b"".join(res.streaming_content), b"png-bytes")
+
+        expired = time.time() + services_media.signed_media_max_age() + 1
+        with mock.patch("time.time", return_value=expired):
+            self.assertEqual(self.client.get(file_url).status_code, 410)
+        self.assertEqual(self.client.get(file_url[:-2] + "xx/").status_code, 404)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT_PREFIX="/protected-media/")
+    def test_accel_redirect(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res["X-Accel-Redirect"], f"/protected-media/{self.receipt.file.name}")
+        self.assertEqual(res.content, b"")
+
+    @override_settings(MEDIA_X_SENDFILE=True)
+    def test_x_sendfile(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res["X-Sendfile"], default_storage.path(self.receipt.file.name))
+
+    @override_settings(MEDIA_X_SENDFILE=True)
+    def test_x_sendfile_without_local_path(self):
+        # storage ที่ไม่มีไฟล์บนเครื่อง (เช่น S3) path() ไม่รองรับ -> redirect ไป url() ของ storage
+        with mock.patch.object(FileSystemStorage, "path", side_effect=NotImplementedError):
+            res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 302)
+        self.assertEqual(res["Location"], f"{settings.MEDIA_URL}{self.receipt.file.name}")
+        self.assertNotIn("X-Sendfile", res)
+
+
+class CategorizeTests(FinanceTestCase):
+    def rule(self, category, priority, **kwargs):
+        return CategoryRule.objects.create(owner=self.user, category=category, priority=priority, **kwargs)
+
+    def test_rule_priority_and_amount_range(self):
+        self.rule(self.food, 20, merchant_contains="grab")
+        self.rule(self.transport, 10, merchant_contains="GRAB", max_amount=Decimal("100"))
+        self.rule(self.salary, 5, min_amount=Decimal("1000"), wallet=self.bank)
+        engine = services_categorize.get_category_engine(self.user.id)
+
+        self.assertEqual(engine.classify("expense", "Grab #12", "80", self.cash.id), self.transport.id)
+        # เกิน max_amount ของกฎแรก -> ตกไปกฎถัดไป
+        self.assertEqual(engine.classify("expense", "Grab #12", "150", self.cash.id), self.food.id)
+        # กฎของหมวด income ใช้กับ income เท่านั้น + ต้องตรง wallet / min_amount
+        self.assertEqual(engine.classify("income", "ACME", "5000", self.bank.id), self.salary.id)
+        self.assertIsNone(engine.classify("income", "ACME", "5000", self.cash.id))
+        self.assertIsNone(engine.classify("income", "ACME", "999", self.bank.id))
+        self.assertIsNone(engine.classify("transfer_out", "Grab", "80", self.cash.id))
+
+    def test_learned_map_fallback(self):
+        engine = services_categorize.CategoryEngine(
+            [], [("starbucks", "expense", self.food.id, 5), ("starbucks", "expense", self.transport.id, 2)]
+        )
+        # หมวดที่ใช้บ่อยสุดของร้านนั้น / key ของ Merchant (หลัง alias) มาก่อนชื่อดิบ
+        self.assertEqual(engine.classify("expense", "STARBUCKS #0123", "99", self.cash.id), self.food.id)
+        self.assertEqual(engine.classify("expense", "SBUX", "99", self.cash.id, merchant_key="starbucks"), self.food.id)
+        self.assertIsNone(engine.classify("income", "Starbucks", "99", self.cash.id))
+
+    def test_backfill_uses_rules(self):
+        rows = make_transactions(self.user, [self.cash], [self.food], [self.merchants[2]] * 2 + [self.merchants[0]], 3)
+        Transaction.objects.filter(pk__in=[tx.pk for tx in rows]).update(category=None)
+        self.rule(self.transport, 10, merchant_contains="grab")
+        self.assertEqual(services_categorize.categorize_uncategorized(owner_id=self.user.id, chunk_size=1), 2)
+        self.assertEqual(
+            dict(Transaction.objects.values_list("merchant", "category_id").distinct()),
+            {"Grab": self.transport.id, "Starbucks": None},
+        )
+
+    def test_apply_runs_in_background(self):
+        with mock.patch("finance.tasks.categorize_uncategorized_task.delay") as delay:
+            res = self.client.post("/api/category-rules/apply/")
+        self.assertEqual(res.status_code, 202)
+        delay.assert_called_once_with(self.user.id)
+
+        with mock.patch("finance.tasks.categorize_uncategorized_task.delay", side_effect=ConnectionError):
+            self.assertEqual(self.client.post("/api/category-rules/apply/").status_code, 503)
+
+
+class BaseCurrencyRebaseTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.rows = self.seed(6)
+        today = timezone.localdate()
+        FxRate.objects.bulk_create(
+            [FxRate(date=today - timedelta(days=i), base=self.usd, quote=self.thb, rate=Decimal("35")) for i in range(1, 4)]
+        )
+        self.budget = Budget.objects.create(owner=self.user, month=f"{today:%Y-%m}", limit_base_amount=Decimal("3500.00"))
+
+    def change_base(self, code):
+        with mock.patch("finance.tasks.rebase_base_currency_task.apply_async") as apply_async, \
+                self.captureOnCommitCallbacks(execute=True):
+            res = self.client.patch("/api/auth/me/", {"profile": {"base_currency": code}}, format="json")
+        return res, apply_async
+
+    def test_change_base_currency(self):
+        res, apply_async = self.change_base("USD")
+        self.assertEqual(res.status_code, 200, res.content)
+        self.assertTrue(res.json()["profile"]["rebasing"])
+        job = BaseCurrencyRebase.objects.get()
+        self.assertEqual((job.from_currency, job.to_currency), ("THB", "USD"))
+        apply_async.assert_called_once()
+
+        res = self.client.get("/api/reports/summary/", self.range_params)
+        self.assertEqual(res.status_code, 409, res.content)
+        self.assertEqual(res.json()["code"], "rebasing")
+        # งานเดิมยังไม่เสร็จ เปลี่ยนซ้ำไม่ได้
+        self.assertEqual(self.change_base("EUR")[0].status_code, 400)
+
+        services_rebase.rebase(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, BaseCurrencyRebase.Status.DONE)
+        self.assertEqual(job.progress["transactions"], {"done": len(self.rows), "total": len(self.rows)})
+
+        for tx in Transaction.objects.filter(owner=self.user):
+            if tx.currency_id == self.usd.id:
+                self.assertEqual((tx.fx_rate, tx.base_amount), (Decimal("1"), tx.amount))
+            else:
+                self.assertEqual(tx.base_amount, (tx.amount / Decimal("35")).quantize(Decimal("0.01")))
+        self.budget.refresh_from_db()
+        self.assertEqual(self.budget.limit_base_amount, Decimal("100.00"))
+
+        res = self.client.get("/api/reports/summary/", self.range_params)
+        self.assertEqual(res.status_code, 200, res.content)
+        self.assertEqual(res.json()["base_currency"], "USD")
+
+    def test_rate_changed_during_rebase(self):
+        day = timezone.localdate() - timedelta(days=1)
+        resolve = services_rebase._resolve_rates
+
+        def resolve_then_correct(*args):
+            result = resolve(*args)
+            # แก้ rate หลัง rebase อ่านไปแล้ว (revaluation ข้าม user นี้เพราะ rebasing=True)
+            if not FxRate.objects.filter(date=day, rate=Decimal("40")).exists():
+                FxRate.objects.filter(date=day, base=self.usd, quote=self.thb).update(rate=Decimal("40"))
+                self.assertEqual(services_fx.revalue_fx_rate(day, "USD", "THB"), {"default": 0})
+            return result
+
+        self.change_base("USD")
+        with mock.patch.object(services_rebase, "_resolve_rates", side_effect=resolve_then_correct):
+            services_rebase.rebase(BaseCurrencyRebase.objects.get().pk)
+
+        lo, hi = partitioning.day_bounds(day)
+        rows = Transaction.objects.filter(owner=self.user, currency=self.thb, occurred_at__gte=lo, occurred_at__lt=hi)
+        self.assertTrue(rows)
+        self.assertEqual({tx.fx_rate for tx in rows}, {Decimal("0.025")})
+
+    def test_missing_rates(self):
+        FxRate.objects.filter(date=timezone.localdate() - timedelta(days=1)).delete()
+        before = dict(Transaction.objects.values_list("pk", "base_amount"))
+        self.change_base("USD")
+        job = BaseCurrencyRebase.objects.get()
+
+        with self.assertRaises(ValueError):
+            services_rebase.rebase(job.pk)
+        job.refresh_from_db()
+        self.assertEqual(job.status, BaseCurrencyRebase.Status.FAILED)
+        self.assertTrue(job.progress["missing_rates"])
+        self.assertEqual(dict(Transaction.objects.values_list("pk", "base_amount")), before)
+
+        # เพิ่ม rate ที่ขาดแล้วรันต่อ
+        FxRate.objects.create(date=timezone.localdate() - timedelta(days=1), base=self.usd, quote=self.thb, rate=Decimal("35"))
+        self.assertEqual(services_rebase.resume_rebases(), 1)
+        self.assertEqual(BaseCurrencyRebase.objects.get().status, BaseCurrencyRebase.Status.DONE)
+
+
+class FxRevaluationTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.eur = make_currency("EUR")
+        self.eur_wallet = make_wallet(self.user, "Euro", currency=self.eur)
+        self.day = timezone.localdate() - timedelta(days=1)
+
+    def post_eur(self, **extra):
+        data = {
+            "wallet_id": self.eur_wallet.id,
+            "type": "expense",
+            "amount": "10.00",
+            "occurred_at": partitioning.day_bounds(self.day)[0].isoformat(),
+            **extra,
+        }
+        return self.client.post("/api/transactions/", data, format="json")
+
+    def test_pending_fx_filled_when_rate_arrives(self):
+        self.assertEqual(self.post_eur().status_code, 400)
+        res = self.post_eur(allow_pending_fx=True)
+        self.assertEqual(res.status_code, 201, res.content)
+        self.assertTrue(res.json()["fx_pending"])
+        self.assertEqual(res.json()["base_amount"], "0.00")
+        insight = AiInsight.objects.create(owner=self.user, month=f"{self.day:%Y-%m}", content="-")
+
+        with mock.patch("finance.tasks.revalue_fx_rate_task.delay") as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            FxRate.objects.create(date=self.day, base=self.thb, quote=self.eur, rate=Decimal("0.025"))
+        delay.assert_called_once_with(self.day.isoformat(), "THB", "EUR")
+
+        # มีแต่ THB->EUR -> EUR->THB ใช้ 1/rate
+        self.assertEqual(services_fx.revalue_fx_rate(self.day, "THB", "EUR"), {"default": 1})
+        tx = Transaction.objects.get(pk=res.json()["id"])
+        self.assertFalse(tx.fx_pending)
+        self.assertEqual((tx.fx_rate, tx.base_amount), (Decimal("40"), Decimal("400.00")))
+        insight.refresh_from_db()
+        self.assertTrue(insight.stale)
+
+    def test_corrected_rate(self):
+        rate = FxRate.objects.create(date=self.day, base=self.eur, quote=self.thb, rate=Decimal("40"))
+        tx_id = self.post_eur().json()["id"]
+        rate.rate = Decimal("38")
+        rate.save()
+
+        services_fx.revalue_fx_rate(self.day, "EUR", "THB")
+        tx = Transaction.objects.get(pk=tx_id)
+        self.assertEqual(tx.base_amount, Decimal("380.00"))
+
+        # กำลัง rebase -> ไม่แตะ (services_rebase ทำเองตอนจบ)
+        UserProfile.objects.filter(user=self.user).update(rebasing=True)
+        rate.rate = Decimal("39")
+        rate.save()
+        self.assertEqual(services_fx.revalue_fx_rate(self.day, "EUR", "THB"), {"default": 0})
+        self.assertEqual(Transaction.objects.get(pk=tx_id).base_amount, Decimal("380.00"))
+        # วันอื่น / สกุลอื่นไม่โดน
+        self.seed(6)
+        self.assertFalse(Transaction.objects.exclude(pk=tx_id).filter(fx_rate=Decimal("38")).exists())
+
+
+class IdempotencyTests(FinanceTestCase):
+    now = timezone.now().isoformat()
+
+    def post(self, url, data, key):
+        return self.client.post(url, data, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_without_creating(self):
+        data = {"wallet_id": self.cash.id, "type": "expense", "amount": "120.00", "occurred_at": self.now, "merchant": "Grab"}
+        first = self.post("/api/transactions/", data, "k1")
+        self.assertEqual(first.status_code, 201, first.content)
+        count = Transaction.objects.count()
+
+        # lookup key อย่างเดียว
+        with self.assertNumQueries(1):
+            retry = self.post("/api/transactions/", data, "k1")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Transaction.objects.count(), count)
+
+        res = self.post("/api/transactions/", {**data, "amount": "99.00"}, "k1")
+        self.assertEqual(res.status_code, 422, res.content)
+
+    def test_transfer_replay(self):
+        data = {"from_wallet_id": self.cash.id, "to_wallet_id": self.bank.id, "amount": "50.00"}
+        first = self.post("/api/transactions/transfer/", data, "t1")
+        self.assertEqual(first.status_code, 201, first.content)
+        retry = self.post("/api/transactions/transfer/", data, "t1")
+        self.assertEqual(retry.json()["link_id"], first.json()["link_id"])
+        self.assertEqual(TransferLink.objects.count(), 1)
+
+    def test_failed_request_is_not_stored(self):
+        self.assertEqual(self.post("/api/transactions/", {"type": "expense"}, "k2").status_code, 400)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_expired_keys(self):
+        data = {"wallet_id": self.cash.id, "type": "expense", "amount": "10.00", "occurred_at": self.now}
+        self.post("/api/transactions/", data, "k3")
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        # หมดอายุแล้ว -> ทำใหม่
+        self.assertNotIn("Idempotent-Replayed", self.post("/api/transactions/", data, "k3"))
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(services_idempotency.purge_expired_idempotency_keys(), {"default": 1})
+
+
+class DeltaSyncTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seed(6)
+
+    def sync_all(self, since=None, limit=2):
+        """
+        ดึงทีละ batch จนหมด คืน (cursor สุดท้าย, changes รวม, deleted รวม)
+        """
+        changes, deleted = {}, []
+        while True:
+            params = {"limit": limit, **({"since": since} if since else {})}
+            res = self.client.get("/api/sync/", params)
+            self.assertEqual(res.status_code, 200, res.content)
+            body = res.json()
+            for name, rows in body["changes"].items():
+                changes.setdefault(name, []).extend(rows)
+            deleted += body["deleted"]
+            since = body["cursor"]
+            if not body["has_more"]:
+                return since, changes, deleted
+
+    def test_initial_then_delta(self):
+        cursor, changes, _ = self.sync_all()
+        self.assertEqual(len(changes["wallets"]), 3)
+        self.assertEqual(len(changes["categories"]), 3)
+
+        # ไม่มีอะไรเปลี่ยน -> ว่าง cursor เดิม
+        again, changes, deleted = self.sync_all(cursor)
+        self.assertEqual(again, cursor)
+        self.assertFalse(any(changes.values()) or deleted)
+
+        data = {"wallet_id": self.cash.id, "type": "expense", "amount": "120.00", "occurred_at": timezone.now().isoformat(), "category_id": self.food.id}
+        tx_id = self.client.post("/api/transactions/", data, format="json").json()["id"]
+        self.client.patch(f"/api/wallets/{self.bank.id}/", {"name": "Bank 2"}, format="json")
+        self.assertEqual(self.client.delete(f"/api/categories/{self.food.id}/").status_code, 204)
+
+        cursor, changes, deleted = self.sync_all(cursor)
+        # category ถูกลบ -> transaction ที่ SET_NULL (รวมของเดิมใน setUp) ส่งมาใหม่ด้วย
+        food_ids = set(Transaction.objects.filter(category__isnull=True).values_list("pk", flat=True))
+        self.assertIn(tx_id, food_ids)
+        self.assertEqual({r["id"] for r in changes["transactions"]}, food_ids)
+        self.assertTrue(all(r["category_id"] is None for r in changes["transactions"]))
+        self.assertEqual([r["name"] for r in changes["wallets"]], ["Bank 2"])
+        self.assertEqual(deleted, [{"model": "categories", "id": self.food.id}])
+
+        self.client.delete(f"/api/transactions/{tx_id}/")
+        _, changes, _ = self.sync_all(cursor)
+        self.assertTrue(changes["transactions"][0]["is_deleted"])
+
+    def test_purged_tombstones_require_resync(self):
+        cursor, _, _ = self.sync_all()
+        self.client.delete(f"/api/categories/{self.transport.id}/")
+        self.assertEqual(self.client.get("/api/sync/", {"since": "x"}).status_code, 400)
+
+        services_sync.purge_sync_tombstones(now=timezone.now() + timedelta(days=365))
+        self.assertEqual(SyncCounter.objects.get(owner=self.user).purged_seq, SyncCounter.objects.get(owner=self.user).value)
+        res = self.client.get("/api/sync/", {"since": cursor})
+        self.assertEqual(res.status_code, 410, res.content)
+        # sync ใหม่ทั้งหมดได้
+        self.assertEqual(self.client.get("/api/sync/").status_code, 200)
+
+
+class SyncQueryBudgetTests(QueryBudgetTestCase):
+    def test_sync(self):
+        # transaction, wallet, category, budget, recurring, tombstone (ไม่ขึ้นกับจำนวนแถว)
+        self.assertQueryBudget(6, self.get_ok("/api/sync/", {"limit": 50}))
+
+
+class ReportQueryBudgetTests(QueryBudgetTestCase):
+    # ทุก report: +1 query อ่าน data version ของ ETag
+    def test_summary(self):
+        # income/expense/count เป็น aggregate เดียว
+        self.assertQueryBudget(2, self.get_ok("/api/reports/summary/", self.range_params))
+
+    def test_by_category(self):
+        self.assertQueryBudget(2, self.get_ok("/api/reports/by-category/", self.range_params))
+
+    def test_trend(self):
+        params = {**self.range_params, "interval": "weekly"}
+        self.assertQueryBudget(2, self.get_ok("/api/reports/trend/", params))
+
+    def test_top_merchants(self):
+        self.assertQueryBudget(2, self.get_ok("/api/reports/top-merchants/", self.range_params))
+
+    @property
+    def as_of(self):
+        return {"as_of": str(timezone.now().date())}
+
+    def test_wallet_balances(self):
+        # wallets + grouped totals (รันพร้อมกัน) + fx ของทุก wallet สกุลอื่นใน query เดียว
+        self.assertQueryBudget(4, self.get_ok("/api/reports/wallet-balances/", self.as_of))
+
+    def test_wallet_balances_more_wallets(self):
+        extra = [make_wallet(self.user, f"Pocket {i}") for i in range(5)]
+        make_transactions(self.user, extra, [self.food], self.merchants, 50)
+        self.assertQueryBudget(4, self.get_ok("/api/reports/wallet-balances/", self.as_of))
+
+
+class WalletBalanceTests(FinanceTestCase):
+    def test_rate_of_local_day(self):
+        # 03:00 เวลาไทย = 20:00 UTC ของวันก่อนหน้า -> ต้องใช้ rate ของวันตามเวลาไทย
+        day = timezone.localdate() - timedelta(days=5)
+        FxRate.objects.create(date=day, base=self.usd, quote=self.thb, rate=Decimal("30"))
+        occurred_at = partitioning.day_bounds(day)[0] + timedelta(hours=3)
+        data = {"wallet_id": self.usd_wallet.id, "type": "income", "amount": "10.00", "occurred_at": occurred_at.isoformat()}
+        self.assertEqual(self.client.post("/api/transactions/", data, format="json").status_code, 201)
+
+        res = self.client.get("/api/reports/wallet-balances/")
+        self.assertEqual(res.status_code, 200, res.content)
+        usd = next(i for i in res.json()["items"] if i["currency"] == "USD")
+        self.assertEqual(usd["base_balance"], "30300.00")
+
+
+class ConditionalGetTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        self.seed(4)
+
+    def test_not_modified_until_data_changes(self):
+        url = "/api/reports/summary/"
+        first = self.client.get(url, self.range_params)
+        etag = first["ETag"]
+        self.assertEqual(first["Cache-Control"], "private, no-cache")
+
+        # 304 ก่อน query ของ report: อ่าน data version อย่างเดียว
+        with self.assertNumQueries(1):
+            res = self.client.get(url, self.range_params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res["ETag"], etag)
+        # ช่วงวันที่อื่น = representation อื่น
+        other = {**self.range_params, "from": self.range_params["to"]}
+        self.assertEqual(self.client.get(url, other, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        data = {"wallet_id": self.cash.id, "type": "expense", "amount": "120.00", "occurred_at": timezone.now().isoformat()}
+        self.client.post("/api/transactions/", data, format="json")
+        res = self.client.get(url, self.range_params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+        self.assertNotEqual(res["ETag"], etag)
+
+    def test_merchant_rename_changes_etag(self):
+        etag = self.client.get("/api/reports/top-merchants/", self.range_params)["ETag"]
+        self.client.patch(f"/api/merchants/{self.merchants[0].id}/", {"name": "Renamed"}, format="json")
+        res = self.client.get("/api/reports/top-merchants/", self.range_params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+
+    def test_reference_data_changes_etag(self):
+        url = "/api/reports/wallet-balances/"
+        params = {"as_of": str(timezone.now().date() - timedelta(days=400))}
+        rate = FxRate.objects.create(date=params["as_of"], base=self.usd, quote=self.thb, rate=Decimal("30"))
+        etag = self.client.get(url, params)["ETag"]
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # rate ของวันที่ไม่มี transaction ไม่ขยับ version ของ user แต่ขยับ reference version
+        rate.rate = Decimal("31")
+        rate.save()
+        res = self.client.get(url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(res.status_code, 200)
+
+        wallets = self.client.get("/api/wallets/")["ETag"]
+        Currency.objects.filter(pk=self.usd.pk).update(symbol="US$")
+        services_etag.bump_reference_version()
+        self.assertEqual(self.client.get("/api/wallets/", HTTP_IF_NONE_MATCH=wallets).status_code, 200)
+        self.usd.refresh_from_db()
+        self.usd.save()
+        self.assertEqual(self.client.get(url, params, HTTP_IF_NONE_MATCH=res["ETag"]).status_code, 200)
+
+    def test_lists(self):
+        for url in ("/api/wallets/", "/api/categories/"):
+            etag = self.client.get(url)["ETag"]
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=f'W/{etag}').status_code, 304)
+
+
+class RealtimeTests(FinanceTestCase):
+    def test_write_publishes_after_commit(self):
+        data = {"wallet_id": self.cash.id, "type": "expense", "amount": "120.00", "occurred_at": timezone.now().isoformat()}
+        with mock.patch.object(realtime, "publish") as publish:
+            with self.captureOnCommitCallbacks(execute=True):
+                self.client.post("/api/transactions/", data, format="json")
+                publish.assert_not_called()
+        publish.assert_called_with(self.user.pk, {"type": "changed"})
+
+    def test_snapshot_diff(self):
+        Budget.objects.create(
+            owner=self.user, month=timezone.now().strftime("%Y-%m"), scope=Budget.Scope.TOTAL, limit_base_amount=Decimal("1000")
+        )
+        before = services_realtime.snapshot(self.user.pk)
+        data = {"wallet_id": self.cash.id, "type": "expense", "amount": "120.00", "occurred_at": timezone.now().isoformat()}
+        self.client.post("/api/transactions/", data, format="json")
+        changed = services_realtime.diff(before, services_realtime.snapshot(self.user.pk))
+
+        self.assertEqual([w["id"] for w in changed["wallets"]], [self.cash.id])
+        self.assertEqual(
+            Decimal(changed["wallets"][0]["balance"]), Decimal(before["wallets"][self.cash.id]) - Decimal("120.00")
+        )
+        self.assertEqual(len(changed["budgets"]), 1)
+        self.assertIsNone(services_realtime.diff(before, before))
+
+    def test_memory_broker(self):
+        broker = realtime.MemoryBroker()
+
+        async def run():
+            async with broker.subscribe(self.user.pk) as queue:
+                broker.publish(self.user.pk, {"type": "changed"})
+                broker.publish(self.user.pk + 1, {"type": "other"})
+                return await asyncio.wait_for(queue.get(), 1), queue.qsize()
+
+        self.assertEqual(asyncio.run(run()), ({"type": "changed"}, 0))
+        # ปิด connection แล้วไม่เหลือ subscriber ค้าง
+        self.assertFalse(broker._subscribers)
+
+    def test_stream_auth(self):
+        def auth(query=b"", headers=()):
+            return services_realtime._authenticate({"query_string": query, "headers": list(headers)})
+
+        access = str(AccessToken.for_user(self.user))
+        res = self.client.post("/api/events/token/")
+        self.assertEqual(res.status_code, 200)
+        token = res.json()["token"]
+
+        self.assertEqual(auth(f"token={token}".encode()), self.user.pk)
+        self.assertEqual(auth(headers=[(b"authorization", f"Bearer {access}".encode())]), self.user.pk)
+        # access token ใน URL ใช้ไม่ได้แล้ว / stream token ใช้แทน access token ไม่ได้
+        self.assertIsNone(auth(f"token={access}".encode()))
+        self.assertIsNone(auth(headers=[(b"authorization", f"Bearer {token}".encode())]))
+        self.assertIsNone(auth(f"token={token[:-2]}xx".encode()))
+        with override_settings(REALTIME_STREAM_TOKEN_MAX_AGE=-1):
+            self.assertIsNone(auth(f"token={token}".encode()))
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        invalidate_user_cache(self.user.pk)
+        self.assertIsNone(auth(f"token={token}".encode()))
+
+    def test_redis_broker_timeouts(self):
+        fake = mock.MagicMock()
+        with mock.patch.dict("sys.modules", {"redis": fake}), override_settings(REALTIME_BROKER_TIMEOUT_SECONDS=2):
+            realtime.RedisBroker("redis://localhost:6379/0")
+        fake.Redis.from_url.assert_called_once_with("redis://localhost:6379/0", socket_timeout=2, socket_connect_timeout=2)
+
+
+class BudgetQueryBudgetTests(QueryBudgetTestCase):
+    def setUp(self):
+        super().setUp()
+        month = timezone.now().strftime("%Y-%m")
+        self.month = month
+        Budget.objects.bulk_create([
+            Budget(owner=self.user, month=month, scope=Budget.Scope.TOTAL, limit_base_amount=Decimal("50000")),
+            Budget(owner=self.user, month=month, scope=Budget.Scope.CATEGORY, category=self.food, limit_base_amount=Decimal("8000")),
+            Budget(owner=self.user, month=month, scope=Budget.Scope.CATEGORY, category=self.transport, limit_base_amount=Decimal("3000")),
+        ])
+
+    def test_budget_status(self):
+        # data version (ETag) + budgets + aggregate เดียวสำหรับทุก budget
+        self.assertQueryBudget(3, self.get_ok("/api/budgets/status/", {"month": self.month}))
+
+
+class BudgetStatusTests(FinanceTestCase):
+    def test_spent_per_budget(self):
+        month = timezone.now().strftime("%Y-%m")
+        now = timezone.now()
+        for category, amount in ((self.food, "100.00"), (self.transport, "40.00"), (None, "7.00")):
+            Transaction.objects.create(
+                owner=self.user, wallet=self.cash, type="expense", occurred_at=now, amount=Decimal(amount),
+                currency=self.thb, base_amount=Decimal(amount), category=category,
+            )
+        total, food, orphan = Budget.objects.bulk_create([
+            Budget(owner=self.user, month=month, scope=Budget.Scope.TOTAL, limit_base_amount=Decimal("500")),
+            Budget(owner=self.user, month=month, scope=Budget.Scope.CATEGORY, category=self.food, limit_base_amount=Decimal("200")),
+            Budget(owner=self.user, month=month, scope=Budget.Scope.CATEGORY, category=self.transport, limit_base_amount=Decimal("70")),
+        ])
+        # หมวดของ budget ถูกลบ (SET_NULL) -> นับรายจ่ายที่ไม่มีหมวด
+        Budget.objects.filter(pk=orphan.pk).update(category=None)
+
+        items = {i["budget_id"]: i for i in self.client.get("/api/budgets/status/", {"month": month}).json()["items"]}
+        self.assertEqual(items[total.pk]["spent"], "147.00")
+        self.assertEqual((items[food.pk]["spent"], items[food.pk]["percent_used"]), ("100.00", "50.00"))
+        self.assertEqual((items[orphan.pk]["spent"], items[orphan.pk]["title"]), ("7.00", "Category: Uncategorized"))
+        self.assertEqual(services_realtime.snapshot(self.user.pk)["budgets"][orphan.pk], "10.00")
+
+
+class RecurringQueryBudgetTests(QueryBudgetTestCase):
+    DUE = 3
+
+    def make_due(self):
+        now = timezone.now()
+        RecurringTransaction.objects.bulk_create([
+            RecurringTransaction(
+                owner=self.user,
+                wallet=self.cash,
+                category=self.food if i % 2 else None,
+                type="expense",
+                amount=Decimal("99.00"),
+                merchant=MERCHANTS[i % len(MERCHANTS)],
+                frequency=RecurringTransaction.Frequency.MONTHLY,
+                start_date=now.date(),
+                next_run_at=now - timedelta(minutes=1),
+            )
+            for i in range(self.DUE)
+        ])
+
+    def test_run_due(self):
+        def call():
+            RecurringTransaction.objects.all().delete()
+            self.make_due()
+            self.assertEqual(run_due(), self.DUE)
+
+        # เตรียมข้อมูล (delete + insert) + savepoint/select due/release
+        # + ต่อรายการ: change_seq + insert tx, change_seq + update next_run_at
+        self.assertQueryBudget(2 + 3 + 4 * self.DUE, call)
+
+
+class AiQueryBudgetTests(QueryBudgetTestCase):
+    def test_monthly_stats(self):
+        month = timezone.now().strftime("%Y-%m")
+        # ยอดรวม + by category + by merchant
+        self.assertQueryBudget(3, lambda: build_monthly_stats(self.user, month))
+
+    @mock.patch("finance.services_ai.ai_monthly_summary_text", side_effect=RuntimeError("offline"))
+    def test_monthly_summary(self, _ai):
+        month = timezone.now().strftime("%Y-%m")
+        data = lambda: {"month": month, "language": "en"}
+        self.assertQueryBudget(7, self.post_ok("/api/ai/monthly-summary/", data, expected=200))
+        self.assertQueryBudget(1, self.get_ok("/api/ai/monthly-summary/", {"month": month, "language": "en"}))
+
+
+class ReplicaRoutingTests(FinanceTestCase):
+    """
+    ใช้ alias "default" แทน replica แต่จดว่า router เลือก replica ตอนไหน
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.replica_reads = []
+
+        def spy(alias="default"):
+            self.replica_reads.append(alias)
+            return alias
+
+        patcher = mock.patch("config.db_routers.replica_alias", side_effect=spy)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_router_decisions(self):
+        router = db_routers.ReplicaRouter()
+        with mock.patch("config.db_routers.replica_alias", return_value="replica"):
+            with db_routers.pinning():
+                with db_routers.pinning():
+                    self.assertEqual(router.db_for_read(Transaction), "default")
+                    with db_routers.use_replica():
+                        self.assertEqual(router.db_for_read(Transaction), "replica")
+                        self.assertEqual(router.db_for_write(Transaction), "default")
+                        # เขียนแล้ว -> อ่านจาก primary จนจบ request
+                        self.assertEqual(router.db_for_read(Transaction), "default")
+                # จบ request แล้ว pin ไม่ติดไปกับ request ถัดไปใน thread เดียวกัน
+                self.assertFalse(db_routers.is_pinned())
+        with self.settings(DATABASE_REPLICAS={"default": "replica"}):
+            self.assertFalse(router.allow_migrate("replica", "finance"))
+            self.assertTrue(router.allow_migrate("default", "finance"))
+
+    def test_reports_and_lists_read_from_replica(self):
+        self.client.cookies.clear()
+        for url, params in (
+            ("/api/reports/summary/", self.range_params),
+            ("/api/transactions/", {}),
+            ("/api/wallets/", {}),
+        ):
+            self.replica_reads.clear()
+            self.get_ok(url, params)()
+            self.assertTrue(self.replica_reads, url)
+
+    def test_detail_reads_from_primary(self):
+        self.get_ok(f"/api/wallets/{self.cash.id}/")()
+        self.assertFalse(self.replica_reads)
+
+    def test_reads_after_write_stay_on_primary(self):
+        res = self.client.post(
+            "/api/transactions/transfer/",
+            {"from_wallet_id": self.cash.id, "to_wallet_id": self.bank.id, "amount": "50.00"},
+            format="json",
+        )
+        self.assertEqual(res.status_code, 201, res.content)
+        self.assertIn("db_pin", res.cookies)
+
+        # cookie ยังไม่หมดอายุ -> list ถัดไปอ่านจาก primary
+        self.get_ok("/api/transactions/")()
+        self.assertFalse(self.replica_reads)
+
+        self.client.cookies.clear()
+        self.get_ok("/api/transactions/")()
+        self.assertTrue(self.replica_reads)
+
+
+@skipUnless(connection.vendor == "postgresql", "partition รายเดือนมีเฉพาะ PostgreSQL")
+class PartitionTests(FinanceTestCase):
+    def fetch(self, sql, params=()):
+        with connection.cursor() as c:
+            c.execute(sql, params)
+            return c.fetchall()
+
+    def test_rebuild_keeps_rows_and_indexes(self):
+        self.seed(6)
+        before = sorted(Transaction.objects.values_list("id", "occurred_at", "base_amount"))
+        partitioning.rebuild_transaction_table(connection, partitioned=False)
+        self.assertFalse(partitioning.is_partitioned(connection))
+        partitioning.rebuild_transaction_table(connection, partitioned=True, months_ahead=1)
+        self.assertTrue(partitioning.is_partitioned(connection))
+
+        self.assertEqual(sorted(Transaction.objects.values_list("id", "occurred_at", "base_amount")), before)
+        names = [name for name, _ in partitioning.list_partitions(connection)]
+        month = partitioning.month_start(timezone.localdate())
+        self.assertIn(partitioning.partition_name(partitioning.add_months(month, 1)), names)
+        self.assertIn(partitioning.DEFAULT_PARTITION, names)
+        indexes = {name for (name,) in self.fetch("SELECT indexname FROM pg_indexes WHERE tablename = %s", [partitioning.TABLE])}
+        self.assertLessEqual({"finance_tx_live_type_time", "finance_tx_live_time", "finance_tx_live_wallet_time"}, indexes)
+        # sequence ใหม่ต่อจาก id เดิม
+        tx = make_transactions(self.user, [self.cash], [self.food], self.merchants, 1)[0]
+        self.assertGreater(tx.pk, before[-1][0])
+
+    def test_create_partition_moves_rows_from_default(self):
+        month = partitioning.add_months(partitioning.month_start(timezone.localdate()), 24)
+        lo, _ = partitioning.month_bounds(month)
+        tx = make_transactions(self.user, [self.cash], [self.food], self.merchants, 1, start=lo + timedelta(days=3))[0]
+        in_default = f"SELECT count(*) FROM {partitioning.DEFAULT_PARTITION} WHERE id = %s"
+        self.assertEqual(self.fetch(in_default, [tx.pk]), [(1,)])
+
+        name = partitioning.create_partition(connection, month)
+        self.assertEqual(name, partitioning.partition_name(month))
+        self.assertEqual(self.fetch(in_default, [tx.pk]), [(0,)])
+        self.assertEqual(self.fetch(f"SELECT count(*) FROM {name} WHERE id = %s", [tx.pk]), [(1,)])
+        self.assertTrue(Transaction.objects.filter(pk=tx.pk, occurred_at=tx.occurred_at).exists())
+        self.assertIsNone(partitioning.create_partition(connection, month))
+
+
+@skipUnless(connection.vendor == "postgresql", "partial / covering index มีผลเฉพาะ PostgreSQL")
+class PartialIndexTests(FinanceTestCase):
+    INDEX = "finance_tx_live_type_time"
+
+    def test_report_query_uses_live_index(self):
+        self.seed(6)
+        with connection.cursor() as c:
+            # index ของแต่ละ partition สืบจาก index ของ parent
+            c.execute(
+                "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(%s)",
+                [self.INDEX],
+            )
+            live = {self.INDEX} | {name for (name,) in c.fetchall()}
+            # ตารางใน test เล็ก planner จะเลือก seq scan -> ปิดไว้ ดูแค่ว่า index ใช้กับ query นี้ได้
+            c.execute("SET LOCAL enable_seqscan = off")
+
+        lo, hi = partitioning.month_bounds(partitioning.month_start(timezone.localdate()))
+        qs = Transaction.objects.filter(owner=self.user, type="expense", occurred_at__gte=lo, occurred_at__lt=hi)
+        plan = qs.filter(is_deleted=False).values("category_id").annotate(total=Sum("base_amount")).explain()
+        self.assertIn("Index Only Scan", plan)
+        self.assertTrue(any(name in plan for name in live), plan)
+        # ไม่ filter is_deleted=False -> partial index ใช้ไม่ได้
+        plan = qs.values("category_id").annotate(total=Sum("base_amount")).explain()
+        self.assertFalse(any(name in plan for name in live), plan)
+
+
+class MetricsTests(FinanceTestCase):
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    @override_settings(METRICS_TOKEN="s3cret")
+    def test_metrics_requires_token(self):
+        self.client.credentials()
+        self.assertEqual(self.client.get("/metrics").status_code, 403)
+        self.assertEqual(self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer wrong").status_code, 403)
+        res = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer s3cret")
+        self.assertEqual(res.status_code, 200)
+        body = res.content.decode()
+        self.assertIn("http_request_duration_seconds", body)
+        self.assertIn("recurring_backlog_due", body)
+
+    def test_metrics_closed_without_token(self):
+        self.client.credentials()
+        with override_settings(METRICS_TOKEN="", DEBUG=False):
+            self.assertEqual(self.client.get("/metrics").status_code, 403)
+        with override_settings(METRICS_TOKEN="", DEBUG=True):
+            self.assertEqual(self.client.get("/metrics").status_code, 200)
+
+    def test_backlog_collector(self):
+        metrics.BacklogCollector._cache = None
+        self.addCleanup(setattr, metrics.BacklogCollector, "_cache", None)
+        now = timezone.now()
+        for minutes, active in [(10, True), (1, True), (60, False), (-5, True)]:
+            RecurringTransaction.objects.create(
+                owner=self.user,
+                wallet=self.cash,
+                type="expense",
+                amount=Decimal("10.00"),
+                frequency=RecurringTransaction.Frequency.MONTHLY,
+                start_date=now.date(),
+                next_run_at=now - timedelta(minutes=minutes),
+                is_active=active,
+            )
+        values = {m.name: m.samples[0].value for m in metrics.BacklogCollector().collect()}
+        # ไม่นับที่ปิดอยู่ / ยังไม่ถึงเวลา
+        self.assertEqual(values["recurring_backlog_due"], 2)
+        self.assertAlmostEqual(values["recurring_backlog_lag_seconds"], 600, delta=30)
+
+        # scrape ถัดไปภายในอายุ cache ไม่ query ซ้ำ
+        with self.assertNumQueries(0):
+            list(metrics.BacklogCollector().collect())
+
+    def test_query_histograms_follow_sampling(self):
+        labels = {"route": "wallets-list"}
+        latency = {"method": "GET", "route": "wallets-list", "status": "2xx"}
+        before = (self.sample("http_request_duration_seconds_count", **latency),
+                  self.sample("http_request_db_queries_count", **labels))
+
+        with override_settings(QUERY_TIMING_SAMPLE_RATE=0):
+            self.get_ok("/api/wallets/")()
+        self.assertEqual(self.sample("http_request_duration_seconds_count", **latency), before[0] + 1)
+        self.assertEqual(self.sample("http_request_db_queries_count", **labels), before[1])
+
+        queries = self.sample("http_request_db_queries_sum", **labels)
+        with override_settings(QUERY_TIMING_SAMPLE_RATE=1.0):
+            res = self.get_ok("/api/wallets/")()
+        self.assertEqual(self.sample("http_request_db_queries_count", **labels), before[1] + 1)
+        # PrometheusMiddleware กับ QueryTimingMiddleware ใช้ stats ชุดเดียว (ไม่นับซ้ำ)
+        counted = self.sample("http_request_db_queries_sum", **labels) - queries
+        self.assertIn(f'desc="{int(counted)} queries"', res["Server-Timing"])
+
+
+class ProfilingTests(FinanceTestCase):
+    def setUp(self):
+        super().setUp()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        patcher = mock.patch.object(RequestProfile._meta.get_field("file"), "storage", FileSystemStorage(location=root.name))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.staff = make_user("staff")
+        self.staff.is_staff = True
+        self.staff.save(update_fields=["is_staff"])
+
+    def profiled(self, token, path="/api/wallets/", **extra):
+        res = self.client.get(path, HTTP_X_PROFILE=token, **extra)
+        self.assertEqual(res.status_code, 200)
+        return res
+
+    def test_token_profiles_once(self):
+        res = self.profiled(profiling.make_profile_token(self.staff, "/api/wallets/"))
+        profile = RequestProfile.objects.get(pk=res["X-Profile-Id"])
+        self.assertEqual((profile.user, profile.requested_by), (self.user, self.staff))
+        self.assertEqual((profile.mode, profile.route, profile.status_code), ("cprofile", "wallets-list", 200))
+        with profile.file.open("rb") as f:
+            self.assertTrue(marshal.loads(f.read()))
+
+        # ใช้ซ้ำไม่ได้
+        self.assertNotIn("X-Profile-Id", self.profiled(res.wsgi_request.META["HTTP_X_PROFILE"]))
+        self.assertEqual(RequestProfile.objects.count(), 1)
+
+    def test_sample_mode_via_query_param(self):
+        token = profiling.make_profile_token(self.staff, "/api/wallets/", mode="sample")
+        res = self.client.get("/api/wallets/", {profiling.PROFILE_QUERY_PARAM: token})
+        self.assertEqual(RequestProfile.objects.get(pk=res["X-Profile-Id"]).mode, "sample")
+
+    def test_invalid_tokens_are_ignored(self):
+        valid = profiling.make_profile_token(self.staff, "/api/wallets/")
+        tokens = [
+            valid[:-2] + "xx",
+            profiling.make_profile_token(self.staff, "/api/categories/"),
+            profiling.make_profile_token(self.user, "/api/wallets/"),  # ไม่ใช่ staff
+        ]
+        for token in tokens:
+            self.assertNotIn("X-Profile-Id", self.profiled(token))
+        with override_settings(REQUEST_PROFILE_TOKEN_MAX_AGE=-1):
+            self.assertNotIn("X-Profile-Id", self.profiled(valid))
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_concurrent_cprofile_served_unprofiled(self):
+        token = profiling.make_profile_token(self.staff, "/api/wallets/")
+        with profiling._cprofile_lock:
+            self.assertNotIn("X-Profile-Id", self.profiled(token))
+        # profiler อื่นนอก middleware (Python 3.12+ enable() ยก ValueError)
+        with mock.patch("config.profiling.cProfile.Profile") as profile_cls:
+            profile_cls.return_value.enable.side_effect = ValueError("Another profiling tool is already active")
+            self.assertNotIn("X-Profile-Id", self.profiled(token))
+        # ยังไม่ถูกใช้ -> ใช้ได้หลังตัวอื่นจบ
+        self.assertIn("X-Profile-Id", self.profiled(token))
+
+
+@override_settings(DATABASE_SHARD_MAP=[(0, "default"), (100, "shard1"), (200, "default")])
+class ShardRoutingTests(SimpleTestCase):
+    def test_shard_map(self):
+        self.assertEqual(sharding.shard_aliases(), ["default", "shard1"])
+        self.assertEqual(sharding.shard_for_owner(1), "default")
+        self.assertEqual(sharding.shard_for_owner(100), "shard1")
+        self.assertEqual(sharding.shard_for_owner(199), "shard1")
+        self.assertEqual(sharding.shard_for_owner(250), "default")
+        self.assertEqual(sharding.owner_ranges("shard1"), [(100, 200)])
+        self.assertEqual(sharding.owner_ranges("default"), [(0, 100), (200, None)])
+
+    def test_router(self):
+        router = db_routers.ShardRouter()
+        self.assertEqual(router.db_for_write(Transaction, instance=Transaction(owner_id=150)), "shard1")
+        self.assertEqual(router.db_for_read(Wallet, instance=User(pk=150)), "shard1")
+        # reference data / user อยู่ที่ default
+        self.assertEqual(router.db_for_read(Currency), "default")
+        self.assertEqual(router.db_for_write(User, instance=User(pk=150)), "default")
+
+        self.assertEqual(router.db_for_read(Transaction), "default")
+        with sharding.for_owner(120):
+            self.assertEqual(router.db_for_read(Transaction), "shard1")
+            self.assertEqual(router.db_for_read(FxRate), "default")
+        self.assertEqual(router.db_for_read(Transaction), "default")
+
+    def test_gather_carries_query_wrappers(self):
+        stats = middleware._QueryStats()
+
+        def installed():
+            return stats in connection.execute_wrappers
+
+        with override_settings(PARALLEL_QUERY_WORKERS=4), middleware._recording(stats):
+            self.assertEqual(sharding.gather(installed, installed), [True, True])
+        self.assertFalse(installed())
+
+    def test_gather_closes_connections_after_each_call(self):
+        events = []
+
+        def work():
+            events.append((threading.get_ident(), "work"))
+
+        def close():
+            events.append((threading.get_ident(), "close"))
+
+        with override_settings(PARALLEL_QUERY_WORKERS=4), mock.patch.object(sharding, "close_old_connections", close):
+            sharding.gather(work, work)
+        # ทุก call: เช็คก่อนเริ่ม แล้วปิด connection ที่หมดอายุ (CONN_MAX_AGE = 0) หลังจบใน thread เดียวกัน
+        for ident in {ident for ident, _ in events}:
+            steps = [step for i, step in events if i == ident]
+            self.assertEqual(steps, ["close", "work", "close"] * (len(steps) // 3))
+        self.assertEqual(len(events), 6)
+
+    def test_fan_out_runs_every_shard(self):
+        self.assertEqual(sharding.fan_out(sharding.current_shard), {"default": "default", "shard1": "shard1"})
+
+    def test_gather_keeps_shard_and_order(self):
+        def where():
+            return sharding.current_shard(), threading.get_ident()
+
+        with override_settings(PARALLEL_QUERY_WORKERS=4), sharding.for_owner(120):
+            results = sharding.gather(where, where, where)
+        self.assertEqual([shard for shard, _ in results], ["shard1"] * 3)
+        self.assertNotIn(threading.get_ident(), {ident for _, ident in results})
+
+        # ค่าเริ่มต้น: ทีละ query ใน thread เดิม
+        self.assertEqual({ident for _, ident in sharding.gather(where, where)}, {threading.get_ident()})
+
+
+class CeleryBeatTests(SimpleTestCase):
+    def test_schedule_points_at_registered_tasks(self):
+        from config import celery_app
+
+        celery_app.loader.import_default_modules()
+        for name, entry in settings.CELERY_BEAT_SCHEDULE.items():
+            self.assertIn(entry["task"], celery_app.tasks, name)
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopUpload
+
+from .models import Receipt
+
+RECEIPT_MAX_SIZE = 5 * 1024 * 1024
+RECEIPT_CONTENT_TYPES = ("image/jpeg", "image/png", "image/webp", "image/gif")
+# ชื่อชนกับ upload อื่นระหว่างจองชื่อกับเปิดไฟล์ -> ขอชื่อใหม่กี่ครั้ง
+OPEN_ATTEMPTS = 5
+
+
+class StoredUploadedFile(UploadedFile):
+    """
+    ไฟล์ที่เขียนลง storage ปลายทางแล้ว (storage_name) พร้อม checksum
+    temporary_file_path() ทำให้ Pillow เปิดจาก path ตรง ๆ ไม่ต้องอ่านเข้า memory
+    """
+
+    def __init__(self, file, name, content_type, size, charset, storage_name, checksum):
+        super().__init__(file, name, content_type, size, charset)
+        self.storage_name = storage_name
+        self.checksum = checksum
+
+    def temporary_file_path(self):
+        return self.file.name
+
+    def discard(self):
+        self.close()
+        default_storage.delete(self.storage_name)
+
+
+class ReceiptUploadHandler(FileUploadHandler):
+    """
+    upload handler สำหรับใบเสร็จ
+    - เช็ค content type ตอนเริ่มไฟล์ และขนาดระหว่างที่ byte เข้ามา (เกิน -> ตัดทันที)
+    - คำนวณ sha256 ทีละ chunk
+    - storage บน filesystem: เขียนลง MEDIA_ROOT ที่ตำแหน่งสุดท้ายเลย ไม่ผ่าน memory/temp file
+      storage อื่น (S3 ฯลฯ): เขียน temp file แล้ว default_storage.save() ตอนจบไฟล์
+    ถ้าไม่ผ่าน จะเก็บ error ไว้ที่ self.error ให้ view ตอบกลับ
+    """
+
+    field_name_allowed = "file"
+
+    def __init__(self, request=None, max_size=RECEIPT_MAX_SIZE):
+        super().__init__(request)
+        self.max_size = max_size
+        self.error = None
+        self.started = False
+        self.storage_name = None
+        self.path = None
+        self.local = False
+
+    def new_file(self, field_name, file_name, content_type, content_length, charset=None, content_type_extra=None):
+        if field_name != self.field_name_allowed or self.started:
+            raise SkipFile()
+
+        super().new_file(field_name, file_name, content_type, content_length, charset, content_type_extra)
+
+        if content_type not in RECEIPT_CONTENT_TYPES:
+            self._abort(415, f"Unsupported file type: {content_type}")
+
+        self.started = True
+        name = Receipt._meta.get_field("file").generate_filename(None, file_name)
+        self.local = isinstance(default_storage, FileSystemStorage)
+        if self.local:
+            self.storage_name, self.path, self.file = self._open_unique(name)
+        else:
+            self.storage_name = name  # ชื่อจริงได้ตอน save()
+            self.file = tempfile.NamedTemporaryFile(suffix=os.path.splitext(name)[1], dir=settings.FILE_UPLOAD_TEMP_DIR)
+            self.path = self.file.name
+        self.hasher = hashlib.sha256()
+        self.size = 0
+
+    @staticmethod
+    def _open_unique(name):
+        for _ in range(OPEN_ATTEMPTS):
+            name = default_storage.get_available_name(name)
+            path = default_storage.path(name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            try:
+                return name, path, open(path, "xb")
+            except FileExistsError:
+                # upload อื่นได้ชื่อนี้ไปก่อน (ระหว่าง get_available_name กับ open) -> ขอชื่อใหม่
+                continue
+        raise FileExistsError(name)
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > self.max_size:
+            self._abort(413, f"File too large. Max {self.max_size // (1024 * 1024)}MB.")
+
+        self.hasher.update(raw_data)
+        self.file.write(raw_data)
+        return None
+
+    def file_complete(self, file_size):
+        if self.local:
+            self.file.close()
+            if settings.FILE_UPLOAD_PERMISSIONS is not None:
+                os.chmod(self.path, settings.FILE_UPLOAD_PERMISSIONS)
+            file = open(self.path, "rb")
+        else:
+            self.file.flush()
+            self.file.seek(0)
+            self.storage_name = default_storage.save(self.storage_name, File(self.file))
+            self.file.seek(0)
+            # temp file (ลบเองตอน close) ให้ Pillow เปิดตรวจต่อ
+            file = self.file
+
+        return StoredUploadedFile(
+            file=file,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=self.size,
+            charset=self.charset,
+            storage_name=self.storage_name,
+            checksum=self.hasher.hexdigest(),
+        )
+
+    def upload_interrupted(self):
+        self._discard()
+
+    def _discard(self):
+        if self.path:
+            self.file.close()
+            if self.local and os.path.exists(self.path):
+                os.remove(self.path)
+            self.path = None
+            self.storage_name = None
+
+    def _abort(self, status_code: int, detail: str):
+        self._discard()
+        self.error = (status_code, detail)
+        # ไม่อ่าน body ที่เหลือ (connection ถูกปิด) เพื่อไม่เปลือง bandwidth/worker
+        raise StopUpload(connection_reset=True)
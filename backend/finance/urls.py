@@ -3,6 +3,8 @@ from .views import CurrencyViewSet, WalletViewSet
 from .views_transactions import FxRateViewSet, CategoryViewSet, TransactionViewSet
 from .views_budgets import BudgetViewSet
 from .views_recurring import RecurringTransactionViewSet
+from .views_merchants import MerchantViewSet, MerchantAliasViewSet
+from .views_rules import CategoryRuleViewSet
 
 
 router = DefaultRouter()
@@ -11,11 +13,15 @@ router.register("wallets", WalletViewSet, basename="wallets")
 
 router.register("fx-rates", FxRateViewSet, basename="fx-rates")
 router.register("categories", CategoryViewSet, basename="categories")
+router.register("category-rules", CategoryRuleViewSet, basename="category-rules")
 router.register("transactions", TransactionViewSet, basename="transactions")
 
 router.register("budgets", BudgetViewSet, basename="budgets")
 
 router.register("recurrings", RecurringTransactionViewSet, basename="recurrings")
 
+router.register("merchants", MerchantViewSet, basename="merchants")
+router.register("merchant-aliases", MerchantAliasViewSet, basename="merchant-aliases")
+
 
 urlpatterns = router.urls
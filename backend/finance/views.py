@@ -2,17 +2,22 @@ from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated
 from django.db.models import Count, Q
 
+from config.db_routers import ReplicaReadMixin
+
 from .models import Currency, Wallet
 from .serializers import CurrencySerializer, WalletSerializer
+from .services_etag import conditional_get
 
 
-class CurrencyViewSet(viewsets.ReadOnlyModelViewSet):
+class CurrencyViewSet(ReplicaReadMixin, viewsets.ReadOnlyModelViewSet):
+    replica_actions = ("list",)
     queryset = Currency.objects.all().order_by("code")
     serializer_class = CurrencySerializer
     permission_classes = [IsAuthenticated]
 
 
-class WalletViewSet(viewsets.ModelViewSet):
+class WalletViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    replica_actions = ("list",)
     serializer_class = WalletSerializer
     permission_classes = [IsAuthenticated]
 
@@ -27,5 +32,9 @@ class WalletViewSet(viewsets.ModelViewSet):
             .order_by("-is_active", "name")
         )
 
+    @conditional_get
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
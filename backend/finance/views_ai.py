@@ -8,6 +8,7 @@ from django.conf import settings
 
 from .models import AiInsight
 from .services_ai import generate_monthly_summary
+from .services_rebase import ensure_not_rebasing
 
 
 class AiMonthlySummaryView(APIView):
@@ -45,6 +46,7 @@ class AiMonthlySummaryView(APIView):
         if not month or len(month) != 7 or month[4] != "-":
             return Response({"detail": "month must be YYYY-MM"}, status=400)
 
+        ensure_not_rebasing(request.user)
         insight = generate_monthly_summary(request.user, month, language=language)
         return Response({
             "month": insight.month,
@@ -83,5 +85,7 @@ class AiMonthlySummaryView(APIView):
             "language": q.language,
             "content": q.content,
             "meta": q.meta,
+            # ยอดของเดือนเปลี่ยนหลังสรุป -> POST ใหม่
+            "stale": q.stale,
             "created_at": q.created_at.isoformat(),
         })
@@ -1,5 +1,5 @@
 from decimal import Decimal
-from django.db.models import Sum
+from django.db.models import Q, Sum
 from django.utils import timezone
 from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated
@@ -9,10 +9,15 @@ from rest_framework.response import Response
 from rest_framework import status
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
+from config.db_routers import ReplicaReadMixin
+
 from .models import Budget, Transaction, Category
 from .serializers import BudgetSerializer
+from .services_etag import conditional_get
+from .services_rebase import ensure_not_rebasing
 
-class BudgetViewSet(viewsets.ModelViewSet):
+class BudgetViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    replica_actions = ("list", "status")
     serializer_class = BudgetSerializer
     permission_classes = [IsAuthenticated]
     serializer_class = BudgetSerializer
@@ -40,7 +45,9 @@ class BudgetViewSet(viewsets.ModelViewSet):
     )
 
     @action(detail=False, methods=["get"], url_path="status")
+    @conditional_get
     def status(self, request):
+        ensure_not_rebasing(request.user)
         month = request.query_params.get("month")
         if not month or len(month) != 7 or month[4] != "-":
             return Response({"detail": "month must be YYYY-MM"}, status=400)
@@ -64,16 +71,23 @@ class BudgetViewSet(viewsets.ModelViewSet):
             occurred_at__lt=end,
         )
 
-        budgets = Budget.objects.filter(owner=user, month=month).select_related("category")
+        budgets = list(Budget.objects.filter(owner=user, month=month).select_related("category"))
+
+        # ✅ aggregate ครั้งเดียวสำหรับทุก budget (ไม่ query ต่อ budget)
+        sums = {"total": Sum("base_amount")}
+        for cid in {b.category_id for b in budgets if b.scope != "total"}:
+            # หมวดถูกลบ (category = NULL) -> นับรายจ่ายที่ไม่มีหมวด (เหมือน filter(category_id=None) เดิม)
+            sums[f"c{cid}"] = Sum("base_amount", filter=Q(category_id=cid) if cid else Q(category_id__isnull=True))
+        spent_map = tx_qs.aggregate(**sums) if budgets else {}
 
         items = []
         for b in budgets:
             if b.scope == "total":
-                spent = tx_qs.aggregate(s=Sum("base_amount"))["s"] or Decimal("0")
+                spent = spent_map.get("total") or Decimal("0")
                 title = "Total Budget"
                 category_id = None
             else:
-                spent = tx_qs.filter(category_id=b.category_id).aggregate(s=Sum("base_amount"))["s"] or Decimal("0")
+                spent = spent_map.get(f"c{b.category_id}") or Decimal("0")
                 title = f"Category: {b.category.name if b.category else 'Uncategorized'}"
                 category_id = b.category_id
 
@@ -0,0 +1,82 @@
+from django.db import router
+from django.db import transaction as db_transaction
+from rest_framework import viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+
+from config.db_routers import ReplicaReadMixin
+
+from .models import Merchant, MerchantAlias, Transaction
+from .serializers_merchants import MerchantSerializer, MerchantAliasSerializer
+from .services_merchants import get_merchant_index, invalidate_merchant_index
+from .services_sync import bump, touch
+
+
+class MerchantViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    replica_actions = ("list",)
+    serializer_class = MerchantSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Merchant.objects.filter(owner=self.request.user).order_by("name")
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+        invalidate_merchant_index(self.request.user.id)
+
+    def perform_update(self, serializer):
+        with db_transaction.atomic(using=router.db_for_write(Merchant)):
+            serializer.save()
+            # ชื่อร้านอยู่ใน report top-merchants
+            bump(self.request.user.id)
+        invalidate_merchant_index(self.request.user.id)
+
+    def perform_destroy(self, instance):
+        with db_transaction.atomic(using=router.db_for_write(Merchant)):
+            # transaction ที่ merchant_ref ถูก SET_NULL ต้อง sync ใหม่
+            touch(Transaction.objects.filter(merchant_ref=instance), [instance.owner_id])
+            instance.delete()
+        invalidate_merchant_index(self.request.user.id)
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("q", str, required=True, description="prefix ของชื่อร้าน"),
+            OpenApiParameter("limit", int, required=False, description="default 10"),
+        ],
+        responses={200: MerchantSerializer(many=True)},
+    )
+    @action(detail=False, methods=["get"], url_path="autocomplete", pagination_class=None)
+    def autocomplete(self, request):
+        """
+        เดาชื่อร้านจาก prefix (ใช้ index ใน memory ไม่ query DB ถ้า cache ยังอยู่)
+        """
+        q = request.query_params.get("q", "")
+        try:
+            limit = min(max(int(request.query_params.get("limit", 10)), 1), 50)
+        except ValueError:
+            return Response({"detail": "limit must be an integer"}, status=400)
+
+        hits = get_merchant_index(request.user.id, with_usage=True).autocomplete(q, limit=limit)
+        return Response(MerchantSerializer(hits, many=True).data)
+
+
+class MerchantAliasViewSet(viewsets.ModelViewSet):
+    serializer_class = MerchantAliasSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return MerchantAlias.objects.filter(owner=self.request.user).select_related("merchant").order_by("pattern")
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+        invalidate_merchant_index(self.request.user.id)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        invalidate_merchant_index(self.request.user.id)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        invalidate_merchant_index(self.request.user.id)
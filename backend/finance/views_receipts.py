@@ -1,13 +1,22 @@
 from rest_framework.views import APIView
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework import status
 
 from drf_spectacular.utils import extend_schema, inline_serializer
 from rest_framework import serializers
+from django.core import signing
+from django.http import Http404
+from django.shortcuts import get_object_or_404
 
+from .models import Receipt
 from .serializers_receipts import ReceiptUploadSerializer
+from .services_media import serve_media, signed_media_max_age, unsign_media_name
+from .upload_handlers import ReceiptUploadHandler, RECEIPT_MAX_SIZE
+
+# เผื่อ boundary/header ของ multipart
+MULTIPART_OVERHEAD = 64 * 1024
 
 
 class ReceiptUploadView(APIView):
@@ -35,12 +44,65 @@ class ReceiptUploadView(APIView):
         },
     )
     def post(self, request):
+        # ✅ ตัดตั้งแต่ header ถ้า client บอกขนาดมาแล้วเกิน (ยังไม่อ่าน body เลย)
+        try:
+            content_length = int(request.META.get("CONTENT_LENGTH") or 0)
+        except ValueError:
+            content_length = 0
+        if content_length > RECEIPT_MAX_SIZE + MULTIPART_OVERHEAD:
+            return Response(
+                {"detail": "File too large. Max 5MB."},
+                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            )
+
+        # ✅ stream ลง storage ตรง ๆ (ต้องตั้งก่อนแตะ request.data)
+        handler = ReceiptUploadHandler(request._request)
+        request._request.upload_handlers = [handler]
+        data = request.data
+        if handler.error:
+            code, detail = handler.error
+            return Response({"detail": detail}, status=code)
+
         # ✅ validate + create ผ่าน serializer
-        ser = ReceiptUploadSerializer(data=request.data, context={"request": request})
-        ser.is_valid(raise_exception=True)
+        ser = ReceiptUploadSerializer(data=data, context={"request": request})
+        if not ser.is_valid():
+            f = request.FILES.get("file")
+            if hasattr(f, "discard"):
+                f.discard()
+            return Response(ser.errors, status=status.HTTP_400_BAD_REQUEST)
 
         receipt = ser.save(owner=request.user)
 
         # ✅ serialize กลับ (มี file_url absolute)
         out = ReceiptUploadSerializer(receipt, context={"request": request})
         return Response(out.data, status=status.HTTP_201_CREATED)
+
+
+class ReceiptDownloadView(APIView):
+    """
+    ดาวน์โหลดใบเสร็จของตัวเอง (เช็ค owner ครั้งเดียว แล้วให้ proxy ส่งไฟล์ต่อ)
+    """
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(tags=["receipts"], responses={200: bytes})
+    def get(self, request, pk):
+        receipt = get_object_or_404(Receipt, pk=pk, owner=request.user)
+        return serve_media(request, receipt.file.name)
+
+
+class SignedMediaView(APIView):
+    """
+    เสิร์ฟไฟล์จาก signed URL (ไม่ต้อง login, ไม่แตะ DB)
+    """
+    permission_classes = [AllowAny]
+    authentication_classes = []
+
+    @extend_schema(tags=["receipts"], responses={200: bytes})
+    def get(self, request, token):
+        try:
+            name = unsign_media_name(token, max_age=signed_media_max_age())
+        except signing.SignatureExpired:
+            return Response({"detail": "Link expired"}, status=status.HTTP_410_GONE)
+        except signing.BadSignature:
+            raise Http404("File not found")
+        return serve_media(request, name)
@@ -1,9 +1,12 @@
 from rest_framework import viewsets
 from rest_framework.permissions import IsAuthenticated
+
+from config.db_routers import ReplicaReadMixin
 from .models import RecurringTransaction
 from .serializers_recurring import RecurringTransactionSerializer
 
-class RecurringTransactionViewSet(viewsets.ModelViewSet):
+class RecurringTransactionViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    replica_actions = ("list",)
     serializer_class = RecurringTransactionSerializer
     permission_classes = [IsAuthenticated]
 
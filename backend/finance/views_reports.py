@@ -1,16 +1,22 @@
-from datetime import datetime
 from decimal import Decimal
+from django.utils import timezone
 from django.utils.dateparse import parse_date
-from django.db.models import Sum, Q
-from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
+from django.db.models import Max, Sum, Q
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth, Coalesce
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from drf_spectacular.utils import extend_schema, OpenApiParameter
 
-from .models import Wallet, Transaction, Currency
-from .serializers import WalletSerializer, _get_fx_rate
+from config import sharding
+from config.db_routers import ReplicaReadMixin
+
+from .models import Wallet, Transaction
+from .partitioning import day_bounds
+from .serializers import WalletSerializer, _get_fx_rates, _get_currency
+from .services_etag import conditional_get
+from .services_rebase import ensure_not_rebasing
 
 
 def _parse_range(request):
@@ -47,7 +53,7 @@ def _parse_range(request):
     return f, t, None
 
 
-class ReportSummaryView(APIView):
+class ReportSummaryView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     @extend_schema(
@@ -58,20 +64,28 @@ class ReportSummaryView(APIView):
         ],
         responses={200: dict},
     )
+    @conditional_get
     def get(self, request):
+        ensure_not_rebasing(request.user)
         f, t, err = _parse_range(request)
         if err:
             return err
+        start, end = day_bounds(f, t)
 
         qs = Transaction.objects.filter(
             owner=request.user,
             is_deleted=False,
-            occurred_at__date__gte=f,
-            occurred_at__date__lte=t,
+            occurred_at__gte=start,
+            occurred_at__lt=end,
         )
 
-        income = qs.filter(type="income").aggregate(s=Sum("base_amount"))["s"] or 0
-        expense = qs.filter(type="expense").aggregate(s=Sum("base_amount"))["s"] or 0
+        # รายรับ + รายจ่ายใน query เดียว
+        totals = qs.aggregate(
+            income=Sum("base_amount", filter=Q(type="income")),
+            expense=Sum("base_amount", filter=Q(type="expense")),
+        )
+        income = totals["income"] or 0
+        expense = totals["expense"] or 0
         net = income - expense
 
         return Response(
@@ -86,7 +100,7 @@ class ReportSummaryView(APIView):
         )
 
 
-class ReportByCategoryView(APIView):
+class ReportByCategoryView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     @extend_schema(
@@ -103,10 +117,13 @@ class ReportByCategoryView(APIView):
         ],
         responses={200: list},
     )
+    @conditional_get
     def get(self, request):
+        ensure_not_rebasing(request.user)
         f, t, err = _parse_range(request)
         if err:
             return err
+        start, end = day_bounds(f, t)
 
         tx_type = request.query_params.get("type", "expense")
         if tx_type not in ("expense", "income"):
@@ -117,8 +134,8 @@ class ReportByCategoryView(APIView):
                 owner=request.user,
                 is_deleted=False,
                 type=tx_type,
-                occurred_at__date__gte=f,
-                occurred_at__date__lte=t,
+                occurred_at__gte=start,
+                occurred_at__lt=end,
             )
             .values("category__id", "category__name")
             .annotate(total=Sum("base_amount"))
@@ -147,7 +164,7 @@ class ReportByCategoryView(APIView):
         )
 
 
-class ReportTrendView(APIView):
+class ReportTrendView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     @extend_schema(
@@ -164,10 +181,13 @@ class ReportTrendView(APIView):
         ],
         responses={200: dict},
     )
+    @conditional_get
     def get(self, request):
+        ensure_not_rebasing(request.user)
         f, t, err = _parse_range(request)
         if err:
             return err
+        start, end = day_bounds(f, t)
 
         interval = request.query_params.get("interval", "daily")
         if interval not in ("daily", "weekly", "monthly"):
@@ -184,8 +204,8 @@ class ReportTrendView(APIView):
         qs = Transaction.objects.filter(
             owner=request.user,
             is_deleted=False,
-            occurred_at__date__gte=f,
-            occurred_at__date__lte=t,
+            occurred_at__gte=start,
+            occurred_at__lt=end,
         )
 
         rows = (
@@ -224,7 +244,7 @@ class ReportTrendView(APIView):
         )
 
 
-class ReportTopMerchantsView(APIView):
+class ReportTopMerchantsView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     @extend_schema(
@@ -242,10 +262,13 @@ class ReportTopMerchantsView(APIView):
         ],
         responses={200: dict},
     )
+    @conditional_get
     def get(self, request):
+        ensure_not_rebasing(request.user)
         f, t, err = _parse_range(request)
         if err:
             return err
+        start, end = day_bounds(f, t)
 
         tx_type = request.query_params.get("type", "expense")
         if tx_type not in ("expense", "income"):
@@ -258,17 +281,18 @@ class ReportTopMerchantsView(APIView):
                 owner=request.user,
                 is_deleted=False,
                 type=tx_type,
-                occurred_at__date__gte=f,
-                occurred_at__date__lte=t,
+                occurred_at__gte=start,
+                occurred_at__lt=end,
             )
             .exclude(merchant="")
-            .values("merchant")
+            # group ตาม merchant ที่ normalize แล้ว (แถวที่ยังไม่ backfill ใช้ชื่อดิบ)
+            .values(merchant_name=Coalesce("merchant_ref__name", "merchant"))
             .annotate(total=Sum("base_amount"))
             .order_by("-total")[:limit]
         )
 
         items = [
-            {"merchant": row["merchant"], "total": str(row["total"] or 0)} for row in qs
+            {"merchant": row["merchant_name"], "total": str(row["total"] or 0)} for row in qs
         ]
 
         return Response(
@@ -283,7 +307,7 @@ class ReportTopMerchantsView(APIView):
         )
 
 
-class ReportWalletBalancesView(APIView):
+class ReportWalletBalancesView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     @extend_schema(
@@ -295,7 +319,9 @@ class ReportWalletBalancesView(APIView):
         ],
         responses={200: dict},
     )
+    @conditional_get
     def get(self, request):
+        ensure_not_rebasing(request.user)
         as_of_s = request.query_params.get("as_of")
         as_of = parse_date(as_of_s) if as_of_s else None
         if as_of_s and not as_of:
@@ -304,38 +330,50 @@ class ReportWalletBalancesView(APIView):
             )
 
         user = request.user
-        base_currency = Currency.objects.get(code=user.profile.base_currency)
-
-        wallets = (
-            Wallet.objects.filter(owner=user, is_active=True)
-            .select_related("currency")
-            .order_by("name")
+        base_currency = _get_currency(user.profile.base_currency)
+
+        qs = Transaction.objects.filter(owner=user, is_deleted=False)
+        if as_of:
+            qs = qs.filter(occurred_at__lt=day_bounds(as_of, as_of)[1])
+
+        # ✅ รวมยอดทุก wallet ใน query เดียว (group by wallet) แทน 4 aggregate ต่อ wallet
+        # ไม่ขึ้นกับรายการ wallet (wallet ที่ปิดแล้วแค่ไม่ถูกใช้) -> รันพร้อมกับ query wallet
+        wallets, grouped = sharding.gather(
+            lambda: list(
+                Wallet.objects.filter(owner=user, is_active=True)
+                .select_related("currency")
+                .order_by("name")
+            ),
+            lambda: list(
+                qs.values("wallet_id").annotate(
+                    income=Sum("amount", filter=Q(type="income")),
+                    expense=Sum("amount", filter=Q(type="expense")),
+                    tin=Sum("amount", filter=Q(type="transfer_in")),
+                    tout=Sum("amount", filter=Q(type="transfer_out")),
+                    last_at=Max("occurred_at"),
+                )
+            ),
         )
+        zero = Decimal("0")
+        totals = {row["wallet_id"]: row for row in grouped}
 
-        items = []
+        # เรทของ wallet สกุลอื่น: "วัน as_of" หรือวันของ tx ล่าสุด (ไม่มี tx เลยและไม่ระบุ as_of -> วันนี้)
+        # วันตาม TIME_ZONE ของระบบ (เหมือนตอนสร้าง transaction / as_of) ไม่ใช่วันของ UTC
+        rate_dates = {}
         for w in wallets:
-            qs = Transaction.objects.filter(
-                owner=user,
-                wallet=w,
-                is_deleted=False,
-            )
-
-            if as_of:
-                qs = qs.filter(occurred_at__date__lte=as_of)
+            if w.currency_id != base_currency.id:
+                last_at = totals.get(w.id, {}).get("last_at")
+                rate_dates[w.id] = as_of or (timezone.localtime(last_at).date() if last_at else timezone.localdate())
+        fx = _get_fx_rates({(d, w.currency) for w in wallets if (d := rate_dates.get(w.id))}, base_currency)
 
+        items = []
+        for w in wallets:
+            row = totals.get(w.id, {})
             # รวมยอดในสกุลเงิน wallet (amount) — ถูกต้องเพราะ currency ตาม wallet
-            income = qs.filter(type="income").aggregate(s=Sum("amount"))[
-                "s"
-            ] or Decimal("0")
-            expense = qs.filter(type="expense").aggregate(s=Sum("amount"))[
-                "s"
-            ] or Decimal("0")
-            tin = qs.filter(type="transfer_in").aggregate(s=Sum("amount"))[
-                "s"
-            ] or Decimal("0")
-            tout = qs.filter(type="transfer_out").aggregate(s=Sum("amount"))[
-                "s"
-            ] or Decimal("0")
+            income = row.get("income") or zero
+            expense = row.get("expense") or zero
+            tin = row.get("tin") or zero
+            tout = row.get("tout") or zero
 
             balance = (w.opening_balance + income + tin - expense - tout).quantize(
                 Decimal("0.01")
@@ -345,24 +383,7 @@ class ReportWalletBalancesView(APIView):
             if w.currency_id == base_currency.id:
                 base_balance = balance
             else:
-                # ใช้เรทของ "วัน as_of" หรือ "วันนี้" ถ้าไม่ระบุ
-                rate_date = (
-                    as_of
-                    if as_of
-                    else (
-                        qs.order_by("-occurred_at").first().occurred_at.date()
-                        if qs.exists()
-                        else None
-                    )
-                )
-                # ถ้าไม่มี tx เลยและไม่ระบุ as_of -> ใช้วันนี้
-                if not rate_date:
-                    from django.utils import timezone
-
-                    rate_date = timezone.now().date()
-
-                fx = _get_fx_rate(rate_date, w.currency, base_currency)
-                base_balance = (balance * fx).quantize(Decimal("0.01"))
+                base_balance = (balance * fx[(rate_dates[w.id], w.currency_id)]).quantize(Decimal("0.01"))
 
             items.append(
                 {
@@ -0,0 +1,55 @@
+import logging
+
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from drf_spectacular.utils import extend_schema
+
+from .models import CategoryRule
+from .serializers_rules import CategoryRuleSerializer
+from .services_categorize import invalidate_category_engine
+
+logger = logging.getLogger(__name__)
+
+
+class CategoryRuleViewSet(viewsets.ModelViewSet):
+    serializer_class = CategoryRuleSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return (
+            CategoryRule.objects.filter(owner=self.request.user)
+            .select_related("category")
+            .order_by("priority", "id")
+        )
+
+    def perform_create(self, serializer):
+        serializer.save(owner=self.request.user)
+        invalidate_category_engine(self.request.user.id)
+
+    def perform_update(self, serializer):
+        serializer.save()
+        invalidate_category_engine(self.request.user.id)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        invalidate_category_engine(self.request.user.id)
+
+    @extend_schema(request=None, responses={202: dict, 503: dict})
+    @action(detail=False, methods=["post"], url_path="apply")
+    def apply(self, request):
+        """
+        จัดหมวดให้ transaction เดิมที่ยังไม่มีหมวด (เฉพาะของ user นี้) ทำใน background ทีละ chunk
+        """
+        from .tasks import categorize_uncategorized_task
+
+        try:
+            categorize_uncategorized_task.delay(request.user.id)
+        except Exception:
+            logger.exception("failed to enqueue categorization for user %s", request.user.id)
+            return Response(
+                {"detail": "Could not start categorization. Try again later."},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        return Response({"detail": "Categorization started"}, status=status.HTTP_202_ACCEPTED)
@@ -0,0 +1,60 @@
+from django.conf import settings
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework import status
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+
+from config.db_routers import ReplicaReadMixin
+
+from .services_realtime import make_stream_token
+from .services_sync import ResyncRequired, changes_since, parse_cursor
+
+
+class SyncView(ReplicaReadMixin, APIView):
+    """
+    delta sync ของ client offline (services_sync.py)
+    ครั้งแรกไม่ส่ง since -> ได้ข้อมูลทั้งหมดทีละ batch เรียกต่อด้วย cursor ที่ได้จนกว่า has_more = false
+    เก็บ cursor ล่าสุดไว้ รอบถัดไปได้เฉพาะแถวที่เปลี่ยน + deleted (แถวที่ถูกลบจริง)
+    transaction ที่ soft delete มาเป็นแถวปกติที่ is_deleted = true
+    """
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(
+        tags=["sync"],
+        parameters=[
+            OpenApiParameter("since", str, required=False, description="cursor จาก response ก่อนหน้า"),
+            OpenApiParameter("limit", int, required=False, description=f"max {settings.SYNC_BATCH_SIZE}"),
+        ],
+        responses={200: dict, 410: dict},
+    )
+    def get(self, request):
+        try:
+            since = parse_cursor(request.query_params.get("since"))
+            limit = int(request.query_params.get("limit") or settings.SYNC_BATCH_SIZE)
+        except ValueError:
+            return Response({"detail": "Invalid since/limit."}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, settings.SYNC_BATCH_SIZE))
+
+        try:
+            return Response(changes_since(request.user.pk, since, limit))
+        except ResyncRequired:
+            return Response(
+                {"detail": "Cursor is too old. Sync again without `since`.", "code": "resync_required"},
+                status=status.HTTP_410_GONE,
+            )
+
+
+class EventTokenView(APIView):
+    """
+    token อายุสั้นสำหรับเปิด GET /api/events/?token=... (EventSource ใส่ header ไม่ได้)
+    ใช้ได้กับ event stream อย่างเดียว ขอใหม่ทุกครั้งก่อนต่อ / reconnect
+    """
+    permission_classes = [IsAuthenticated]
+
+    @extend_schema(tags=["sync"], request=None, responses={200: dict})
+    def post(self, request):
+        return Response({
+            "token": make_stream_token(request.user.pk),
+            "expires_in": settings.REALTIME_STREAM_TOKEN_MAX_AGE,
+        })
@@ -1,3 +1,4 @@
+from django.utils import timezone
 from django.utils.dateparse import parse_date
 from django_filters.rest_framework import DjangoFilterBackend
 
@@ -5,6 +6,9 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from drf_spectacular.utils import extend_schema, OpenApiParameter
+
+from config.db_routers import ReplicaReadMixin
 
 from .models import FxRate, Category, Transaction
 from .serializers import (
@@ -14,13 +18,19 @@ from .serializers import (
     TransferCreateSerializer,
 )
 from .pagination import StandardResultsSetPagination
+from .partitioning import day_bounds
+from .services_archive import restore_transactions
+from .services_etag import conditional_get
+from .services_idempotency import idempotent
+from .services_search import search_transactions
 
 
-class FxRateViewSet(viewsets.ModelViewSet):
+class FxRateViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     """
     ช่วงแรกให้สร้างเองก่อนใน Swagger
     (อนาคตค่อยทำ job ดึงอัตโนมัติ)
     """
+    replica_actions = ("list",)
     queryset = FxRate.objects.all().order_by("-date")
     serializer_class = FxRateSerializer
     permission_classes = [IsAuthenticated]
@@ -28,7 +38,8 @@ class FxRateViewSet(viewsets.ModelViewSet):
     filterset_fields = ["date", "base", "quote"]
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    replica_actions = ("list",)
     serializer_class = CategorySerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
@@ -37,11 +48,16 @@ class CategoryViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Category.objects.filter(owner=self.request.user).order_by("type", "name")
 
+    @conditional_get
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save(owner=self.request.user)
 
 
-class TransactionViewSet(viewsets.ModelViewSet):
+class TransactionViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
+    replica_actions = ("list", "search")
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
 
@@ -50,6 +66,8 @@ class TransactionViewSet(viewsets.ModelViewSet):
     filterset_fields = ["type", "wallet", "category"]
     pagination_class = StandardResultsSetPagination
 
+    TRASH_ACTIONS = ("deleted", "restore")
+
     def get_queryset(self):
         """
         รองรับ query:
@@ -61,8 +79,14 @@ class TransactionViewSet(viewsets.ModelViewSet):
 
         หมายเหตุ: type/wallet/category มีอยู่แล้วผ่าน DjangoFilterBackend
         แต่ from/to ต้อง filter เอง (date range)
+        ถังขยะ (deleted / restore) เห็นเฉพาะแถวที่ soft delete
         """
-        qs = Transaction.objects.filter(owner=self.request.user, is_deleted=False).order_by("-occurred_at")
+        trash = self.action in self.TRASH_ACTIONS
+        qs = (
+            Transaction.objects.filter(owner=self.request.user, is_deleted=trash)
+            .select_related("wallet__currency", "category", "currency")
+            .order_by("-deleted_at" if trash else "-occurred_at")
+        )
 
         f_s = self.request.query_params.get("from")
         t_s = self.request.query_params.get("to")
@@ -71,16 +95,75 @@ class TransactionViewSet(viewsets.ModelViewSet):
             f = parse_date(f_s)
             t = parse_date(t_s)
             if f and t:
-                qs = qs.filter(occurred_at__date__gte=f, occurred_at__date__lte=t)
+                start, end = day_bounds(f, t)
+                qs = qs.filter(occurred_at__gte=start, occurred_at__lt=end)
 
         return qs
 
+    @extend_schema(
+        parameters=[
+            OpenApiParameter("q", str, required=True, description="ค้นหาใน merchant/note"),
+            OpenApiParameter("from", str, required=False, description="YYYY-MM-DD"),
+            OpenApiParameter("to", str, required=False, description="YYYY-MM-DD"),
+        ],
+    )
+    @action(detail=False, methods=["get"], url_path="search")
+    def search(self, request):
+        """
+        ค้นหาตาม merchant/note เรียงตามความเกี่ยวข้อง
+        ใช้ filter เดิมได้ทั้งหมด (from/to/type/wallet/category)
+        """
+        q = request.query_params.get("q", "").strip()
+        if not q:
+            return Response({"detail": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        qs = search_transactions(self.filter_queryset(self.get_queryset()), q)
+
+        page = self.paginate_queryset(qs)
+        ser = self.get_serializer(page, many=True)
+        return self.get_paginated_response(ser.data)
+
+    @idempotent
+    def create(self, request, *args, **kwargs):
+        return super().create(request, *args, **kwargs)
+
     def perform_destroy(self, instance):
-        # soft delete
+        # soft delete (purge จริงหลัง TRANSACTION_PURGE_AFTER_DAYS ดู services_archive.py)
         instance.is_deleted = True
-        instance.save(update_fields=["is_deleted"])
+        instance.deleted_at = timezone.now()
+        instance.save(update_fields=["is_deleted", "deleted_at"])
+
+    @action(detail=False, methods=["get"], url_path="deleted")
+    def deleted(self, request):
+        """
+        ถังขยะ: transaction ที่ลบแล้วแต่ยังไม่ถูก purge (ใหม่สุดก่อน)
+        """
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        ser = self.get_serializer(page, many=True)
+        return self.get_paginated_response(ser.data)
+
+    @action(detail=True, methods=["post"], url_path="restore")
+    def restore(self, request, pk=None):
+        tx = self.get_object()
+        restore_transactions(request.user, [tx.pk])
+        tx.is_deleted, tx.deleted_at = False, None
+        return Response(self.get_serializer(tx).data)
+
+    @extend_schema(request=dict, responses={200: dict})
+    @action(detail=False, methods=["post"], url_path="restore")
+    @idempotent
+    def restore_bulk(self, request):
+        """
+        กู้คืนหลายรายการ: {"ids": [1, 2, ...]} หรือ {"all": true} (ทั้งถังขยะ)
+        """
+        ids = None if request.data.get("all") is True else request.data.get("ids")
+        if ids is not None:
+            if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                return Response({"detail": "ids must be a list of integers"}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"restored": restore_transactions(request.user, ids)})
 
     @action(detail=False, methods=["post"], url_path="transfer")
+    @idempotent
     def transfer(self, request):
         ser = TransferCreateSerializer(data=request.data, context={"request": request})
         ser.is_valid(raise_exception=True)
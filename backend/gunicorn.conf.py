@@ -0,0 +1,21 @@
+import os
+import shutil
+
+# metrics ของทุก worker รวมกันผ่านไฟล์ในโฟลเดอร์นี้
+# ต้องตั้งก่อน import prometheus_client (อ่านค่าตอน import และ worker fork ไปจาก master)
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/expense-tracker-metrics")
+
+from prometheus_client import multiprocess  # noqa: E402
+
+wsgi_app = "config.wsgi:application"
+workers = int(os.getenv("WEB_CONCURRENCY", "4"))
+
+
+def on_starting(server):
+    # ล้างค่าจากรอบก่อน (ไม่งั้น counter จะต่อจากของเก่า)
+    shutil.rmtree(PROMETHEUS_MULTIPROC_DIR, ignore_errors=True)
+    os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+
+
+def child_exit(server, worker):
+    multiprocess.mark_process_dead(worker.pid)
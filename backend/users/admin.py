@@ -1,3 +1,20 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import AccountDeletion
+
+
+@admin.register(AccountDeletion)
+class AccountDeletionAdmin(admin.ModelAdmin):
+    list_display = ("username", "user_id", "status", "percent_done", "requested_at", "finished_at")
+    list_filter = ("status",)
+    search_fields = ("username",)
+    readonly_fields = [f.name for f in AccountDeletion._meta.fields]
+
+    @admin.display(description="done")
+    def percent_done(self, obj):
+        total = sum(p["total"] for p in obj.progress.values())
+        deleted = sum(p["deleted"] for p in obj.progress.values())
+        return f"{deleted * 100 // total}%" if total else "-"
+
+    def has_add_permission(self, request):
+        return False
@@ -0,0 +1,107 @@
+import copy
+import logging
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from config import sharding
+from finance.cache_utils import TTLCache
+
+logger = logging.getLogger(__name__)
+
+USER_CACHE_SIZE = 10000
+# invalidate ข้าม process ด้วย version ใน cache กลาง (settings.CACHES); TTL เป็นแค่ตัวกันพลาด
+# เช่น cache กลางล่มตอน invalidate -> process อื่นเห็นค่าใหม่ภายในเวลานี้
+USER_CACHE_TTL_SECONDS = 30
+
+_user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL_SECONDS, name="user")
+
+
+def _cache_key(user_id):
+    # claim ใน token เป็น str (simplejwt >= 5.4) ส่วนโค้ดอื่นส่ง int -> key เป็น str เสมอ
+    return str(user_id)
+
+
+def _version_key(key):
+    return f"user-cache-version:{key}"
+
+
+def invalidate_user_cache(user_id):
+    key = _cache_key(user_id)
+    _user_cache.pop(key)
+    # เปลี่ยน version ใน cache กลาง -> process อื่นที่ยังถือ entry เก่าจะโหลดใหม่ใน request ถัดไป
+    try:
+        # หมดอายุได้เมื่อ entry ที่เก่ากว่า version นี้หมด TTL ไปหมดแล้ว
+        cache.set(_version_key(key), uuid.uuid4().hex, timeout=USER_CACHE_TTL_SECONDS * 2)
+    except Exception:
+        logger.exception("failed to publish user cache version for %s", key)
+
+
+def _current_version(key):
+    try:
+        return True, cache.get(_version_key(key))
+    except Exception:
+        logger.exception("failed to read user cache version for %s", key)
+        return False, None
+
+
+def get_cached_user(user_id):
+    """
+    user + profile จาก cache (คืน None ถ้าไม่เจอ)
+    entry ใน process ใช้ได้เมื่อ version ตรงกับใน cache กลาง (invalidate จาก process ไหนก็ได้)
+    """
+    key = _cache_key(user_id)
+    ok, version = _current_version(key)
+    entry = _user_cache.get(key) if ok else None
+    if entry is not None and entry[0] == version:
+        return _copy_user(entry[1])
+
+    User = get_user_model()
+    user = User.objects.select_related("profile").filter(pk=user_id).first()
+    if user is None:
+        return None
+    # อ่าน version ก่อนโหลด: invalidate ที่เกิดระหว่างนี้ทำให้ version ไม่ตรง -> request ถัดไปโหลดใหม่
+    # cache กลางใช้ไม่ได้ -> ไม่เก็บ (ตรวจกับ DB ทุก request จนกว่าจะกลับมา)
+    if ok:
+        _user_cache.set(key, (version, user))
+    return _copy_user(user)
+
+
+def _copy_user(cached):
+    # copy ทั้ง user และ profile: request ที่แก้ request.user.profile ต้องไม่ไปแก้ object ใน cache ที่ thread อื่นใช้อยู่
+    user = copy.copy(cached)
+    profile = getattr(cached, "profile", None)
+    if profile is not None:
+        user.profile = copy.copy(profile)
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication ที่ไม่ query User/UserProfile ทุก request
+    - โหลด user + profile (select_related) ครั้งเดียว แล้ว cache ต่อ process (ตรวจ version กับ cache กลางทุก request)
+    - คืน copy ของ user + profile ให้แต่ละ request (กันแก้ object ที่แชร์กัน)
+    save User / UserProfile ผ่าน ORM invalidate ให้เอง (users/signals.py) ส่วน .update() ต้องเรียก invalidate_user_cache()
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        user = get_cached_user(user_id)
+        if user is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        # query ข้อมูลการเงินที่เหลือของ request นี้ไปที่ shard ของ user
+        sharding.activate_owner(user.pk)
+        return user
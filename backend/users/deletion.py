@@ -0,0 +1,209 @@
+"""
+ลบบัญชี user แบบ background ทีละ batch
+- DELETE /api/auth/me/ -> ปิดบัญชีทันที (is_active=False + revoke refresh token) แล้วส่ง delete_account_task
+- ลบข้อมูลการเงินใน shard ของ user ทีละ batch (1 batch = 1 transaction สั้น ๆ ไม่ล็อกแถวจำนวนมากค้างไว้)
+  เรียงลำดับให้ไม่ติด PROTECT (wallet) และไม่ต้อง SET_NULL แถวที่กำลังจะลบทิ้งอยู่แล้ว
+- ลบไฟล์ใบเสร็จ (Transaction.receipt_file, Receipt.file) ออกจาก storage
+- ความคืบหน้าอยู่ใน AccountDeletion.progress (ดูใน admin) รันซ้ำได้ (ลบต่อจากที่ค้าง)
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import DEFAULT_DB_ALIAS
+from django.db import transaction as db_transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from config import sharding
+
+from .authentication import invalidate_user_cache
+from .models import AccountDeletion, TokenFamily
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+def request_account_deletion(user):
+    """
+    ปิดบัญชีทันที แล้วคืน AccountDeletion (ข้อมูลจริงลบใน delete_account_task)
+    """
+    with db_transaction.atomic(using=DEFAULT_DB_ALIAS):
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        TokenFamily.objects.filter(user_id=user.pk, revoked_at__isnull=True).update(revoked_at=timezone.now())
+        deletion = AccountDeletion.objects.create(user_id=user.pk, username=user.username)
+    invalidate_user_cache(user.pk)
+    db_transaction.on_commit(lambda: _enqueue(deletion.pk), using=DEFAULT_DB_ALIAS)
+    return deletion
+
+
+def _enqueue(deletion_id):
+    from .tasks import delete_account_task
+
+    try:
+        delete_account_task.delay(deletion_id)
+    except Exception:
+        # ส่งเข้า queue ไม่ได้ (broker ล่ม) -> resume_account_deletions_task มาเก็บต่อ
+        logger.exception("failed to enqueue account deletion %s", deletion_id)
+
+
+def _finance_steps(user_id):
+    """
+    (ชื่อ, queryset, field ไฟล์ที่ต้องลบจาก storage) ตามลำดับที่ลบ
+    """
+    from finance.models import (
+        AiInsight,
+        Budget,
+        Category,
+        CategoryRule,
+        IdempotencyKey,
+        Merchant,
+        MerchantAlias,
+        Receipt,
+        RecurringTransaction,
+        SyncCounter,
+        SyncTombstone,
+        Transaction,
+        TransferLink,
+        Wallet,
+    )
+
+    owned = {"owner_id": user_id}
+    return [
+        ("transfer_links", TransferLink.objects.filter(Q(out_tx__owner_id=user_id) | Q(in_tx__owner_id=user_id)), None),
+        ("transactions", Transaction.objects.filter(**owned), "receipt_file"),
+        ("recurrings", RecurringTransaction.objects.filter(**owned), None),
+        ("budgets", Budget.objects.filter(**owned), None),
+        ("ai_insights", AiInsight.objects.filter(**owned), None),
+        ("category_rules", CategoryRule.objects.filter(**owned), None),
+        ("merchant_aliases", MerchantAlias.objects.filter(**owned), None),
+        ("idempotency_keys", IdempotencyKey.objects.filter(**owned), None),
+        ("sync_tombstones", SyncTombstone.objects.filter(**owned), None),
+        ("sync_counter", SyncCounter.objects.filter(**owned), None),
+        ("receipts", Receipt.objects.filter(**owned), "file"),
+        ("merchants", Merchant.objects.filter(**owned), None),
+        ("categories", Category.objects.filter(**owned), None),
+        ("wallets", Wallet.objects.filter(**owned), None),
+    ]
+
+
+def _token_steps(user_id):
+    from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+
+    return [
+        ("token_families", TokenFamily.objects.filter(user_id=user_id), None),
+        # BlacklistedToken cascade ตาม OutstandingToken
+        ("outstanding_tokens", OutstandingToken.objects.filter(user_id=user_id), None),
+    ]
+
+
+def _delete_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except Exception:
+            # ไฟล์หาย/ลบไม่ได้ ไม่ควรทำให้การลบบัญชีค้าง
+            logger.warning("failed to delete %s", name, exc_info=True)
+
+
+def _delete_in_batches(alias, qs, file_field, batch_size, on_batch):
+    deleted = 0
+    while True:
+        batch = qs.order_by("pk")[:batch_size]
+        if file_field:
+            rows = list(batch.values_list("pk", file_field))
+            ids = [pk for pk, _ in rows]
+            files = [name for _, name in rows if name]
+        else:
+            ids, files = list(batch.values_list("pk", flat=True)), []
+        if not ids:
+            return deleted
+
+        with db_transaction.atomic(using=alias):
+            qs.model.objects.filter(pk__in=ids).delete()
+        # ลบไฟล์หลัง commit (DB rollback -> ไฟล์ยังอยู่ครบ)
+        _delete_files(files)
+
+        deleted += len(ids)
+        on_batch(deleted)
+
+
+def delete_account(deletion_id, batch_size=None):
+    """
+    ลบข้อมูลทั้งหมดของ user ใน AccountDeletion นี้ แล้วลบ user
+    """
+    batch_size = batch_size or settings.ACCOUNT_DELETION_BATCH_SIZE
+    deletion = AccountDeletion.objects.get(pk=deletion_id)
+    if deletion.status == AccountDeletion.Status.DONE:
+        return deletion
+    user_id = deletion.user_id
+    shard = sharding.shard_for_owner(user_id)
+
+    deletion.status = AccountDeletion.Status.RUNNING
+    deletion.started_at = deletion.started_at or timezone.now()
+    deletion.save(update_fields=["status", "started_at"])
+
+    def save_progress():
+        AccountDeletion.objects.filter(pk=deletion.pk).update(progress=deletion.progress)
+
+    try:
+        # ข้อมูลการเงินอยู่ shard ของ user, token อยู่ default
+        plan = [(shard, step) for step in _finance_steps(user_id)]
+        plan += [(DEFAULT_DB_ALIAS, step) for step in _token_steps(user_id)]
+
+        # นับทั้งหมดก่อน (ใช้แสดง % ความคืบหน้า)
+        for alias, (name, qs, _) in plan:
+            with sharding.use_shard(alias):
+                deletion.progress[name] = {"deleted": 0, "total": qs.count()}
+        save_progress()
+
+        for alias, (name, qs, file_field) in plan:
+            def on_batch(deleted, name=name):
+                deletion.progress[name]["deleted"] = deleted
+                save_progress()
+
+            with sharding.use_shard(alias):
+                _delete_in_batches(alias, qs, file_field, batch_size, on_batch)
+
+        # เหลือแต่ profile / user (ลบ copy ใน shard ผ่าน signal ของ sharding)
+        User.objects.filter(pk=user_id).delete()
+    except Exception as e:
+        deletion.status = AccountDeletion.Status.FAILED
+        deletion.error = repr(e)
+        deletion.save(update_fields=["status", "error", "progress"])
+        raise
+
+    deletion.status = AccountDeletion.Status.DONE
+    deletion.finished_at = timezone.now()
+    deletion.error = ""
+    deletion.save(update_fields=["status", "finished_at", "error", "progress"])
+    logger.info("deleted account %s (%s)", deletion.username, user_id)
+    return deletion
+
+
+def resume_account_deletions(stale_after=timedelta(hours=1)):
+    """
+    งานที่ค้าง: พัง / PENDING หรือ RUNNING นานผิดปกติ (ส่งเข้า queue ไม่สำเร็จ / worker ตาย) -> ลบต่อ
+    คืนจำนวนงานที่ทำสำเร็จ
+    """
+    stale = timezone.now() - stale_after
+    ids = list(
+        AccountDeletion.objects.filter(
+            Q(status=AccountDeletion.Status.FAILED)
+            | Q(status=AccountDeletion.Status.PENDING, requested_at__lt=stale)
+            | Q(status=AccountDeletion.Status.RUNNING, started_at__lt=stale)
+        )
+        .order_by("requested_at")
+        .values_list("pk", flat=True)
+    )
+    done = 0
+    for deletion_id in ids:
+        try:
+            delete_account(deletion_id)
+            done += 1
+        except Exception:
+            logger.exception("account deletion %s failed", deletion_id)
+    return done
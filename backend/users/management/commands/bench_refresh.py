@@ -0,0 +1,89 @@
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.models import TokenFamily
+from users.tokens import issue_refresh_token
+from users.views import RefreshView
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark refresh throughput: blacklist rotation vs token families, "
+        "with N historical token rows. Writes to the configured DB - use a scratch database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--historical", type=int, default=1_000_000)
+        parser.add_argument("--iterations", type=int, default=1000)
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def _seed_history(self, user, n, batch_size):
+        past = timezone.now() - timedelta(days=1)
+        created = 0
+        while created < n:
+            size = min(batch_size, n - created)
+            outstanding = OutstandingToken.objects.bulk_create([
+                OutstandingToken(user=user, jti=uuid.uuid4().hex, token="x", created_at=past, expires_at=past)
+                for _ in range(size)
+            ])
+            BlacklistedToken.objects.bulk_create([BlacklistedToken(token=t) for t in outstanding])
+            TokenFamily.objects.bulk_create([
+                TokenFamily(user=user, current_jti=uuid.uuid4().hex, expires_at=past)
+                for _ in range(size)
+            ])
+            created += size
+            self.stdout.write(f"... seeded {created}/{n}")
+
+    def _bench_blacklist(self, user, iterations):
+        # flow เดิม: verify (query blacklist) + query user + outstand (insert) + blacklist (insert)
+        raw = str(RefreshToken.for_user(user))
+        start = time.perf_counter()
+        for _ in range(iterations):
+            old = RefreshToken(raw)
+            User.objects.filter(id=old["user_id"], is_active=True).first()
+            new = RefreshToken.for_user(user)
+            old.blacklist()
+            raw = str(new)
+        return time.perf_counter() - start
+
+    def _bench_family(self, user, iterations):
+        view = RefreshView.as_view()
+        factory = RequestFactory()
+        raw = str(issue_refresh_token(user))
+        start = time.perf_counter()
+        for _ in range(iterations):
+            req = factory.post("/api/auth/refresh/")
+            req.COOKIES[settings.REFRESH_COOKIE_NAME] = raw
+            res = view(req)
+            if res.status_code != 200:
+                raise RuntimeError(f"refresh failed: {res.data}")
+            raw = res.cookies[settings.REFRESH_COOKIE_NAME].value
+        return time.perf_counter() - start
+
+    def handle(self, *args, **options):
+        n = options["iterations"]
+        user = User.objects.create_user(f"bench-{uuid.uuid4().hex[:8]}", password=uuid.uuid4().hex)
+        try:
+            self._seed_history(user, options["historical"], options["batch_size"])
+
+            for name, fn in (("blacklist", self._bench_blacklist), ("family", self._bench_family)):
+                elapsed = fn(user, n)
+                self.stdout.write(
+                    f"{name:>10}: {n} refreshes in {elapsed:.2f}s "
+                    f"= {n / elapsed:.0f}/s, {elapsed / n * 1000:.2f} ms each"
+                )
+        finally:
+            BlacklistedToken.objects.filter(token__user=user).delete()
+            OutstandingToken.objects.filter(user=user).delete()
+            user.delete()
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from users.tokens import purge_expired_tokens
+
+
+class Command(BaseCommand):
+    help = "Delete expired refresh tokens (families, outstanding, blacklisted) in chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        def progress(name, deleted):
+            self.stdout.write(f"... {name}: {deleted} deleted")
+
+        deleted = purge_expired_tokens(chunk_size=options["chunk_size"], progress=progress)
+        self.stdout.write(self.style.SUCCESS(f"Purged {deleted} expired tokens ✅"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from users.deletion import resume_account_deletions
+
+
+class Command(BaseCommand):
+    help = "Finish account deletions that are pending, failed or stuck (e.g. the broker was down or a worker died)"
+
+    def handle(self, *args, **options):
+        done = resume_account_deletions()
+        self.stdout.write(self.style.SUCCESS(f"Finished {done} account deletions ✅"))
@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-19 10:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_accountdeletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='rebasing',
+            field=models.BooleanField(default=False),
+        ),
+    ]
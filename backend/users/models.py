@@ -1,3 +1,5 @@
+import uuid
+
 from django.conf import settings
 from django.db import models
 
@@ -6,6 +8,58 @@ class UserProfile(models.Model):
     base_currency = models.CharField(max_length=3, default="THB")
     timezone = models.CharField(max_length=64, default="Asia/Bangkok")
     language = models.CharField(max_length=10, default="th")
+    # กำลังคำนวณยอดเป็น base currency ใหม่ (finance.services_rebase) -> report ยังไม่พร้อม
+    rebasing = models.BooleanField(default=False)
 
     def __str__(self):
         return f"{self.user.username} profile"
+
+
+class TokenFamily(models.Model):
+    """
+    refresh token ที่ rotate ต่อกันมาจาก login ครั้งเดียว (1 แถวต่อ session ไม่ใช่ต่อการ refresh)
+    - current_jti: token ตัวเดียวที่ใช้ได้ตอนนี้
+    - previous_jti: token ก่อนหน้า (ยอมให้ tab อื่นยิงซ้ำได้ช่วงสั้น ๆ โดยไม่ revoke)
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="token_families")
+    current_jti = models.CharField(max_length=255)
+    previous_jti = models.CharField(max_length=255, blank=True, default="")
+    rotated_at = models.DateTimeField(null=True, blank=True)
+    expires_at = models.DateTimeField()
+    revoked_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["expires_at"])]
+
+    def __str__(self):
+        return f"{self.user.username} family {self.id}"
+
+
+class AccountDeletion(models.Model):
+    """
+    งานลบบัญชีแบบ background (users/deletion.py)
+    user_id ไม่ใช่ FK: แถวนี้ต้องอยู่ต่อหลัง user ถูกลบ (ไว้ดูผล/ความคืบหน้า)
+    """
+    class Status(models.TextChoices):
+        PENDING = "pending", "Pending"
+        RUNNING = "running", "Running"
+        DONE = "done", "Done"
+        FAILED = "failed", "Failed"
+
+    user_id = models.BigIntegerField(db_index=True)
+    username = models.CharField(max_length=150)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    # {"transactions": {"deleted": 1200, "total": 5000}, ...}
+    progress = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True, default="")
+    requested_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "requested_at"])]
+
+    def __str__(self):
+        return f"delete {self.username} ({self.status})"
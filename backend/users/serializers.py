@@ -1,5 +1,11 @@
 from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.db import transaction as db_transaction
 from rest_framework import serializers
+
+from finance.models import BaseCurrencyRebase, Currency
+from finance.services_rebase import active_rebase, request_rebase
+
 from .models import UserProfile
 
 User = get_user_model()
@@ -22,7 +28,13 @@ class RegisterSerializer(serializers.ModelSerializer):
 class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserProfile
-        fields = ["base_currency", "timezone", "language"]
+        fields = ["base_currency", "timezone", "language", "rebasing"]
+        read_only_fields = ["rebasing"]
+
+    def validate_base_currency(self, value):
+        if not Currency.objects.filter(code=value).exists():
+            raise serializers.ValidationError(f"Unknown currency {value}.")
+        return value
 
 class MeSerializer(serializers.ModelSerializer):
     profile = UserProfileSerializer()
@@ -31,15 +43,30 @@ class MeSerializer(serializers.ModelSerializer):
         model = User
         fields = ["id", "username", "email", "profile"]
 
+    def validate(self, attrs):
+        new_base = attrs.get("profile", {}).get("base_currency")
+        if new_base and new_base != self.instance.profile.base_currency:
+            job = active_rebase(self.instance.pk)
+            if job and job.status != BaseCurrencyRebase.Status.FAILED:
+                raise serializers.ValidationError(
+                    {"profile": {"base_currency": "Previous base currency change is still in progress."}}
+                )
+        return attrs
+
     def update(self, instance, validated_data):
         profile_data = validated_data.pop("profile", {})
-        for k, v in validated_data.items():
-            setattr(instance, k, v)
-        instance.save()
-
-        profile = instance.profile
-        for k, v in profile_data.items():
-            setattr(profile, k, v)
-        profile.save()
+        with db_transaction.atomic(using=DEFAULT_DB_ALIAS):
+            for k, v in validated_data.items():
+                setattr(instance, k, v)
+            instance.save()
+
+            profile = instance.profile
+            new_base = profile_data.pop("base_currency", profile.base_currency)
+            for k, v in profile_data.items():
+                setattr(profile, k, v)
+            if new_base != profile.base_currency:
+                # ยอดเดิมเป็นสกุลเก่าทั้งหมด -> คำนวณใหม่ใน background (finance.services_rebase)
+                request_rebase(profile, new_base)
+            profile.save()
 
         return instance
@@ -1,6 +1,7 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
+from .authentication import invalidate_user_cache
 from .models import UserProfile
 
 User = get_user_model()
@@ -9,3 +10,11 @@ User = get_user_model()
 def create_profile(sender, instance, created, **kwargs):
     if created:
         UserProfile.objects.create(user=instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=UserProfile)
+def invalidate_cached_user(sender, instance, **kwargs):
+    # ปิดบัญชี / แก้ profile จาก admin หรือ task -> ทุก worker เลิกใช้ user ใน cache
+    invalidate_user_cache(instance.pk if sender is User else instance.user_id)
@@ -0,0 +1,15 @@
+from celery import shared_task
+from users.deletion import delete_account, resume_account_deletions
+from users.tokens import purge_expired_tokens
+
+@shared_task
+def purge_expired_tokens_task():
+    return purge_expired_tokens()
+
+@shared_task
+def delete_account_task(deletion_id):
+    return delete_account(deletion_id).progress
+
+@shared_task
+def resume_account_deletions_task():
+    return resume_account_deletions()
@@ -1,3 +1,275 @@
-from django.test import TestCase
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from finance.tests import make_category, make_merchants, make_transactions, make_wallet
+from finance.models import Receipt, Transaction, TransferLink, Wallet
+
+from .authentication import _user_cache, get_cached_user, invalidate_user_cache
+from .deletion import delete_account, resume_account_deletions
+from .models import AccountDeletion, TokenFamily, UserProfile
+from .tokens import issue_refresh_token
+
+User = get_user_model()
+
+PASSWORD = "pass12345"
+
+
+# ---------- factory helpers ----------
+
+def make_user(username="alice"):
+    return User.objects.create_user(username, email=f"{username}@example.com", password=PASSWORD)
+
+
+def make_users(n, prefix="user"):
+    return User.objects.bulk_create(
+        [User(username=f"{prefix}{i}", email=f"{prefix}{i}@example.com") for i in range(n)]
+    )
+
+
+def make_token_families(users, per_user=5):
+    """
+    สร้าง refresh token ย้อนหลัง (ทั้งหมดอายุแล้วและยังใช้ได้) ให้ตารางโตเหมือน production
+    """
+    now = timezone.now()
+    rows = []
+    for user in users:
+        for i in range(per_user):
+            rows.append(TokenFamily(
+                user=user,
+                current_jti=f"{user.pk}-{i}-{now.timestamp()}",
+                expires_at=now + timedelta(days=7 if i % 2 else -7),
+            ))
+    return TokenFamily.objects.bulk_create(rows, batch_size=1000)
+
+
+@override_settings(PASSWORD_HASHERS=["django.contrib.auth.hashers.MD5PasswordHasher"])
+class AuthQueryBudgetTests(APITestCase):
+    """
+    จำนวน SQL ของ auth endpoints ต้องไม่โตตามจำนวน user/token ในระบบ
+    """
+
+    def setUp(self):
+        _user_cache.clear()
+        self.addCleanup(_user_cache.clear)
+        self.user = make_user()
+
+    def grow(self):
+        others = make_users(200)
+        make_token_families(others + [self.user])
+
+    def assertQueryBudget(self, num, func):
+        func()
+        with self.assertNumQueries(num):
+            func()
+
+        self.grow()
+        func()
+        with self.assertNumQueries(num):
+            func()
+
+    def set_refresh_cookie(self, token):
+        self.client.cookies[settings.REFRESH_COOKIE_NAME] = str(token)
+
+    def test_login(self):
+        def call():
+            res = self.client.post("/api/auth/login/", {"username": "alice", "password": PASSWORD}, format="json")
+            self.assertEqual(res.status_code, 200, res.content)
+
+        # user, insert TokenFamily, profile (MeSerializer)
+        self.assertQueryBudget(3, call)
+
+    def test_login_by_email(self):
+        def call():
+            res = self.client.post("/api/auth/login/", {"email": "alice@example.com", "password": PASSWORD}, format="json")
+            self.assertEqual(res.status_code, 200, res.content)
+
+        self.assertQueryBudget(4, call)
+
+    def test_refresh(self):
+        self.set_refresh_cookie(issue_refresh_token(self.user))
+
+        def call():
+            # cookie ใหม่ถูกเก็บใน client ให้ครั้งถัดไปใช้ต่อ
+            res = self.client.post("/api/auth/refresh/")
+            self.assertEqual(res.status_code, 200, res.content)
+
+        # UPDATE token family แถวเดียว (user มาจาก cache)
+        self.assertQueryBudget(1, call)
+
+    def test_logout(self):
+        def call():
+            self.set_refresh_cookie(issue_refresh_token(self.user))
+            res = self.client.post("/api/auth/logout/")
+            self.assertEqual(res.status_code, 200, res.content)
+
+        # insert (เตรียม token) + UPDATE revoke
+        self.assertQueryBudget(2, call)
+
+    def test_me(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+        def call():
+            res = self.client.get("/api/auth/me/")
+            self.assertEqual(res.status_code, 200, res.content)
+
+        # user + profile มาจาก cache ของ authentication
+        self.assertQueryBudget(0, call)
+
+
+class UserCacheTests(APITestCase):
+    def setUp(self):
+        _user_cache.clear()
+        self.addCleanup(_user_cache.clear)
+        self.user = make_user()
+
+    def test_profile_change_visible_after_invalidate(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.assertEqual(self.client.get("/api/auth/me/").json()["profile"]["language"], "th")
+
+        # แก้นอก request (เช่น admin / task) แล้ว invalidate ด้วย id แบบ int (claim ใน token เป็น str)
+        UserProfile.objects.filter(user=self.user).update(language="en")
+        invalidate_user_cache(self.user.pk)
+        self.assertEqual(self.client.get("/api/auth/me/").json()["profile"]["language"], "en")
+
+        res = self.client.patch("/api/auth/me/", {"profile": {"timezone": "UTC"}}, format="json")
+        self.assertEqual(res.status_code, 200, res.content)
+        self.assertEqual(self.client.get("/api/auth/me/").json()["profile"]["timezone"], "UTC")
+
+    def test_invalidate_reaches_other_workers(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.assertEqual(self.client.get("/api/auth/me/").status_code, 200)
+        stale = _user_cache.get(str(self.user.pk))
+
+        # worker อื่นปิดบัญชี: entry ใน process นี้ยังไม่หมด TTL แต่ version ใน cache กลางเปลี่ยนแล้ว
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        invalidate_user_cache(self.user.pk)
+        _user_cache.set(str(self.user.pk), stale)
+        self.assertEqual(self.client.get("/api/auth/me/").status_code, 401)
+
+    def test_save_invalidates(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        self.assertEqual(self.client.get("/api/auth/me/").status_code, 200)
+
+        # เช่นปิดบัญชีจาก admin
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get("/api/auth/me/").status_code, 401)
+
+    def test_int_and_str_ids_share_one_entry(self):
+        get_cached_user(self.user.pk)
+        with self.assertNumQueries(0):
+            get_cached_user(str(self.user.pk))
+
+        invalidate_user_cache(str(self.user.pk))
+        with self.assertNumQueries(1):
+            get_cached_user(self.user.pk)
+
+    def test_cached_profile_not_shared_between_requests(self):
+        first = get_cached_user(self.user.pk)
+        first.profile.language = "xx"
+        second = get_cached_user(str(self.user.pk))
+        self.assertNotEqual(second.profile.language, "xx")
+        self.assertIs(second.profile.user, second)
+
+
+class RefreshRotationTests(APITestCase):
+    def setUp(self):
+        _user_cache.clear()
+        self.addCleanup(_user_cache.clear)
+        self.user = make_user()
+
+    def refresh_with(self, token):
+        self.client.cookies[settings.REFRESH_COOKIE_NAME] = str(token)
+        return self.client.post("/api/auth/refresh/")
+
+    def test_reuse_after_grace_revokes_family(self):
+        old = issue_refresh_token(self.user)
+        self.assertEqual(self.refresh_with(old).status_code, 200)
+
+        TokenFamily.objects.update(rotated_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.refresh_with(old).status_code, 401)
+        self.assertIsNotNone(TokenFamily.objects.get().revoked_at)
+
+    def test_concurrent_reuse_within_grace_keeps_family(self):
+        old = issue_refresh_token(self.user)
+        self.assertEqual(self.refresh_with(old).status_code, 200)
+
+        self.assertEqual(self.refresh_with(old).status_code, 401)
+        self.assertIsNone(TokenFamily.objects.get().revoked_at)
+
+
+class AccountDeletionTests(APITestCase):
+    def setUp(self):
+        _user_cache.clear()
+        self.addCleanup(_user_cache.clear)
+        self.user = make_user()
+
+    def test_delete_me_deactivates_and_enqueues(self):
+        issue_refresh_token(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+
+        with mock.patch("users.tasks.delete_account_task.delay") as delay, \
+                self.captureOnCommitCallbacks(execute=True):
+            res = self.client.delete("/api/auth/me/")
+        self.assertEqual(res.status_code, 202, res.content)
+
+        deletion = AccountDeletion.objects.get()
+        self.assertEqual(res.json()["deletion_id"], deletion.pk)
+        delay.assert_called_once_with(deletion.pk)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.is_active)
+        self.assertFalse(TokenFamily.objects.filter(revoked_at__isnull=True).exists())
+        # access token เดิมใช้ต่อไม่ได้แล้ว
+        self.assertEqual(self.client.get("/api/auth/me/").status_code, 401)
+
+    def test_delete_account_in_batches(self):
+        wallets = [make_wallet(self.user), make_wallet(self.user, name="Bank")]
+        txs = make_transactions(self.user, wallets, [make_category(self.user)], make_merchants(self.user), 7)
+        TransferLink.objects.create(out_tx=txs[0], in_tx=txs[1])
+        other = make_user("bob")
+        make_wallet(other)
+
+        with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media):
+            receipt = Receipt.objects.create(owner=self.user, file=ContentFile(b"img", name="r.jpg"))
+            txs[2].receipt_file = default_storage.save("receipts/tx.jpg", ContentFile(b"img"))
+            txs[2].save(update_fields=["receipt_file"])
+            files = [receipt.file.path, os.path.join(media, txs[2].receipt_file.name)]
+
+            deletion = AccountDeletion.objects.create(user_id=self.user.pk, username=self.user.username)
+            delete_account(deletion.pk, batch_size=3)
+
+            self.assertFalse(any(os.path.exists(f) for f in files))
+
+        deletion.refresh_from_db()
+        self.assertEqual(deletion.status, AccountDeletion.Status.DONE)
+        self.assertEqual(deletion.progress["transactions"], {"deleted": 7, "total": 7})
+        self.assertEqual(deletion.progress["wallets"], {"deleted": 2, "total": 2})
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(Wallet.objects.get().owner_id, other.pk)
+
+    def test_resume_picks_up_failed(self):
+        make_wallet(self.user)
+        deletion = AccountDeletion.objects.create(
+            user_id=self.user.pk, username=self.user.username, status=AccountDeletion.Status.FAILED
+        )
+        # เพิ่งขอลบ (task ยังอยู่ใน queue) -> ยังไม่แตะ
+        other = make_user("bob")
+        fresh = AccountDeletion.objects.create(user_id=other.pk, username=other.username)
+
+        self.assertEqual(resume_account_deletions(), 1)
+        deletion.refresh_from_db()
+        self.assertEqual(deletion.status, AccountDeletion.Status.DONE)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(AccountDeletion.objects.get(pk=fresh.pk).status, AccountDeletion.Status.PENDING)
@@ -0,0 +1,121 @@
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken, Token
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import TokenFamily
+
+FAMILY_CLAIM = "fam"
+# tab อื่นที่ยิง refresh พร้อมกันด้วย token เดิม -> ตอบ 401 เฉย ๆ ไม่ถือว่าโดนขโมย
+REUSE_GRACE = timedelta(seconds=10)
+
+
+class FamilyRefreshToken(RefreshToken):
+    """
+    refresh token ที่เช็ค revoke ผ่าน TokenFamily (lookup ด้วย PK)
+    ไม่สร้าง OutstandingToken / BlacklistedToken ทุกครั้งที่ rotate
+    """
+    no_copy_claims = RefreshToken.no_copy_claims + (FAMILY_CLAIM,)
+
+    def verify(self, *args, **kwargs):
+        # ข้าม BlacklistMixin.verify (query blacklist table) เช็คแค่ลายเซ็น/หมดอายุ/type
+        Token.verify(self, *args, **kwargs)
+
+
+def _new_token(user_id) -> FamilyRefreshToken:
+    token = FamilyRefreshToken()
+    token[api_settings.USER_ID_CLAIM] = user_id
+    return token
+
+
+def issue_refresh_token(user) -> FamilyRefreshToken:
+    """
+    login: เริ่ม family ใหม่
+    """
+    token = _new_token(user.pk)
+    family = TokenFamily.objects.create(
+        user=user,
+        current_jti=token[api_settings.JTI_CLAIM],
+        expires_at=datetime_from_epoch(token["exp"]),
+    )
+    token[FAMILY_CLAIM] = str(family.pk)
+    return token
+
+
+def rotate_refresh_token(old: FamilyRefreshToken):
+    """
+    คืน (user_id, token ใหม่)
+    hot path = UPDATE แถวเดียวด้วย PK (ไม่มี SELECT/INSERT)
+    - ใช้ token เก่าซ้ำหลังพ้น grace -> revoke ทั้ง family (ถือว่าโดนขโมย)
+    raise TokenError ถ้าใช้ไม่ได้
+    """
+    user_id = old.get(api_settings.USER_ID_CLAIM)
+    family_id = old.get(FAMILY_CLAIM)
+    if not user_id or not family_id:
+        raise TokenError("Token has no family")
+
+    old_jti = old[api_settings.JTI_CLAIM]
+    new = _new_token(user_id)
+    new[FAMILY_CLAIM] = family_id
+    now = timezone.now()
+
+    rotated = TokenFamily.objects.filter(
+        pk=family_id,
+        current_jti=old_jti,
+        revoked_at__isnull=True,
+        expires_at__gt=now,
+    ).update(
+        current_jti=new[api_settings.JTI_CLAIM],
+        previous_jti=old_jti,
+        rotated_at=now,
+        expires_at=datetime_from_epoch(new["exp"]),
+    )
+    if rotated:
+        return user_id, new
+
+    # ไม่ผ่าน: revoke แล้ว / หมดอายุ / ถูก rotate ไปแล้ว
+    within_grace = Q(previous_jti=old_jti, rotated_at__gt=now - REUSE_GRACE)
+    TokenFamily.objects.filter(pk=family_id, revoked_at__isnull=True).exclude(within_grace).update(revoked_at=now)
+    raise TokenError("Token is invalid or has been rotated")
+
+
+def revoke_refresh_token(raw: str):
+    """
+    logout: revoke ทั้ง family (token ที่ไม่มี family ใช้ blacklist แบบเดิม)
+    """
+    token = FamilyRefreshToken(raw)
+    family_id = token.get(FAMILY_CLAIM)
+    if family_id:
+        TokenFamily.objects.filter(pk=family_id, revoked_at__isnull=True).update(revoked_at=timezone.now())
+    else:
+        token.blacklist()
+
+
+def purge_expired_tokens(chunk_size=10000, progress=None):
+    """
+    ลบ token ที่หมดอายุแล้วทีละ chunk (lock สั้น ไม่ค้าง table ใหญ่)
+    - TokenFamily ที่หมดอายุ
+    - OutstandingToken (+ BlacklistedToken) ที่หมดอายุ จาก token แบบเก่า
+    """
+    from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+    now = timezone.now()
+    deleted = 0
+
+    for model, extra in ((TokenFamily, None), (OutstandingToken, BlacklistedToken)):
+        while True:
+            ids = list(model.objects.filter(expires_at__lt=now).values_list("pk", flat=True)[:chunk_size])
+            if not ids:
+                break
+            if extra is not None:
+                extra.objects.filter(token_id__in=ids).delete()
+            model.objects.filter(pk__in=ids).delete()
+            deleted += len(ids)
+            if progress:
+                progress(model.__name__, deleted)
+
+    return deleted
@@ -5,10 +5,12 @@ from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.exceptions import TokenError
 
 from .serializers import RegisterSerializer, MeSerializer
+from .authentication import invalidate_user_cache, get_cached_user
+from .deletion import request_account_deletion
+from .tokens import FamilyRefreshToken, FAMILY_CLAIM, issue_refresh_token, rotate_refresh_token, revoke_refresh_token
 
 from drf_spectacular.utils import extend_schema
 from rest_framework import serializers
@@ -82,7 +84,7 @@ class LoginView(APIView):
         if not user:
             return Response({"detail": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
-        refresh = RefreshToken.for_user(user)
+        refresh = issue_refresh_token(user)
         access = str(refresh.access_token)
 
         res = Response(
@@ -103,28 +105,30 @@ class RefreshView(APIView):
             return res
 
         try:
-            old_refresh = RefreshToken(refresh_token)
-            user_id = old_refresh.get("user_id")
-            if not user_id:
-                res = Response({"detail": "Invalid refresh token"}, status=status.HTTP_401_UNAUTHORIZED)
-                clear_refresh_cookie(res)
-                return res
+            old_refresh = FamilyRefreshToken(refresh_token)
 
-            user = User.objects.filter(id=user_id, is_active=True).first()
-            if not user:
+            if old_refresh.get(FAMILY_CLAIM):
+                # ✅ token แบบ family: UPDATE แถวเดียว ไม่แตะ blacklist table
+                user_id, new_refresh = rotate_refresh_token(old_refresh)
+                user = get_cached_user(user_id)
+            else:
+                # token แบบเก่า (ก่อนมี family): เช็ค blacklist ครั้งสุดท้าย แล้วย้ายเข้า family
+                old_refresh.check_blacklist()
+                user_id = old_refresh.get("user_id")
+                user = get_cached_user(user_id) if user_id else None
+                new_refresh = None
+
+            if not user or not user.is_active:
                 res = Response({"detail": "User not found"}, status=status.HTTP_401_UNAUTHORIZED)
                 clear_refresh_cookie(res)
                 return res
 
-            if settings.SIMPLE_JWT.get("ROTATE_REFRESH_TOKENS", False):
-                new_refresh = RefreshToken.for_user(user)
-                if settings.SIMPLE_JWT.get("BLACKLIST_AFTER_ROTATION", False):
-                    try:
-                        old_refresh.blacklist()
-                    except Exception:
-                        pass
-            else:
-                new_refresh = old_refresh
+            if new_refresh is None:
+                new_refresh = issue_refresh_token(user)
+                try:
+                    old_refresh.blacklist()
+                except Exception:
+                    pass
 
             access = str(new_refresh.access_token)
             res = Response({"access": access}, status=status.HTTP_200_OK)
@@ -146,8 +150,7 @@ class LogoutView(APIView):
 
         if refresh_token:
             try:
-                token = RefreshToken(refresh_token)
-                token.blacklist()
+                revoke_refresh_token(refresh_token)
             except Exception:
                 pass
 
@@ -164,4 +167,18 @@ class MeView(APIView):
         ser = MeSerializer(request.user, data=request.data, partial=True)
         ser.is_valid(raise_exception=True)
         ser.save()
+        invalidate_user_cache(request.user.id)
         return Response(ser.data)
+
+    @extend_schema(responses={202: dict}, tags=["auth"])
+    def delete(self, request):
+        """
+        ลบบัญชี: ปิดบัญชี + revoke token ทันที ข้อมูลทั้งหมดลบตามหลังใน background (users/deletion.py)
+        """
+        deletion = request_account_deletion(request.user)
+        res = Response(
+            {"detail": "Account scheduled for deletion", "deletion_id": deletion.pk},
+            status=status.HTTP_202_ACCEPTED,
+        )
+        clear_refresh_cookie(res)
+        return res